@@ -1,17 +1,25 @@
-from flask import Flask, render_template
-import plotly.express as px
-import plotly.graph_objects as go
+from flask import Flask, Response, abort, jsonify, render_template, request
+from datetime import date, datetime
 import os
 
 from app_utilities import (
     get_all_flights_with_average_price,
     get_statistics,
     fetch_last_entries,
-    fetch_avg_price_dbd,
-    fetch_pricing_matrices,
-    fetch_price_development_by_dow)
+    fetch_data_version,
+    get_connection,
+    release_connection,
+    read_pool,
+    PAGE_SIZE)
+from charts import get_chart_json
+from exports import EXPORT_FORMATS, flight_export, gzip_chunks, price_export
+from fare_index import FareIndex
+from fragment_cache import FragmentCache
 
 app = Flask(__name__)
+app.teardown_appcontext(release_connection)
+cache = FragmentCache()
+fare_index = FareIndex()
 
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 DB_PATH = os.path.join(BASE_DIR, "data", "flights.db")
@@ -26,133 +34,196 @@ def report():
 
 @app.route("/")
 def home():
-    statistics_dict = get_statistics()
-    df = fetch_avg_price_dbd()
-    matrix_queries, matrix_flights = fetch_pricing_matrices()
-
-    # --- Line plot ---
-    fig = px.line(
-        df,
-        x="days_before_departure",
-        y="avg_price",
-        markers=True,
-        title="Average Price vs Days Before Departure",
-        labels={
-            "days_before_departure": "Days Before Departure",
-            "avg_price": "Average Price (€)"
-        }
-    )
-    fig.update_xaxes(autorange="reversed")
-    plot_html = fig.to_html(full_html=False)
-
-    # --- Fill missing cells with "N/A" ---
-    matrix_queries_filled = matrix_queries.fillna("N/A")
-    matrix_flights_filled = matrix_flights.fillna("N/A")
-
-    # Labels
-    day_labels = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
-    time_labels = ["23-3", "3-7", "7-11", "11-15", "15-19", "19-23"]
-
-    # --- Heatmaps ---
-    fig_queries = px.imshow(
-        matrix_queries_filled,
-        labels=dict(x="Day of Week", y="Time Slot", color="Avg Price"),
-        text_auto=True
-    )
-    fig_queries.update_xaxes(
-        tickmode='array',
-        tickvals=list(matrix_queries.columns),
-        ticktext=day_labels[:matrix_queries.shape[1]]
-    )
-    fig_queries.update_yaxes(
-        tickmode='array',
-        tickvals=list(matrix_queries.index),
-        ticktext=time_labels[:matrix_queries.shape[0]]
-    )
-
-    fig_departures = px.imshow(
-        matrix_flights_filled,
-        labels=dict(x="Day of Week", y="Time Slot", color="Avg Price"),
-        text_auto=True
-    )
-    fig_departures.update_xaxes(
-        tickmode='array',
-        tickvals=list(matrix_flights.columns),
-        ticktext=day_labels[:matrix_flights.shape[1]]
-    )
-    fig_departures.update_yaxes(
-        tickmode='array',
-        tickvals=list(matrix_flights.index),
-        ticktext=time_labels[:matrix_flights.shape[0]]
-    )
-
-    # --- Convert to HTML ---
-    plot_html_queries = fig_queries.to_html(full_html=False)
-    plot_html_departures = fig_departures.to_html(full_html=False)
+    stat_filters = {
+        "origin": request.args.get("origin", "").strip(),
+        "destination": request.args.get("destination", "").strip(),
+        "date_from": request.args.get("date_from", "").strip(),
+        "date_to": request.args.get("date_to", "").strip(),
+    }
+    statistics_dict = get_statistics(**stat_filters)
 
     return render_template(
         "home.html",
-        plot_html=plot_html,
         stats=statistics_dict,
-        plot_html_queries=plot_html_queries,
-        plot_html_departures=plot_html_departures
+        stat_filters=stat_filters
     )
 
 
 @app.route("/all_flights")
 def all_flights():
-    flights_dict = get_all_flights_with_average_price()
-    return render_template("display_all_flights.html",  flights=flights_dict)
+    filters = {
+        "origin": request.args.get("origin", "").strip(),
+        "destination": request.args.get("destination", "").strip(),
+        "date_from": request.args.get("date_from", "").strip(),
+        "date_to": request.args.get("date_to", "").strip(),
+        "sort": request.args.get("sort", "departure"),
+        "order": request.args.get("order", "asc"),
+    }
+    limit = min(request.args.get("limit", PAGE_SIZE, type=int), 1000)
+
+    try:
+        flights_dict, next_cursor = get_all_flights_with_average_price(
+            origin=filters["origin"],
+            destination=filters["destination"],
+            date_from=filters["date_from"],
+            date_to=filters["date_to"],
+            sort=filters["sort"],
+            descending=filters["order"] == "desc",
+            after=request.args.get("after"),
+            limit=max(limit, 1)
+        )
+    except ValueError as e:
+        abort(400, str(e))
+    return render_template("display_all_flights.html",  flights=flights_dict,
+                           filters=filters, next_cursor=next_cursor)
 
 
 @app.route("/visual")
 def visual():
-    # Fetch your data for days before departure
-    df_price_dev = fetch_price_development_by_dow()  # must have columns: day_of_week, days_before_departure, avg_price
-
-    day_names = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
-
-    # Create the figure
-    fig = go.Figure()
-
-    for dow in range(7):
-        subset = df_price_dev[df_price_dev["day_of_week"] == dow].sort_values("days_before_departure")
-        subset = subset.dropna(subset=["days_before_departure", "avg_price"])  # skip rows with missing data
-        if subset.empty:
-            continue
-
-        fig.add_trace(
-            go.Scatter(
-                x=subset["days_before_departure"],
-                y=subset["avg_price"],
-                mode="lines+markers",
-                name=day_names[dow]
-            )
-        )
-
-    # Layout
-    fig.update_layout(
-        title="Flight Price Development by Departure Weekday",
-        xaxis_title="Days before departure",
-        yaxis_title="Average flight price",
-        legend_title="Departure weekday",
-        template="plotly_white",
-        autosize=True,
-        height=600,
-        margin=dict(l=50, r=50, t=60, b=50)
-    )
-    fig.update_xaxes(autorange="reversed")  # booking horizon
-
-    # Convert to HTML fragment
-    plot_html = fig.to_html(full_html=False)
-
-    # Optional stats for your stat-cards
-    
-    # Render your template
-    return render_template(
-        "visual.html",
-        plot_html=plot_html,  # only this plot
-    )
+    return render_template("visual.html")
+
+
+def chart_response(name):
+    '''
+    Serves a cached chart payload; clients holding the current data
+    version get a 304 without the payload being read
+    '''
+    version, updated = fetch_data_version()
+
+    response = Response(mimetype="application/json")
+    response.set_etag(f"{name}-{version}")
+    if updated:
+        response.last_modified = datetime.fromisoformat(updated).astimezone()
+    response.cache_control.no_cache = True
+    response.make_conditional(request)
+    if response.status_code == 304:
+        return response
+
+    response.set_data(get_chart_json(name, cache, version))
+    return response
+
+
+@app.route("/api/avg_price_dbd")
+def api_avg_price_dbd():
+    return chart_response("avg_price_dbd")
+
+
+@app.route("/api/pricing_matrices")
+def api_pricing_matrices():
+    return chart_response("pricing_matrices")
+
+
+@app.route("/api/price_development")
+def api_price_development():
+    return chart_response("price_development")
+
+
+def export_response(name, export, **filters):
+    '''
+    Streams the rows of an export batch by batch as csv (default) or
+    ndjson, gzip encoded for clients that accept it. Filters and the
+    resume position come from the query string.
+    '''
+    fmt = request.args.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        abort(400, f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    encode, mimetype = EXPORT_FORMATS[fmt]
+
+    for key in ["origin", "destination", "date_from", "date_to", "after"]:
+        filters[key] = request.args.get(key, "").strip()
+    try:
+        columns, batches = export(read_pool(), **filters)
+    except ValueError as e:
+        abort(400, str(e))
+
+    chunks = encode(columns, batches)
+    gzip = bool(request.accept_encodings["gzip"])
+    response = Response(gzip_chunks(chunks) if gzip else chunks,
+                        mimetype=mimetype)
+    response.headers["Content-Disposition"] = \
+        f"attachment; filename={name}.{fmt}"
+    response.vary.add("Accept-Encoding")
+    if gzip:
+        response.content_encoding = "gzip"
+    return response
+
+
+@app.route("/export/flights")
+def export_flights():
+    return export_response("flights", flight_export)
+
+
+@app.route("/export/prices")
+def export_prices():
+    return export_response(
+        "prices", price_export,
+        query_from=request.args.get("query_from", "").strip(),
+        query_to=request.args.get("query_to", "").strip(),
+        after_query_date=request.args.get("after_query_date", "").strip())
+
+
+def date_arg(name, default=None):
+    value = request.args.get(name, "").strip()
+    if not value:
+        return default
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        abort(400, f"{name} must be a date (YYYY-MM-DD)")
+
+
+def airport_arg(name):
+    value = request.args.get(name, "").strip()
+    if not value:
+        abort(400, f"{name} is required")
+    return value
+
+
+@app.route("/api/cheapest_date")
+def api_cheapest_date():
+    '''
+    The cheapest day to fly origin -> destination between date_from
+    (default today) and date_to, null without a known price
+    '''
+    origin, destination = airport_arg("origin"), airport_arg("destination")
+    date_from, date_to = date_arg("date_from", date.today()), \
+        date_arg("date_to")
+    fare_index.refresh(get_connection())
+    return jsonify(fare_index.cheapest_date(origin, destination,
+                                            date_from, date_to))
+
+
+@app.route("/api/cheapest_destinations")
+def api_cheapest_destinations():
+    '''
+    The cheapest day to every destination of origin between date_from
+    (default today) and date_to, cheapest first
+    '''
+    origin = airport_arg("origin")
+    date_from, date_to = date_arg("date_from", date.today()), \
+        date_arg("date_to")
+    limit = request.args.get("limit", type=int)
+    fare_index.refresh(get_connection())
+    return jsonify(fare_index.cheapest_destinations(origin, date_from,
+                                                    date_to, limit))
+
+
+@app.route("/plotly.min.js")
+def plotly_js():
+    '''
+    The plotly bundle of the installed package, loaded once per browser
+    '''
+    import plotly
+    from plotly.offline import get_plotlyjs
+
+    response = Response(mimetype="application/javascript")
+    response.set_etag(f"plotly-{plotly.__version__}")
+    response.cache_control.public = True
+    response.cache_control.max_age = 7 * 24 * 60 * 60
+    response.make_conditional(request)
+    if response.status_code != 304:
+        response.set_data(get_plotlyjs())
+    return response
 
 
 if __name__ == "__main__":
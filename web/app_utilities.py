@@ -1,13 +1,122 @@
 import os
-import sqlite3
-import pandas as pd
+import json
+import base64
+import threading
+from datetime import date
+from flask import g, has_app_context
+
+from db import (DAY_OBSERVATIONS, connect_db, epoch, interval_days, iso,
+                query_columns)
+from read_pool import ReadPool
 
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 DB_PATH = os.path.join(BASE_DIR, "data", "flights.db")
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
+# --- /all_flights paging ---
+PAGE_SIZE = 100
+FLIGHT_SORT_COLUMNS = {
+    "departure": "departure_ts",
+    "flight": "flight_number",
+    "price": "average_price",
+    "queries": "num_price_queries",
+}
+
+# date parameter moved to the start of the following day, the end
+# of an inclusive date filter
+DAY_AFTER = "?, '+1 day'"
+
+# prices rows and price intervals as (flight_id, price, observations),
+# an interval counts once for every query it stands for
+OBSERVED_COUNT = "SUM(CASE WHEN o.price IS NOT NULL THEN o.observations END)"
+OBSERVED_AVG = f"SUM(o.price * o.observations) / {OBSERVED_COUNT}"
+
+_pools = {}
+_pools_lock = threading.Lock()
+_thread = threading.local()
+
+
+def read_pool(db_path=None):
+    '''
+    The ReadPool of a database, DB_PATH by default. A missing database
+    is created with the tracker's schema first, an older one migrated.
+    '''
+    db_path = db_path or DB_PATH
+    with _pools_lock:
+        if db_path not in _pools:
+            connect_db(db_path).close()
+            _pools[db_path] = ReadPool(db_path)
+        return _pools[db_path]
+
 
-def get_statistics():
+def get_connection():
+    '''
+    A read-only connection to DB_PATH. Inside a Flask app context the
+    first call of a request checks one out and release_connection returns
+    it at teardown; other callers (the chart pre-warm of the tracker,
+    benchmarks) keep one per thread.
+    '''
+    pool = read_pool()
+    if has_app_context():
+        if "read_conn" not in g:
+            g.read_conn = (pool, pool.acquire())
+        return g.read_conn[1]
+    conns = _thread.__dict__.setdefault("conns", {})
+    if pool.db_path not in conns:
+        conns[pool.db_path] = pool.acquire()
+    return conns[pool.db_path]
+
+
+def release_connection(exception=None):
+    # teardown_appcontext handler of the web app
+    checkout = g.pop("read_conn", None)
+    if checkout is not None:
+        pool, conn = checkout
+        pool.release(conn)
+
+
+def check_dates(**values):
+    '''
+    The date filters as ISO dates, SQLite reads anything else as NULL and
+    the filter would drop every row. Raises ValueError for a bad date.
+    '''
+    checked = {}
+    for name, value in values.items():
+        try:
+            checked[name] = date.fromisoformat(value).isoformat() \
+                if value else value
+        except ValueError:
+            raise ValueError(f"{name} must be a date (YYYY-MM-DD)") from None
+    return checked
+
+
+def flight_filters(origin=None, destination=None, date_from=None,
+                   date_to=None):
+    '''
+    Returns (conditions, params) selecting flights_compact rows `f` by
+    route and departure window
+    '''
+    filters = []
+    params = []
+    for column, airport in [("origin_id", origin),
+                            ("destination_id", destination)]:
+        if airport:
+            filters.append(f"""f.route_id IN (
+                SELECT r.id FROM routes r
+                JOIN airports a ON a.id = r.{column}
+                WHERE a.iataCode = ?)""")
+            params.append(airport.upper())
+    if date_from:
+        filters.append(f"f.departure_ts >= {epoch('?')}")
+        params.append(date_from)
+    if date_to:
+        filters.append(f"f.departure_ts < {epoch(DAY_AFTER)}")
+        params.append(date_to)
+    return filters, params
+
+
+def get_statistics(origin=None, destination=None, date_from=None,
+                   date_to=None, query_from=None, query_to=None):
     '''
     Extracts:
         - Most expensive flight
@@ -15,149 +124,357 @@ def get_statistics():
         - Total number of flights
         - Total number of prices
         - Average price
+        - Number of destinations
+    optionally limited to a route, a departure window (date_from/date_to)
+    and a query window (query_from/query_to)
     returns a dict
     '''
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = get_connection()
     cursor = conn.cursor()
 
-    # Most expensive flight
-    cursor.execute("SELECT * FROM prices ORDER BY price DESC LIMIT 1")
-    expensive_flight = cursor.fetchone()
-    price_expensive_flight = \
-        expensive_flight["price"] if expensive_flight else 0
+    filters, params = flight_filters(origin, destination, date_from, date_to)
+
+    # an interval overlapping the query window counts with the share of
+    # its observations on the days inside it, spread as the aggregates
+    # spread them (db.interval_days)
+    row_filters = list(filters)
+    interval_filters = list(filters)
+    day_filters = [f"{DAY_OBSERVATIONS} > 0"]
+    query_params = []
+    if query_from:
+        row_filters.append(f"p.query_ts >= {epoch('?')}")
+        interval_filters.append(f"p.valid_to >= {epoch('?')}")
+        day_filters.append("d.query_day >= date(?)")
+        query_params.append(query_from)
+    if query_to:
+        row_filters.append(f"p.query_ts < {epoch(DAY_AFTER)}")
+        interval_filters.append(f"p.valid_from < {epoch(DAY_AFTER)}")
+        day_filters.append("d.query_day <= date(?)")
+        query_params.append(query_to)
+
+    if row_filters:
+        # one pass over the prices of the selected flights,
+        # the route and query time indexes keep it off a full scan
+        params = params + query_params
+        if query_params:
+            days = "RECURSIVE" + interval_days(f"""(
+                SELECT p.* FROM price_intervals p
+                JOIN flights_compact f ON f.id = p.flight_id
+                WHERE {" AND ".join(interval_filters)})""") + ","
+            intervals = f"""
+                SELECT d.flight_id, f.route_id, d.price,
+                       {DAY_OBSERVATIONS} AS observations
+                FROM days d
+                JOIN flights_compact f ON f.id = d.flight_id
+                WHERE {" AND ".join(day_filters)}"""
+            # the days CTE comes first, its days are filtered again
+            all_params = params + params + query_params
+        else:
+            days = ""
+            intervals = f"""
+                SELECT p.flight_id, f.route_id, p.price, p.observations
+                FROM price_intervals p
+                JOIN flights_compact f ON f.id = p.flight_id
+                WHERE {" AND ".join(interval_filters)}"""
+            all_params = params + params
+        cursor.execute(f"""
+            WITH {days} o AS (
+                SELECT p.flight_id, f.route_id, p.price, 1 AS observations
+                FROM prices_compact p
+                JOIN flights_compact f ON f.id = p.flight_id
+                WHERE {" AND ".join(row_filters)}
+                UNION ALL{intervals}
+            )
+            SELECT
+                MIN(o.price) AS cheapest,
+                MAX(o.price) AS expensive,
+                {OBSERVED_COUNT} AS total_prices,
+                {OBSERVED_AVG} AS avg_price,
+                COUNT(DISTINCT o.flight_id) AS total_flights,
+                (SELECT COUNT(DISTINCT destination_id) FROM routes
+                 WHERE id IN (SELECT route_id FROM o)) AS destinations
+            FROM o
+        """, all_params)
+    else:
+        # min/max are single index lookups on the price indexes,
+        # count and sum come from the aggregate buckets
+        cursor.execute("""
+            SELECT
+                (SELECT MIN(price) FROM (
+                    SELECT MIN(price) AS price FROM prices_compact
+                    UNION ALL
+                    SELECT MIN(price) FROM price_intervals
+                 )) AS cheapest,
+                (SELECT MAX(price) FROM (
+                    SELECT MAX(price) AS price FROM prices_compact
+                    UNION ALL
+                    SELECT MAX(price) FROM price_intervals
+                 )) AS expensive,
+                (SELECT SUM(price_count) FROM agg_price_dbd) AS total_prices,
+                (SELECT SUM(price_sum) / SUM(price_count)
+                 FROM agg_price_dbd) AS avg_price,
+                (SELECT COUNT(*) FROM flights_compact) AS total_flights,
+                (SELECT COUNT(DISTINCT destination_id) FROM routes
+                 WHERE id IN (SELECT route_id FROM flights_compact)
+                 ) AS destinations
+        """)
+    row = cursor.fetchone()
+
+    # Combine everything in a dictionary
+    statistics_dict = {
+        "cheapest_flight": row["cheapest"] or 0,
+        "expensive_flight": row["expensive"] or 0,
+        "total_flights": row["total_flights"] or 0,
+        "average_price": round(row["avg_price"], 2)
+        if row["avg_price"] is not None else 0,
+        "total_prices": row["total_prices"] or 0,
+        "destinations": row["destinations"] or 0
+    }
 
-    # Cheapest flight
-    cursor.execute("SELECT * FROM prices ORDER BY price ASC LIMIT 1")
-    cheapest_flight = cursor.fetchone()
-    price_cheapest_flight = cheapest_flight["price"] if cheapest_flight else 0
+    return statistics_dict
 
-    # Total number of flights
-    cursor.execute("SELECT COUNT(*) AS total_flights FROM flights")
-    row = cursor.fetchone()
-    total_flights = row["total_flights"] if row else 0
 
-    # Total number of prices
-    cursor.execute("SELECT COUNT(*) AS total_prices FROM prices")
+def fetch_data_version():
+    '''
+    Returns (version, updated) of the counter db.save_flights bumps
+    whenever prices are added
+    '''
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT version, updated FROM data_version WHERE id = 1")
     row = cursor.fetchone()
-    total_prices = row["total_prices"] if row else 0
+    return (row[0], row[1]) if row else (0, None)
 
-    # Average price of Price
-    cursor.execute("SELECT AVG(price) AS avg_price FROM prices")
-    row = cursor.fetchone()
-    average_price = round(row["avg_price"], 2) \
-        if row and row["avg_price"] is not None else 0
 
-    # Close the connection
-    conn.close()
+def encode_cursor(value, flight_id):
+    raw = json.dumps([value, flight_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
 
-    # Combine everything in a dictionary
-    statistics_dict = {
-        "cheapest_flight": price_cheapest_flight,
-        "expensive_flight": price_expensive_flight,
-        "total_flights": total_flights,
-        "average_price": average_price,
-        "total_prices": total_prices
-    }
 
-    return statistics_dict
+def decode_cursor(cursor_str):
+    '''
+    Returns (value, flight_id) of a page cursor or None if it is invalid
+    '''
+    try:
+        value, flight_id = json.loads(base64.urlsafe_b64decode(cursor_str))
+    except (ValueError, TypeError):
+        return None
+    return value, flight_id
 
 
-def get_all_flights_with_average_price():
+def get_all_flights_with_average_price(origin=None, destination=None,
+                                       date_from=None, date_to=None,
+                                       sort="departure", descending=False,
+                                       after=None, limit=PAGE_SIZE):
     '''
-    Returns a list of all flights with some Information and the average price for all query
+    Returns one page of flights with some Information and the average
+    price over all queries, plus the cursor of the next page (or None).
+    Raises ValueError for an invalid date.
+
+    Pages are keyset paginated on (sort column, id). When sorting by a
+    flights column only the flights of the page are joined with their
+    prices, so the cost does not grow with the table.
     '''
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    sort = sort if sort in FLIGHT_SORT_COLUMNS else "departure"
+    sort_column = FLIGHT_SORT_COLUMNS[sort]
+    direction = "DESC" if descending else "ASC"
+    comparison = "<" if descending else ">"
+
+    dates = check_dates(date_from=date_from, date_to=date_to)
+    filters, params = flight_filters(origin, destination, **dates)
+
+    position = decode_cursor(after) if after else None
+    cursor_params = list(position) if position else []
+
+    def sort_key(prefix):
+        # a flight without a number sorts as an empty one, a NULL would
+        # fail the keyset comparison and drop out of every page
+        column = f"{prefix}{sort_column}"
+        return f"COALESCE({column}, '')" if sort == "flight" else column
+
+    def keyset(prefix):
+        if position is None:
+            return []
+        return [f"({sort_key(prefix)}, {prefix}id) {comparison} (?, ?)"]
+
+    conn = get_connection()
     cursor = conn.cursor()
 
-    # Get all flights
-    cursor.execute("""
-        SELECT id, flight_number, departureAirport_cityName,
-                   arrivalAirport_cityName, departureDate
-        FROM flights
-    """)
-    flights_rows = cursor.fetchall()
+    if sort in ("departure", "flight"):
+        # page the flights first, then aggregate the prices of the page
+        where = " AND ".join(filters + keyset("f.")) or "1"
+        pages = f"""
+            page AS (
+                SELECT f.id, f.route_id, f.flight_number, f.departure_ts
+                FROM flights_compact f
+                WHERE {where}
+                ORDER BY {sort_key("f.")} {direction}, f.id {direction}
+                LIMIT ?
+            ),
+            priced AS (
+                SELECT page.*,
+                       ROUND({OBSERVED_AVG}, 2) AS average_price,
+                       {OBSERVED_COUNT} AS num_price_queries
+                FROM page
+                LEFT JOIN (
+                    SELECT flight_id, price, 1 AS observations
+                    FROM prices_compact
+                    WHERE flight_id IN (SELECT id FROM page)
+                    UNION ALL
+                    SELECT flight_id, price, observations FROM price_intervals
+                    WHERE flight_id IN (SELECT id FROM page)
+                ) o ON o.flight_id = page.id
+                GROUP BY page.id
+            )"""
+    else:
+        # sorting by an aggregate needs the aggregates of every flight
+        where = " AND ".join(filters) or "1"
+        page_where = " AND ".join(keyset("")) or "1"
+        pages = f"""
+            priced AS (
+                SELECT * FROM (
+                    SELECT f.id, f.route_id, f.flight_number, f.departure_ts,
+                           COALESCE(p.average_price, 0) AS average_price,
+                           COALESCE(p.num_price_queries, 0)
+                               AS num_price_queries
+                    FROM flights_compact f
+                    LEFT JOIN (
+                        SELECT o.flight_id,
+                               ROUND({OBSERVED_AVG}, 2) AS average_price,
+                               SUM(o.observations) AS num_price_queries
+                        FROM (
+                            SELECT flight_id, price, 1 AS observations
+                            FROM prices_compact
+                            UNION ALL
+                            SELECT flight_id, price, observations
+                            FROM price_intervals
+                        ) o
+                        GROUP BY o.flight_id
+                    ) p ON p.flight_id = f.id
+                    WHERE {where}
+                )
+                WHERE {page_where}
+                ORDER BY {sort_key("")} {direction}, id {direction}
+                LIMIT ?
+            )"""
+
+    # natural key, city names and ISO date only for the rows of the page
+    cursor.execute(f"""
+        WITH {pages}
+        SELECT priced.*,
+               k.key,
+               src.cityName AS departureAirport_cityName,
+               dst.cityName AS arrivalAirport_cityName,
+               {iso("priced.departure_ts")} AS departureDate
+        FROM priced
+        JOIN flight_keys k ON k.id = priced.id
+        LEFT JOIN routes r ON r.id = priced.route_id
+        LEFT JOIN airports src ON src.id = r.origin_id
+        LEFT JOIN airports dst ON dst.id = r.destination_id
+        ORDER BY {sort_key("priced.")} {direction}, priced.id {direction}
+    """, params + cursor_params + [limit])
 
+    flights_rows = cursor.fetchall()
     # Build nested dictionary
     flights_dict = {}
-
     for flight in flights_rows:
-        flight_id = flight["id"]
-
-        # Get all price queries for this flight using the id
-        cursor.execute("""
-            SELECT ROUND(AVG(price),2) AS avg_price, COUNT(*) AS num_queries
-            FROM prices
-            WHERE flight_id = ?
-            """, (flight_id,))
-        row = cursor.fetchone()
-        average_price = round(row["avg_price"], 2) \
-            if row and row["avg_price"] is not None else 0
-        num_price_queries = row["num_queries"] \
-            if row and row["num_queries"] is not None else 0
-
-        # Build dictionary entry
-        flights_dict[flight_id] = {
+        flights_dict[flight["key"]] = {
             "flight_number": flight["flight_number"],
             "departureAirport_cityName": flight["departureAirport_cityName"],
             "arrivalAirport_cityName": flight["arrivalAirport_cityName"],
             "departureDate": flight["departureDate"],
-            "average_price": average_price,
-            "num_price_queries": num_price_queries
+            "average_price": flight["average_price"] or 0,
+            "num_price_queries": flight["num_price_queries"] or 0
         }
 
-    conn.close()
-    return flights_dict
+    next_cursor = None
+    if len(flights_rows) == limit:
+        last = flights_rows[-1]
+        value = last[sort_column]
+        if sort == "flight" and value is None:
+            value = ""
+        next_cursor = encode_cursor(value, last["id"])
+    return flights_dict, next_cursor
 
 
 def fetch_all_entries():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT * FROM flights "
-                   "ORDER BY departureDate DESC")
-
-    flights_rows = cursor.fetchall()
+    # checked out for this call only, every flight is read at once
+    with read_pool().connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM flights "
+                       "ORDER BY departureDate DESC")
+        flights_rows = cursor.fetchall()
     flights = [dict(row) for row in flights_rows]
     return flights
 
 
 def fetch_last_entries(limit=15):
     """Fetch last `limit` entries from flights and prices separately."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = get_connection()
     cursor = conn.cursor()
 
     # ---- flights ----
-    cursor.execute(f"""
+    # ordered on the indexed timestamps, not the ISO strings of the views
+    cursor.execute("""
         SELECT *
         FROM flights
+        WHERE id IN (
+            SELECT k.key
+            FROM flights_compact f
+            JOIN flight_keys k ON k.id = f.id
+            ORDER BY f.departure_ts DESC
+            LIMIT ?
+        )
         ORDER BY departureDate DESC
-        LIMIT ?
     """, (limit,))
     flights_rows = cursor.fetchall()
     flights = [dict(row) for row in flights_rows]
 
     # ---- prices ----
+    # an interval's last observation is its valid_to
+    days_before, query_dow, query_time_slot = query_columns("p.valid_to")
     cursor.execute(f"""
-        SELECT *
-        FROM prices
-        ORDER BY query_date DESC
+        SELECT
+            k.key AS flight_id,
+            {iso("p.query_ts")} AS query_date,
+            p.price,
+            c.code AS currencyCode,
+            c.symbol AS currencySymbol,
+            p.days_before_departure,
+            p.query_dow,
+            p.query_time_slot
+        FROM (
+            SELECT * FROM (
+                SELECT flight_id, query_ts, price, currency_id,
+                       days_before_departure, query_dow, query_time_slot
+                FROM prices_compact
+                ORDER BY query_ts DESC
+                LIMIT ?
+            )
+            UNION ALL
+            SELECT * FROM (
+                SELECT p.flight_id, p.valid_to, p.price, p.currency_id,
+                       {days_before}, {query_dow}, {query_time_slot}
+                FROM price_intervals p
+                JOIN flights_compact f ON f.id = p.flight_id
+                ORDER BY p.valid_to DESC
+                LIMIT ?
+            )
+        ) p
+        JOIN flight_keys k ON k.id = p.flight_id
+        LEFT JOIN currencies c ON c.id = p.currency_id
+        ORDER BY p.query_ts DESC
         LIMIT ?
-    """, (limit,))
+    """, (limit, limit, limit))
     prices_rows = cursor.fetchall()
     prices = [dict(row) for row in prices_rows]
 
-    conn.close()
     return flights, prices
 
 
 def fetch_prices_sorted_by_flight_dow():
     """Fetch all price entries sorted by the flight's day of week."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute("""
@@ -172,14 +489,12 @@ def fetch_prices_sorted_by_flight_dow():
     prices_rows = cursor.fetchall()
     prices = [dict(row) for row in prices_rows]
 
-    conn.close()
     return prices
 
 
 def fetch_prices_sorted_by_query_dow():
     """Fetch all price entries sorted by the query day of week."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute("""
@@ -190,22 +505,22 @@ def fetch_prices_sorted_by_query_dow():
     prices_rows = cursor.fetchall()
     prices = [dict(row) for row in prices_rows]
 
-    conn.close()
     return prices
 
 
 def fetch_avg_price_dbd():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    import pandas as pd
+
+    conn = get_connection()
     cursor = conn.cursor()
 
+    # maintained by db.update_aggregates, one row per bucket
     cursor.execute("""
         SELECT
             days_before_departure,
-            ROUND(AVG(price), 2) AS avg_price,
-            COUNT(*) AS num_samples
-        FROM prices
-        GROUP BY days_before_departure
+            ROUND(price_sum / price_count, 2) AS avg_price,
+            price_count AS num_samples
+        FROM agg_price_dbd
         ORDER BY days_before_departure DESC
     """)
 
@@ -216,8 +531,9 @@ def fetch_avg_price_dbd():
 
 
 def fetch_pricing_matrices():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    import pandas as pd
+
+    conn = get_connection()
     cursor = conn.cursor()
 
     # --- Query prices matrix ---
@@ -225,9 +541,8 @@ def fetch_pricing_matrices():
         SELECT
             query_time_slot AS time_slot,
             query_dow AS day_of_week,
-            ROUND(AVG(price), 2) AS avg_price
-        FROM prices
-        GROUP BY query_time_slot, query_dow
+            ROUND(price_sum / price_count, 2) AS avg_price
+        FROM agg_price_query_slot
         ORDER BY query_time_slot, query_dow
     """)
     rows = cursor.fetchall()
@@ -244,17 +559,14 @@ def fetch_pricing_matrices():
     # --- Departure prices matrix ---
     cursor.execute("""
         SELECT
-            f.departure_time_slot AS time_slot,
-            f.departure_dow AS day_of_week,
-            ROUND(AVG(p.price), 2) AS avg_price
-        FROM flights f
-        JOIN prices p ON f.id = p.flight_id
-        GROUP BY f.departure_time_slot, f.departure_dow
-        ORDER BY f.departure_time_slot, f.departure_dow
+            departure_time_slot AS time_slot,
+            departure_dow AS day_of_week,
+            ROUND(price_sum / price_count, 2) AS avg_price
+        FROM agg_price_departure_slot
+        ORDER BY departure_time_slot, departure_dow
     """)
     rows = cursor.fetchall()
     df_flights = pd.DataFrame(rows, columns=["time_slot", "day_of_week", "avg_price"])
-    print(df_flights)
     matrix_flights = df_flights.pivot(
         index='time_slot',
         columns='day_of_week',
@@ -264,26 +576,22 @@ def fetch_pricing_matrices():
     # Ensure full 6x7 matrix
     matrix_flights = matrix_flights.reindex(index=range(6), columns=range(7))
 
-    conn.close()
     return matrix_queries, matrix_flights
 
 
 def fetch_price_development_by_dow():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    import pandas as pd
+
+    conn = get_connection()
 
     query = """
         SELECT
-            p.days_before_departure,
-            f.departure_dow AS day_of_week,
-            AVG(p.price) AS avg_price
-        FROM flights f
-        JOIN prices p ON f.id = p.flight_id
-        GROUP BY p.days_before_departure, f.departure_dow
-        ORDER BY p.days_before_departure
+            days_before_departure,
+            departure_dow AS day_of_week,
+            price_sum / price_count AS avg_price
+        FROM agg_price_dbd_dow
+        ORDER BY days_before_departure
     """
 
     df = pd.read_sql(query, conn)
-    conn.close()
-
     return df
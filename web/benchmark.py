@@ -0,0 +1,393 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+
+import db
+import synthetic
+import app_utilities
+from crawler import FlightJob, crawl
+from tracker_utilitis import parse_response, parse_rows
+
+
+# databases and results of the benchmarks, data/ is not under version control
+BENCH_DIR = os.environ.get("FLIGHTTRACKER_BENCH_DIR",
+                           os.path.join(db.BASE_DIR, "data", "bench"))
+
+# pre-populated databases, by number of price rows
+SIZES = {
+    "10k": 10_000,
+    "1m": 1_000_000,
+    "10m": 10_000_000,
+}
+PAYLOADS = 300
+REPEAT = 20
+STARTUP_REPEAT = 5
+CRAWL_LATENCY = 0.02  # seconds the mock api takes per response
+
+# dashboard routes timed through the flask test client
+ROUTES = [
+    "/",
+    "/?destination=BER",
+    "/all_flights",
+    "/all_flights?sort=price&order=desc",
+    "/visual",
+    "/report",
+    "/api/avg_price_dbd",
+    "/api/pricing_matrices",
+    "/api/price_development",
+    "/export/flights",
+    "/api/cheapest_date?origin=VLC&destination=BER&date_from=2000-01-01",
+    "/api/cheapest_destinations?origin=VLC&date_from=2000-01-01",
+]
+
+
+def latency(samples):
+    samples = sorted(samples)
+    return {
+        "runs": len(samples),
+        "min_ms": samples[0] * 1000,
+        "median_ms": samples[len(samples) // 2] * 1000,
+        "p95_ms": samples[min(len(samples) - 1,
+                              int(len(samples) * 0.95))] * 1000,
+    }
+
+
+def measure(fn, repeat=REPEAT, setup=None):
+    '''
+    Calls fn once to warm up, then `repeat` times; `setup` runs before
+    every call and is not timed
+    '''
+    fn()
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return latency(samples)
+
+
+def throughput(fn, rows):
+    start = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - start
+    return {"rows": rows, "seconds": seconds,
+            "rows_per_s": rows / max(seconds, 1e-9)}
+
+
+def bench_parse(payloads):
+    responses = [data for _, _, _, data in payloads]
+    fares = sum(data["total"] for data in responses)
+    now = datetime.now()
+    return [
+        ("parse", "parse_response",
+         throughput(lambda: [parse_response(data) for data in responses],
+                    fares)),
+        ("parse", "parse_rows_batch",
+         throughput(lambda: parse_rows(responses, [now] * len(responses)),
+                    fares)),
+    ]
+
+
+def bench_ingest(payloads, tmp_dir):
+    results = []
+    parsed = [parse_response(data) for _, _, _, data in payloads]
+    fares = sum(len(flights) for flights in parsed)
+
+    conn = db.connect_db(os.path.join(tmp_dir, "ingest.db"))
+    results.append(("ingest", "save_flights", throughput(
+        lambda: [db.save_flights(conn, flights) for flights in parsed],
+        fares)))
+    conn.close()
+
+    conn_raw = db.connect_db_raw(os.path.join(tmp_dir, "ingest_raw.db"))
+    results.append(("ingest", "save_raw_data", throughput(
+        lambda: [db.save_raw_data(conn_raw, data, origin, destination,
+                                  departure_date)
+                 for origin, destination, departure_date, data in payloads],
+        len(payloads))))
+    conn_raw.close()
+
+    conn_raw = db.connect_db_raw(os.path.join(tmp_dir, "ingest_many.db"))
+    results.append(("ingest", "save_raw_data_many", throughput(
+        lambda: db.save_raw_data_many(conn_raw, [
+            db.raw_row(data, origin, destination, departure_date)
+            for origin, destination, departure_date, data in payloads]),
+        len(payloads))))
+    conn_raw.close()
+
+    conn = db.connect_db(os.path.join(tmp_dir, "writer.db"))
+    conn_raw = db.connect_db_raw(os.path.join(tmp_dir, "writer_raw.db"))
+
+    def buffered():
+        with db.BufferedWriter(conn, conn_raw) as writer:
+            for (origin, destination, departure_date, data), flights in zip(
+                    payloads, parsed):
+                writer.add_raw(data, origin, destination, departure_date)
+                writer.add_flights(flights)
+                writer.maybe_flush()
+
+    results.append(("ingest", "buffered_writer", throughput(buffered,
+                                                            fares)))
+    conn.close()
+    conn_raw.close()
+    return results
+
+
+def bench_crawl(jobs, latency=CRAWL_LATENCY):
+    '''
+    Fetches the jobs from mock_api.py on a local port, with the rate
+    limit out of the way so only concurrency, windows and latency count
+    '''
+    import mock_api
+
+    server, base_url = mock_api.serve_in_thread(
+        mock_api.MockApi(latency=latency))
+    try:
+        results = []
+        for concurrency in (1, 8, 32):
+            results.append(("crawl", f"concurrency_{concurrency}", throughput(
+                lambda: crawl(jobs, concurrency=concurrency, rate=1e6,
+                              burst=1e6, base_url=base_url),
+                len(jobs))))
+        for window_days in (7, 31):
+            results.append(("crawl", f"window_{window_days}", throughput(
+                lambda: crawl(jobs, concurrency=8, rate=1e6, burst=1e6,
+                              window_days=window_days, base_url=base_url),
+                len(jobs))))
+    finally:
+        server.shutdown()
+    return results
+
+
+def bench_db(size, rebuild=False, report=None):
+    '''
+    Path of the pre-populated database of a size, built on first use
+    '''
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    path = os.path.join(BENCH_DIR, f"prices-{size}-{db.PRICE_STORAGE}.db")
+    if rebuild and os.path.exists(path):
+        os.remove(path)
+    if not os.path.exists(path):
+        building = path + ".building"
+        if os.path.exists(building):
+            os.remove(building)
+        conn = db.connect_db(building)
+        synthetic.populate(conn, SIZES[size], report=report)
+        conn.close()
+        os.replace(building, path)
+    return path
+
+
+def _departure_window(path):
+    conn = sqlite3.connect(path)
+    first = conn.execute("""
+        SELECT date(MIN(departure_ts), 'unixepoch', '+30 days'),
+               date(MIN(departure_ts), 'unixepoch', '+60 days')
+        FROM flights_compact
+    """).fetchone()
+    conn.close()
+    return first
+
+
+def bench_dashboard(path, repeat):
+    app_utilities.DB_PATH = path
+    date_from, date_to = _departure_window(path)
+    queries = [
+        ("get_statistics", lambda: app_utilities.get_statistics()),
+        ("get_statistics_filtered", lambda: app_utilities.get_statistics(
+            origin="VLC", destination="BER", date_from=date_from,
+            date_to=date_to)),
+        ("get_all_flights_departure",
+         lambda: app_utilities.get_all_flights_with_average_price()),
+        ("get_all_flights_route", lambda:
+         app_utilities.get_all_flights_with_average_price(
+             origin="VLC", date_from=date_from, date_to=date_to)),
+        ("get_all_flights_price", lambda:
+         app_utilities.get_all_flights_with_average_price(sort="price")),
+        ("fetch_avg_price_dbd", app_utilities.fetch_avg_price_dbd),
+        ("fetch_pricing_matrices", app_utilities.fetch_pricing_matrices),
+        ("fetch_price_development_by_dow",
+         app_utilities.fetch_price_development_by_dow),
+        ("fetch_last_entries", lambda: app_utilities.fetch_last_entries(500)),
+    ]
+    return [("dashboard", name, measure(fn, repeat))
+            for name, fn in queries]
+
+
+def bench_routes(path, repeat, tmp_dir):
+    import app
+    from fragment_cache import FragmentCache
+
+    app_utilities.DB_PATH = path
+    app.cache = FragmentCache(os.path.join(tmp_dir, "fragments.db"))
+    client = app.app.test_client()
+
+    def get(url):
+        def call():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f"{url} returned {response.status_code}")
+        return call
+
+    results = []
+    for url in ROUTES:
+        results.append(("route", url, measure(get(url), repeat)))
+        if url.startswith("/api/") and not url.startswith("/api/cheapest"):
+            # without the fragment cache the chart data is rebuilt
+            results.append(("route", url + " (cold)",
+                            measure(get(url), repeat,
+                                    setup=app.cache.clear)))
+    return results
+
+
+def bench_startup(path, repeat=STARTUP_REPEAT):
+    '''
+    Cold start of both entry points, each sample a fresh interpreter:
+    importing the dashboard, the dashboard up to its first /report and
+    importing the tracker (what every cron run pays before its first
+    request)
+    '''
+    first_request = "; ".join([
+        "import app_utilities",
+        f"app_utilities.DB_PATH = {path!r}",
+        "import app",
+        "assert app.app.test_client().get('/report').status_code == 200",
+    ])
+    scripts = [
+        ("python", "pass"),
+        ("import app", "import app"),
+        ("app first /report", first_request),
+        ("import tracker_main", "import tracker_main"),
+    ]
+
+    def start(script):
+        def call():
+            subprocess.run([sys.executable, "-c", script], check=True,
+                           cwd=os.path.dirname(os.path.abspath(__file__)))
+        return call
+
+    return [("startup", name, measure(start(script), repeat))
+            for name, script in scripts]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    sizes = args.sizes.split(",")
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        sys.exit(f"Unknown size {', '.join(unknown)}, "
+                 f"choose from {', '.join(SIZES)}")
+
+    results = []
+
+    def add(size, entries):
+        for group, name, values in entries:
+            results.append({"group": group, "name": name, "size": size,
+                            **values})
+            print(f"{group:10} {name:40} {size or '':5} "
+                  + ("{median_ms:9.2f} ms".format(**values)
+                     if "median_ms" in values
+                     else "{rows_per_s:9.0f} rows/s".format(**values)))
+
+    payloads = synthetic.payloads(args.payloads)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        add(None, bench_parse(payloads))
+        add(None, bench_ingest(payloads, tmp_dir))
+        add(None, bench_crawl([
+            FlightJob(origin, destination, departure_date)
+            for origin, destination, departure_date, _ in payloads]))
+        for size in sizes:
+            path = bench_db(size, args.rebuild, report=lambda done, total:
+                            print(f"populating {size}: {done}/{total}"))
+            add(size, bench_dashboard(path, args.repeat))
+            add(size, bench_routes(path, args.repeat, tmp_dir))
+            add(size, bench_startup(path))
+
+    output = args.output or os.path.join(
+        BENCH_DIR, f"results-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "meta": {
+                "created": datetime.now().isoformat(),
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "platform": platform.platform(),
+                "price_storage": db.PRICE_STORAGE,
+                "payloads": args.payloads,
+                "repeat": args.repeat,
+            },
+            "results": results,
+        }, f, indent=2)
+    print(f"Results written to {output}")
+
+
+def compare(args):
+    '''
+    Prints new/old for every benchmark in both files, below 1 is faster
+    '''
+    def load(path):
+        with open(path, encoding="utf-8") as f:
+            return {(r["group"], r["name"], r["size"]): r
+                    for r in json.load(f)["results"]}
+
+    old, new = load(args.old), load(args.new)
+    for key in sorted(old.keys() & new.keys(),
+                      key=lambda key: (key[0], key[1], key[2] or "")):
+        before, after = old[key], new[key]
+        if "median_ms" in after:
+            ratio = after["median_ms"] / max(before["median_ms"], 1e-9)
+            values = f"{before['median_ms']:9.2f} -> " \
+                     f"{after['median_ms']:9.2f} ms"
+        else:
+            ratio = before["rows_per_s"] / max(after["rows_per_s"], 1e-9)
+            values = f"{before['rows_per_s']:9.0f} -> " \
+                     f"{after['rows_per_s']:9.0f} rows/s"
+        group, name, size = key
+        print(f"{group:10} {name:40} {size or '':5} {values}  {ratio:5.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FlightTracker benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser(
+        "run", help="time parsing, ingest and the dashboard queries")
+    p.add_argument("--sizes", default="10k",
+                   help=f"comma separated, from {', '.join(SIZES)}")
+    p.add_argument("--payloads", type=int, default=PAYLOADS)
+    p.add_argument("--repeat", type=int, default=REPEAT)
+    p.add_argument("--output", default=None)
+    p.add_argument("--rebuild", action="store_true",
+                   help="populate the databases again")
+    p.set_defaults(func=run)
+
+    p = subparsers.add_parser("compare", help="compare two result files")
+    p.add_argument("old")
+    p.add_argument("new")
+    p.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
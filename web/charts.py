@@ -0,0 +1,97 @@
+import json
+import math
+
+from app_utilities import (
+    fetch_data_version,
+    fetch_avg_price_dbd,
+    fetch_pricing_matrices,
+    fetch_price_development_by_dow)
+from fragment_cache import FragmentCache
+
+
+# Labels
+DAY_LABELS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+TIME_LABELS = ["23-3", "3-7", "7-11", "11-15", "15-19", "19-23"]
+
+
+def _column(values):
+    # NaN is not valid json, missing values become null
+    return [
+        None if isinstance(value, float) and math.isnan(value) else value
+        for value in values.tolist()
+    ]
+
+
+def avg_price_dbd_data():
+    df = fetch_avg_price_dbd()
+    return {
+        "days_before_departure": _column(df["days_before_departure"]),
+        "avg_price": _column(df["avg_price"]),
+        "num_samples": _column(df["num_samples"]),
+    }
+
+
+def pricing_matrices_data():
+    '''
+    Both 6x7 heatmaps as row lists (time slot x day of week)
+    '''
+    matrix_queries, matrix_flights = fetch_pricing_matrices()
+    return {
+        "day_labels": DAY_LABELS,
+        "time_labels": TIME_LABELS,
+        "queries": [_column(row) for _, row in matrix_queries.iterrows()],
+        "departures": [_column(row) for _, row in matrix_flights.iterrows()],
+    }
+
+
+def price_development_data():
+    # must have columns: day_of_week, days_before_departure, avg_price
+    df_price_dev = fetch_price_development_by_dow()
+
+    series = []
+    for dow in range(7):
+        subset = df_price_dev[df_price_dev["day_of_week"] == dow].sort_values("days_before_departure")
+        subset = subset.dropna(subset=["days_before_departure", "avg_price"])  # skip rows with missing data
+        if subset.empty:
+            continue
+        series.append({
+            "name": DAY_LABELS[dow],
+            "days_before_departure": _column(subset["days_before_departure"]),
+            "avg_price": _column(subset["avg_price"].round(2)),
+        })
+    return {"series": series}
+
+
+# cached payload name -> builder
+CHART_DATA = {
+    "avg_price_dbd": avg_price_dbd_data,
+    "pricing_matrices": pricing_matrices_data,
+    "price_development": price_development_data,
+}
+
+
+def get_chart_json(name, cache=None, version=None):
+    '''
+    Returns the chart data as compact json for the given data version,
+    building it only on a cache miss
+    '''
+    cache = cache or FragmentCache()
+    if version is None:
+        version, _ = fetch_data_version()
+
+    def build():
+        return json.dumps(CHART_DATA[name](), separators=(",", ":"))
+
+    return cache.get_or_render(name, version, build)
+
+
+def prewarm(cache=None):
+    '''
+    Builds every chart payload for the current data version,
+    called by the tracker once its writes are committed
+    '''
+    cache = cache or FragmentCache()
+    version, _ = fetch_data_version()
+    for name in CHART_DATA:
+        get_chart_json(name, cache, version)
+    return version
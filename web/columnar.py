@@ -0,0 +1,269 @@
+import os
+import shutil
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+from db import iso, query_columns
+
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+EXPORT_DIR = os.path.join(BASE_DIR, "data", "columnar", "prices")
+EXPORT_BATCH_SIZE = 200_000
+
+# prices joined with flights, as exported
+PRICE_SCHEMA = pa.schema([
+    ("flight_id", pa.string()),
+    ("query_date", pa.timestamp("us")),
+    ("price", pa.float64()),
+    ("currencyCode", pa.string()),
+    ("days_before_departure", pa.int32()),
+    ("query_dow", pa.int8()),
+    ("query_time_slot", pa.int8()),
+    ("flight_number", pa.string()),
+    ("departureDate", pa.timestamp("us")),
+    ("departure_time_slot", pa.int8()),
+    ("departure_dow", pa.int8()),
+    ("is_weekend", pa.int8()),
+    ("is_holiday", pa.int8()),
+    ("month", pa.int8()),
+    ("year", pa.int16()),
+])
+
+# hive partitions: route=VLC-BER/query_month=2026-03
+PARTITION_SCHEMA = pa.schema([
+    ("route", pa.string()),
+    ("query_month", pa.string()),
+])
+
+
+def _connect_export_state(conn):
+    '''
+    Returns the export watermark (query_ts, flight_id) and the schema
+    version the exported files were written at
+    '''
+    cursor = conn.cursor()
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS export_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        last_query_ts INTEGER NOT NULL DEFAULT 0,
+        last_flight_id INTEGER NOT NULL DEFAULT 0,
+        schema_version INTEGER NOT NULL DEFAULT 0,
+        updated TEXT
+        )
+    """)
+    cursor.execute("PRAGMA table_info(export_state)")
+    columns = {row[1] for row in cursor.fetchall()}
+    if "last_query_ts" not in columns:
+        # the rowid watermark of older exports, rowids are reused once
+        # prices are deleted; schema version 0 rewrites the export
+        for column in ["last_query_ts", "last_flight_id", "schema_version"]:
+            cursor.execute(f"ALTER TABLE export_state ADD COLUMN {column} "
+                           "INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("PRAGMA user_version")
+    schema_version = cursor.fetchone()[0]
+    cursor.execute("""
+    INSERT OR IGNORE INTO export_state (id, schema_version) VALUES (1, ?)
+    """, (schema_version,))
+    conn.commit()
+    cursor.execute("""
+        SELECT last_query_ts, last_flight_id, schema_version
+        FROM export_state WHERE id = 1
+    """)
+    last_query_ts, last_flight_id, exported_version = cursor.fetchone()
+    return (last_query_ts, last_flight_id), exported_version
+
+
+def _reset_export(conn, export_dir, schema_version):
+    # flight keys may have changed, the files are written from scratch
+    for name in os.listdir(export_dir) if os.path.isdir(export_dir) else []:
+        if name.startswith("route="):
+            shutil.rmtree(os.path.join(export_dir, name))
+    conn.execute("""
+        UPDATE export_state
+        SET last_query_ts = 0, last_flight_id = 0, schema_version = ?,
+            updated = ?
+        WHERE id = 1
+    """, (schema_version, datetime.now().isoformat()))
+    conn.commit()
+    return (0, 0)
+
+
+# column order of the export query
+EXPORT_COLUMNS = [
+    "query_ts",
+    "flight_key_id",
+    "origin",
+    "destination",
+    "flight_id",
+    "query_date",
+    "price",
+    "currencyCode",
+    "days_before_departure",
+    "query_dow",
+    "query_time_slot",
+    "departureDate",
+    "flight_number",
+    "departure_time_slot",
+    "departure_dow",
+    "is_weekend",
+    "is_holiday",
+    "month",
+    "year",
+]
+
+
+def _to_timestamps(values):
+    return pa.array(
+        [datetime.fromisoformat(v.replace("Z", "")) if v else None
+         for v in values],
+        type=pa.timestamp("us"))
+
+
+def _write_batch(rows, export_dir):
+    columns = dict(zip(EXPORT_COLUMNS, zip(*rows)))
+    arrays = []
+    for field in PRICE_SCHEMA:
+        if pa.types.is_timestamp(field.type):
+            arrays.append(_to_timestamps(columns[field.name]))
+        else:
+            arrays.append(pa.array(columns[field.name], field.type))
+    table = pa.table(arrays, schema=PRICE_SCHEMA)
+
+    partitions = {}
+    for index, (origin, destination, query_date) in enumerate(zip(
+            columns["origin"], columns["destination"], columns["query_date"])):
+        key = (f"{origin}-{destination}", query_date[:7])
+        partitions.setdefault(key, []).append(index)
+
+    for (route, query_month), indices in partitions.items():
+        path = os.path.join(export_dir, f"route={route}",
+                            f"query_month={query_month}")
+        os.makedirs(path, exist_ok=True)
+        # named after the first row, a repeated export overwrites it
+        name = f"part-{rows[0][0]:012d}-{rows[0][1]:09d}.parquet"
+        pq.write_table(table.take(indices), os.path.join(path, name))
+
+
+def export_prices(conn, export_dir=EXPORT_DIR, batch_size=EXPORT_BATCH_SIZE):
+    '''
+    Appends all prices added since the last export to the partitioned
+    parquet files. Returns the number of exported rows. A price interval
+    is exported as one row at its valid_from, the price the flight had
+    from then until its next row.
+
+    The export reads prices in (query_ts, flight_id) order behind the
+    last exported row; rowids are not stable, prices are deleted and
+    their rowids reused by prices-to-intervals and replay --fresh. After
+    a schema migration (flight keys may have changed) the export starts
+    over.
+    '''
+    position, exported_version = _connect_export_state(conn)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA user_version")
+    schema_version = cursor.fetchone()[0]
+    if exported_version != schema_version:
+        position = _reset_export(conn, export_dir, schema_version)
+    exported = 0
+
+    # price rows and the price changes of intervals, an interval is
+    # exported once with the time it started
+    days_before, query_dow, query_time_slot = query_columns("p.valid_from")
+    sql = f"""
+        WITH observed AS (
+            SELECT flight_id, query_ts, price, currency_id,
+                   days_before_departure, query_dow, query_time_slot
+            FROM prices_compact
+            WHERE (query_ts, flight_id) > (?, ?)
+            UNION ALL
+            SELECT p.flight_id, p.valid_from, p.price, p.currency_id,
+                   {days_before}, {query_dow}, {query_time_slot}
+            FROM price_intervals p
+            JOIN flights_compact f ON f.id = p.flight_id
+            WHERE (p.valid_from, p.flight_id) > (?, ?)
+            ORDER BY 2, 1
+            LIMIT ?
+        )
+        SELECT
+            p.query_ts,
+            p.flight_id,
+            src.iataCode,
+            dst.iataCode,
+            k.key,
+            {iso("p.query_ts")},
+            p.price,
+            c.code,
+            p.days_before_departure,
+            p.query_dow,
+            p.query_time_slot,
+            {iso("f.departure_ts")},
+            f.flight_number,
+            f.departure_time_slot,
+            f.departure_dow,
+            f.is_weekend,
+            f.is_holiday,
+            f.month,
+            f.year
+        FROM observed p
+        JOIN flights_compact f ON f.id = p.flight_id
+        JOIN flight_keys k ON k.id = p.flight_id
+        LEFT JOIN routes r ON r.id = f.route_id
+        LEFT JOIN airports src ON src.id = r.origin_id
+        LEFT JOIN airports dst ON dst.id = r.destination_id
+        LEFT JOIN currencies c ON c.id = p.currency_id
+        ORDER BY p.query_ts, p.flight_id
+    """
+
+    while True:
+        cursor.execute(sql, (*position, *position, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+
+        _write_batch(rows, export_dir)
+        position = rows[-1][:2]
+        exported += len(rows)
+        cursor.execute("""
+            UPDATE export_state
+            SET last_query_ts = ?, last_flight_id = ?, updated = ?
+            WHERE id = 1
+        """, (*position, datetime.now().isoformat()))
+        conn.commit()
+
+    return exported
+
+
+def read_prices(columns=None, routes=None, months=None, filter=None,
+                export_dir=EXPORT_DIR):
+    '''
+    Reads the exported prices as a pyarrow Table. Only the requested
+    columns are decoded and only the partitions of `routes`
+    (e.g. ["VLC-BER"]) and `months` (e.g. ["2026-03"]) are opened;
+    the files are memory mapped.
+    '''
+    dataset = ds.dataset(
+        export_dir,
+        format="parquet",
+        partitioning=ds.partitioning(PARTITION_SCHEMA, flavor="hive"),
+        filesystem=fs.LocalFileSystem(use_mmap=True))
+
+    expression = filter
+    if routes:
+        route_filter = ds.field("route").isin(list(routes))
+        expression = route_filter if expression is None \
+            else expression & route_filter
+    if months:
+        month_filter = ds.field("query_month").isin(list(months))
+        expression = month_filter if expression is None \
+            else expression & month_filter
+
+    return dataset.to_table(columns=columns, filter=expression)
+
+
+def read_prices_frame(columns=None, routes=None, months=None, filter=None,
+                      export_dir=EXPORT_DIR):
+    return read_prices(columns, routes, months, filter,
+                       export_dir).to_pandas()
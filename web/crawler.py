@@ -0,0 +1,375 @@
+import time
+import asyncio
+from collections import namedtuple
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+
+import httpx
+import tenacity
+
+from tracker_utilitis import (PAGE_LIMIT, build_flight_url, next_offset,
+                              split_by_departure_date)
+from retry_policy import (CONNECT_TIMEOUT, MAX_ATTEMPTS, READ_TIMEOUT,
+                          RESET_TIMEOUT, CircuitBreaker, CircuitOpenError,
+                          RetryableStatus, check_response, retrying)
+
+
+# --- Crawler defaults ---
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RATE = 2.0      # requests per second and host
+DEFAULT_BURST = 4       # requests a host may receive back to back
+
+# --- Date windows ---
+DEFAULT_WINDOW_DAYS = 1   # most departure days asked for in one request
+PAGES_PER_WINDOW = 2      # pages a tuned window aims for
+FARES_SMOOTHING = 0.3     # weight of the newest window in fares per day
+
+# --- Adaptive rate ---
+MIN_RATE = 0.1          # requests per second a rate limited host gets
+RATE_DECREASE = 0.5     # factor applied to the rate on a 429
+RATE_INCREASE = 0.05    # share of the configured rate won back per success
+# seconds after a slow down in which further 429s, answers to requests
+# that were already in flight, do not lower the rate again
+SLOW_DOWN_COOLDOWN = 1.0
+
+# --- Circuit breaker ---
+# seconds a host's circuit may stay open, through failed trial calls,
+# before its pending jobs fail; until then requests wait for the circuit
+CIRCUIT_PATIENCE = 300.0
+
+FlightJob = namedtuple("FlightJob", ["origin", "destination", "departure_date"])
+
+
+class TokenBucket:
+    """
+    Async token bucket. Refills `rate` tokens per second and holds at most
+    `burst` tokens; every request takes one token.
+
+    The rate adapts to the host: `slow_down` halves it (not below
+    `min_rate`) and holds all requests for a Retry-After, every success
+    wins back a step towards the configured rate.
+    """
+
+    def __init__(self, rate, burst, min_rate=MIN_RATE):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._slowed_at = None
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        # waiters queue on the lock, so tokens are handed out in FIFO order
+        async with self._lock:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+    def refund(self):
+        # a token taken for a request that was not sent
+        self._tokens = min(self.burst, self._tokens + 1)
+
+    def slow_down(self, pause=None):
+        now = time.monotonic()
+        if self._slowed_at is None \
+                or now - self._slowed_at >= SLOW_DOWN_COOLDOWN:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate * RATE_DECREASE)
+            self._tokens = min(self._tokens, 1.0)
+            self._slowed_at = now
+        if pause:
+            self._paused_until = max(self._paused_until, now + pause)
+
+    def speed_up(self):
+        if self.rate < self.max_rate:
+            self._refill()
+            self.rate = min(self.max_rate,
+                            self.rate + self.max_rate * RATE_INCREASE)
+
+
+class CrawlError(Exception):
+    """
+    Jobs that still failed after all retries, `errors` maps every failed
+    job to its last error
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        job, error = next(iter(errors.items()))
+        super().__init__(f"{len(errors)} jobs failed, first {job}: {error!r}")
+
+
+class Crawler:
+    """
+    Fetches many FlightJobs at once over one pooled keep-alive client.
+    At most `concurrency` requests are in flight and every host is
+    limited by its own TokenBucket and CircuitBreaker. Timeouts, 429s
+    and 5xx are retried up to `max_attempts` times with backoff.
+
+    Requests to a host with an open circuit wait until it lets a trial
+    through, without taking a token or an attempt. Only a circuit that
+    stays open for `circuit_patience` seconds fails the pending jobs.
+
+    With `window_days` above 1 consecutive departure dates of a route
+    are asked for in one request, paged by `limit` fares. The window
+    shrinks to about PAGES_PER_WINDOW pages of the fares per day seen on
+    the route, so busy routes still spread over the workers. A window
+    that fails is fetched again one day per request, unless the host's
+    circuit is open.
+
+    A RunMetrics passed as `metrics` gets the latency and status of
+    every request and the number of retries.
+    """
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE,
+                 burst=DEFAULT_BURST, timeout=READ_TIMEOUT,
+                 connect_timeout=CONNECT_TIMEOUT, max_attempts=MAX_ATTEMPTS,
+                 window_days=DEFAULT_WINDOW_DAYS, limit=PAGE_LIMIT,
+                 reset_timeout=RESET_TIMEOUT,
+                 circuit_patience=CIRCUIT_PATIENCE, base_url=None,
+                 metrics=None):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_attempts = max_attempts
+        self.window_days = window_days
+        self.limit = limit
+        self.reset_timeout = reset_timeout
+        self.circuit_patience = circuit_patience
+        self.base_url = base_url
+        self.metrics = metrics
+        self._buckets = {}
+        self._breakers = {}
+        self._fares_per_day = {}
+
+    def _bucket(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.rate, self.burst)
+        return self._buckets[host]
+
+    def _breaker(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._breakers:
+            self._breakers[host] = CircuitBreaker(
+                reset_timeout=self.reset_timeout)
+        return self._breakers[host]
+
+    def _client(self):
+        limits = httpx.Limits(
+            max_connections=self.concurrency,
+            max_keepalive_connections=self.concurrency
+        )
+        timeout = httpx.Timeout(self.timeout, connect=self.connect_timeout)
+        return httpx.AsyncClient(limits=limits, timeout=timeout)
+
+    async def _request(self, client, url):
+        start = time.perf_counter()
+        try:
+            response = await client.get(url)
+        except Exception as e:
+            if self.metrics is not None:
+                self.metrics.record_request(time.perf_counter() - start,
+                                            type(e).__name__)
+            raise
+        if self.metrics is not None:
+            self.metrics.record_request(time.perf_counter() - start,
+                                        response.status_code)
+        return response
+
+    async def _wait_for_circuit(self, breaker):
+        # raises CircuitOpenError once the host was down for too long
+        while True:
+            wait = breaker.retry_in()
+            if wait <= 0:
+                return
+            if time.monotonic() - breaker.down_since \
+                    >= self.circuit_patience:
+                raise CircuitOpenError(
+                    f"circuit open for {self.circuit_patience:.0f}s")
+            await asyncio.sleep(wait)
+
+    async def _call(self, client, url, bucket, breaker):
+        # the circuit is checked before taking a token and again after,
+        # another worker may have taken the trial call in between
+        while True:
+            await self._wait_for_circuit(breaker)
+            await bucket.acquire()
+            try:
+                with breaker.guard():
+                    response = await self._request(client, url)
+                    check_response(response)
+                    return response
+            except CircuitOpenError:
+                bucket.refund()
+
+    async def _get(self, client, url):
+        bucket = self._bucket(url)
+        breaker = self._breaker(url)
+
+        async for attempt in retrying(tenacity.AsyncRetrying,
+                                      self.max_attempts):
+            with attempt:
+                if self.metrics is not None \
+                        and attempt.retry_state.attempt_number > 1:
+                    self.metrics.count("retries")
+                try:
+                    response = await self._call(client, url, bucket, breaker)
+                except RetryableStatus as e:
+                    if e.status == 429:
+                        bucket.slow_down(e.retry_after)
+                    raise
+        bucket.speed_up()
+        return response.json()
+
+    async def fetch(self, client, job):
+        return await self._get(client, build_flight_url(
+            job.origin, job.destination, job.departure_date, self.base_url,
+            limit=self.limit))
+
+    async def fetch_window(self, client, window):
+        '''
+        Fetches consecutive departure dates of one route page by page,
+        returns {job: data} with data shaped like a single day's response
+        '''
+        first, last = window[0], window[-1]
+        pages = []
+        offset = 0
+        while offset is not None:
+            data = await self._get(client, build_flight_url(
+                first.origin, first.destination, first.departure_date,
+                self.base_url, last.departure_date, offset, self.limit))
+            pages.append(data)
+            offset = next_offset(data, offset)
+
+        fares = sum(len(page.get("fares") or []) for page in pages)
+        self._observe(first, fares / len(window))
+        if len(window) == 1 and len(pages) == 1:
+            # the response as the api sent it, as without windows
+            return {first: pages[0]}
+        days = split_by_departure_date(
+            pages, [job.departure_date for job in window])
+        return {job: days[job.departure_date] for job in window}
+
+    def _observe(self, job, fares_per_day):
+        route = (job.origin, job.destination)
+        seen = self._fares_per_day.get(route)
+        self._fares_per_day[route] = fares_per_day if seen is None \
+            else seen + FARES_SMOOTHING * (fares_per_day - seen)
+
+    def _window_size(self, job):
+        fares_per_day = self._fares_per_day.get((job.origin,
+                                                 job.destination))
+        if not fares_per_day:
+            return self.window_days
+        tuned = int(self.limit * PAGES_PER_WINDOW / fares_per_day)
+        return max(1, min(self.window_days, tuned))
+
+    def _take_window(self, pending):
+        # the first pending job and the pending days right after it
+        job = next(iter(pending))
+        del pending[job]
+        window = [job]
+        day = date.fromisoformat(job.departure_date)
+        for n in range(1, self._window_size(job)):
+            following = job._replace(
+                departure_date=(day + timedelta(n)).isoformat())
+            if following not in pending:
+                break
+            del pending[following]
+            window.append(following)
+        return window
+
+    async def _worker(self, client, pending, results):
+        # pending is shared by all workers, no await between taking
+        # a window and removing its jobs
+        while pending:
+            window = self._take_window(pending)
+            try:
+                if self.window_days > 1:
+                    data = await self.fetch_window(client, window)
+                else:
+                    data = {window[0]: await self.fetch(client, window[0])}
+            except Exception as e:
+                if len(window) > 1 and not isinstance(e, CircuitOpenError):
+                    await self._fetch_days(client, window, results)
+                else:
+                    for job in window:
+                        await results.put((job, None, e))
+                continue
+            for job in window:
+                await results.put((job, data[job], None))
+
+    async def _fetch_days(self, client, window, results):
+        # a failed window is asked for day by day, only the days that
+        # fail on their own count as failed
+        if self.metrics is not None:
+            self.metrics.count("window_fallbacks")
+        for job in window:
+            try:
+                data = await self.fetch(client, job)
+            except Exception as e:
+                await results.put((job, None, e))
+                continue
+            await results.put((job, data, None))
+
+    async def stream(self, jobs):
+        """
+        Yields (job, data) tuples in completion order. A job that fails
+        after its retries does not stop the others; once every job is
+        through, the failures are raised together as a CrawlError.
+        """
+        pending = dict.fromkeys(jobs)
+        jobs = list(pending)
+        if not jobs:
+            return
+
+        results = asyncio.Queue()
+
+        async with self._client() as client:
+            workers = [
+                asyncio.create_task(self._worker(client, pending, results))
+                for _ in range(min(self.concurrency, len(jobs)))
+            ]
+            errors = {}
+            try:
+                for _ in range(len(jobs)):
+                    job, data, error = await results.get()
+                    if error is not None:
+                        errors[job] = error
+                        continue
+                    yield job, data
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+        if errors:
+            raise CrawlError(errors)
+
+
+def crawl(jobs, **kwargs):
+    '''
+    Runs all jobs through a Crawler and returns a list of (job, data)
+    '''
+
+    async def collect():
+        crawler = Crawler(**kwargs)
+        return [result async for result in crawler.stream(jobs)]
+
+    return asyncio.run(collect())
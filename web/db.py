@@ -2,39 +2,148 @@ import os
 import json
 import gzip
 import sqlite3
+import time
 import hashlib
 from datetime import datetime
 
+from raw_codecs import CodecRegistry
+
 
 # Get the path relative to this file (db.py)
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 DB_PATH = os.path.join(BASE_DIR, "data", "flights.db")
 DB_PATH_RAW = os.path.join(BASE_DIR, "data", "raw_data.db")
 
+# --- Connection tuning ---
+CACHE_SIZE_KIB = 64 * 1024
+BATCH_SIZE = 500
+
+# --- Schema ---
+# PRAGMA user_version of the integer keyed schema, see migrate_schema
+SCHEMA_VERSION = 5
+# how timestamps are shown in the flights/prices views
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+# --- Price storage ---
+# "rows" stores one prices row per query, "intervals" only stores price
+# changes as price_intervals rows, see insert_price_intervals
+PRICE_STORAGE_ROWS = "rows"
+PRICE_STORAGE_INTERVALS = "intervals"
+PRICE_STORAGE = os.environ.get("FLIGHTTRACKER_PRICE_STORAGE",
+                               PRICE_STORAGE_ROWS)
+# observations of an interval_days row `d` on its day
+DAY_OBSERVATIONS = ("(d.observations / d.days"
+                    " + (d.day < d.observations % d.days))")
+
+# flights table columns after id, in insert order
+FLIGHT_COLUMNS = [
+    "flight_number",
+
+    "departureAirport_countryName",
+    "departureAirport_cityName",
+    "departureAirport_iataCode",
+    "departureAirport_macCode",
+    "departureAirport_seoName",
+
+    "arrivalAirport_countryName",
+    "arrivalAirport_cityName",
+    "arrivalAirport_iataCode",
+    "arrivalAirport_macCode",
+    "arrivalAirport_seoName",
+
+    "departureDate",
+    "departure_time_slot",
+    "arrivalDate",
+
+    "departure_dow",
+    "is_weekend",
+    "week_of_year",
+    "month",
+    "year",
+    "is_holiday",
+]
+
+# prices table columns, in insert order
+PRICE_COLUMNS = [
+    "flight_id",
+    "query_date",
+    "price",
+    "currencyCode",
+    "currencySymbol",
+    "days_before_departure",
+    "query_dow",
+    "query_time_slot",
+]
+
+# (table, bucket columns) of the dashboard aggregates
+PRICE_AGGREGATES = [
+    ("agg_price_dbd", ["days_before_departure"]),
+    ("agg_price_query_slot", ["query_time_slot", "query_dow"]),
+    ("agg_price_departure_slot", ["departure_time_slot", "departure_dow"]),
+    ("agg_price_dbd_dow", ["days_before_departure", "departure_dow"]),
+]
+
+
+def get_time_slot(hour):
+    return (hour - 23) % 24 // 4
+
 
 def get_current_time_slot():
-    now = datetime.now().hour
-    time_slot = (now - 23) % 24 // 4
-    return time_slot
+    return get_time_slot(datetime.now().hour)
 
 
-def compress_json(data: dict) -> bytes:
-    raw = json.dumps(data).encode("utf-8")
-    return gzip.compress(raw)
+def canonical_json(data: dict) -> bytes:
+    return json.dumps(data, sort_keys=True, separators=(",", ":"),
+                      ensure_ascii=False).encode("utf-8")
 
 
-def hash_json(data: dict, timestamp) -> str:
-    raw = json.dumps({"data": data, "timestamp": timestamp},
-                     sort_keys=True).encode("utf-8")
-    return hashlib.sha256(raw).hexdigest()
+def decompress_json(blob: bytes) -> dict:
+    return json.loads(gzip.decompress(blob))
+
+
+def configure_connection(conn):
+    '''
+    WAL lets readers continue while the tracker writes, and with
+    synchronous=NORMAL a commit only fsyncs at checkpoints.
+    '''
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    return conn
 
 
 def connect_db_raw(db_path_raw=DB_PATH_RAW):
-    conn = sqlite3.connect(db_path_raw)
+    conn = configure_connection(sqlite3.connect(db_path_raw))
     cursor = conn.cursor()
-    # create flights tables if not exist
+    # every distinct response body is stored once
     cursor.execute("""
-    CREATE TABLE IF NOT EXISTS raw_api_responses (
+    CREATE TABLE IF NOT EXISTS raw_payloads (
+        id INTEGER PRIMARY KEY,
+        hash BLOB NOT NULL UNIQUE,
+        payload BLOB NOT NULL,
+        codec TEXT NOT NULL DEFAULT 'gzip',
+        dict_id INTEGER
+        )
+    """)
+    cursor.execute("PRAGMA table_info(raw_payloads)")
+    columns = {row[1] for row in cursor.fetchall()}
+    if "codec" not in columns:
+        cursor.execute("ALTER TABLE raw_payloads "
+                       "ADD COLUMN codec TEXT NOT NULL DEFAULT 'gzip'")
+        cursor.execute("ALTER TABLE raw_payloads ADD COLUMN dict_id INTEGER")
+    # zstd dictionaries referenced by raw_payloads.dict_id
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS raw_dictionaries (
+        id INTEGER PRIMARY KEY,
+        created TEXT NOT NULL,
+        dict_data BLOB NOT NULL
+        )
+    """)
+    # one small row per api call pointing at its payload
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS raw_observations (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
 
         query_date TEXT NOT NULL,
@@ -42,152 +151,525 @@ def connect_db_raw(db_path_raw=DB_PATH_RAW):
         destination TEXT NOT NULL,
         departure_date TEXT NOT NULL,
 
-        response_gzip BLOB NOT NULL,
-        response_hash TEXT NOT NULL
+        payload_id INTEGER NOT NULL,
+        FOREIGN KEY(payload_id) REFERENCES raw_payloads(id)
         )
     """)
 
+    conn.commit()
+    return conn
+
+
+def migrate_raw_api_responses(conn, batch_size=BATCH_SIZE):
+    '''
+    Moves the rows of the old raw_api_responses table into the
+    content-addressed raw_payloads/raw_observations tables and drops it.
+    Returns (migrated rows, distinct payloads).
+    '''
+    cursor = conn.cursor()
     cursor.execute("""
-    CREATE UNIQUE INDEX IF NOT EXISTS idx_raw_response_hash
-        ON raw_api_responses (response_hash)
+        SELECT name FROM sqlite_master
+        WHERE type = 'table' AND name = 'raw_api_responses'
+    """)
+    if cursor.fetchone() is None:
+        return 0, 0
+
+    read = conn.cursor()
+    read.execute("""
+        SELECT query_date, origin, destination, departure_date, response_gzip
+        FROM raw_api_responses
+        ORDER BY id
     """)
+    migrated = 0
+    while True:
+        batch = read.fetchmany(batch_size)
+        if not batch:
+            break
+        rows = [
+            raw_row(decompress_json(blob), origin, destination,
+                    departure_date, query_date=query_date)
+            for query_date, origin, destination, departure_date, blob
+            in batch
+        ]
+        insert_raw_rows(cursor, rows)
+        migrated += len(rows)
 
+    cursor.execute("DROP TABLE raw_api_responses")
     conn.commit()
-    return conn
 
+    cursor.execute("SELECT COUNT(*) FROM raw_payloads")
+    return migrated, cursor.fetchone()[0]
 
-def connect_db(db_path=DB_PATH):
-    conn = sqlite3.connect(db_path)
+
+def iter_raw_chunks(conn, start_id=0, batch_size=BATCH_SIZE):
+    '''
+    Yields lists of (id, query_date, origin, destination, departure_date,
+    codec, dict_id, payload) for the raw observations above start_id,
+    the payloads are still compressed
+    '''
     cursor = conn.cursor()
-    # create flights tables if not exist
+    last_id = start_id
+    while True:
+        cursor.execute("""
+            SELECT o.id, o.query_date, o.origin, o.destination,
+                   o.departure_date, p.codec, p.dict_id, p.payload
+            FROM raw_observations o
+            JOIN raw_payloads p ON p.id = o.payload_id
+            WHERE o.id > ?
+            ORDER BY o.id
+            LIMIT ?
+        """, (last_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def iter_raw_data(conn, start_id=0, batch_size=BATCH_SIZE):
+    '''
+    Yields (id, query_date, origin, destination, departure_date, data)
+    for every raw observation with an id above start_id
+    '''
+    registry = CodecRegistry(conn)
+    for rows in iter_raw_chunks(conn, start_id, batch_size):
+        for *observation, codec, dict_id, payload in rows:
+            raw = registry.decompress(codec, dict_id, payload)
+            yield (*observation, json.loads(raw))
+
+
+def epoch(value):
+    # sql expression: ISO date string -> integer unix seconds
+    return f"CAST(strftime('%s', {value}) AS INTEGER)"
+
+
+def iso(value):
+    # sql expression: integer unix seconds -> ISO date string
+    return f"strftime('{ISO_FORMAT}', {value}, 'unixepoch')"
+
+
+def query_columns(value, departure="f.departure_ts"):
+    '''
+    sql expressions of days_before_departure, query_dow and
+    query_time_slot of a query at the unix seconds `value`, as the
+    tracker stores them with a price row; price intervals do not store
+    them
+    '''
+    return [
+        f"CAST(julianday(date({departure}, 'unixepoch'))"
+        f" - julianday(date({value}, 'unixepoch')) AS INTEGER)",
+        f"(CAST(strftime('%w', {value}, 'unixepoch') AS INTEGER) + 6) % 7",
+        f"(CAST(strftime('%H', {value}, 'unixepoch') AS INTEGER) + 1)"
+        " % 24 / 4",
+    ]
+
+
+def create_schema(cursor):
+    # dictionary tables: every airport, route and currency is stored once
     cursor.execute("""
-    CREATE TABLE IF NOT EXISTS flights (
-        id TEXT PRIMARY KEY,
-        flight_number TEXT,
+    CREATE TABLE IF NOT EXISTS airports (
+        id INTEGER PRIMARY KEY,
+        iataCode TEXT NOT NULL UNIQUE,
+        countryName TEXT,
+        cityName TEXT,
+        macCode TEXT,
+        seoName TEXT
+        )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS routes (
+        id INTEGER PRIMARY KEY,
+        origin_id INTEGER NOT NULL,
+        destination_id INTEGER NOT NULL,
 
-        departureAirport_countryName TEXT,
-        departureAirport_cityName TEXT,
-        departureAirport_iataCode TEXT,
-        departureAirport_macCode TEXT,
-        departureAirport_seoName TEXT,
+        UNIQUE(origin_id, destination_id),
+        FOREIGN KEY(origin_id) REFERENCES airports(id),
+        FOREIGN KEY(destination_id) REFERENCES airports(id)
+        )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS currencies (
+        id INTEGER PRIMARY KEY,
+        code TEXT NOT NULL,
+        symbol TEXT,
 
-        arrivalAirport_countryName TEXT,
-        arrivalAirport_cityName TEXT,
-        arrivalAirport_iataCode TEXT,
-        arrivalAirport_macCode TEXT,
-        arrivalAirport_seoName TEXT,
+        UNIQUE(code, symbol)
+        )
+    """)
+    # natural key (FR642_20260325T0600_VLC_STN) -> integer flight id
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS flight_keys (
+        id INTEGER PRIMARY KEY,
+        key TEXT NOT NULL UNIQUE
+        )
+    """)
+    # timestamps are unix seconds of the local (naive) times
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS flights_compact (
+        id INTEGER PRIMARY KEY,
+        flight_number TEXT,
+        route_id INTEGER,
 
-        departureDate TEXT,
+        departure_ts INTEGER,
         departure_time_slot INTEGER,
-        arrivalDate TEXT,
+        arrival_ts INTEGER,
 
         departure_dow INTEGER,
         is_weekend INTEGER,
         week_of_year INTEGER,
         month INTEGER,
         year INTEGER,
-        is_holiday INTEGER
+        is_holiday INTEGER,
+
+        FOREIGN KEY(id) REFERENCES flight_keys(id),
+        FOREIGN KEY(route_id) REFERENCES routes(id)
         )
     """)
     cursor.execute("""
-    CREATE TABLE IF NOT EXISTS prices (
-        flight_id TEXT,
-        query_date TEXT,
+    CREATE TABLE IF NOT EXISTS prices_compact (
+        flight_id INTEGER,
+        query_ts INTEGER,
 
         price REAL,
-        currencyCode TEXT,
-        currencySymbol TEXT,
+        currency_id INTEGER,
         days_before_departure INTEGER,
         query_dow INTEGER,
         query_time_slot INTEGER,
 
-        PRIMARY KEY(flight_id, query_date),
-        FOREIGN KEY(flight_id) REFERENCES flights(id)
+        PRIMARY KEY(flight_id, query_ts),
+        FOREIGN KEY(flight_id) REFERENCES flights_compact(id),
+        FOREIGN KEY(currency_id) REFERENCES currencies(id)
         )
     """)
-    conn.commit()
+    # change-only price history: one row per run of unchanged prices,
+    # `observations` counts the queries it stands for
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS price_intervals (
+        flight_id INTEGER,
+        valid_from INTEGER,
+        valid_to INTEGER NOT NULL,
+
+        price REAL,
+        currency_id INTEGER,
+        observations INTEGER NOT NULL,
+
+        PRIMARY KEY(flight_id, valid_from),
+        FOREIGN KEY(flight_id) REFERENCES flights_compact(id),
+        FOREIGN KEY(currency_id) REFERENCES currencies(id)
+        )
+    """)
+    # keyset pagination and route filters of /all_flights
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_flights_departure
+        ON flights_compact (departure_ts, id)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_flights_route
+        ON flights_compact (route_id, departure_ts)
+    """)
+    # statistics: min/max price and query time windows,
+    # prices by flight_id is served by the primary key
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_prices_price
+        ON prices_compact (price)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_prices_query_ts
+        ON prices_compact (query_ts)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_price_intervals_price
+        ON price_intervals (price)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_price_intervals_valid_from
+        ON price_intervals (valid_from)
+    """)
+    # the old flights/prices tables as views, for readers of the
+    # natural keys and ISO dates
+    cursor.execute(f"""
+    CREATE VIEW IF NOT EXISTS flights AS
+    SELECT
+        k.key AS id,
+        f.flight_number,
+
+        src.countryName AS departureAirport_countryName,
+        src.cityName AS departureAirport_cityName,
+        src.iataCode AS departureAirport_iataCode,
+        src.macCode AS departureAirport_macCode,
+        src.seoName AS departureAirport_seoName,
+
+        dst.countryName AS arrivalAirport_countryName,
+        dst.cityName AS arrivalAirport_cityName,
+        dst.iataCode AS arrivalAirport_iataCode,
+        dst.macCode AS arrivalAirport_macCode,
+        dst.seoName AS arrivalAirport_seoName,
+
+        {iso("f.departure_ts")} AS departureDate,
+        f.departure_time_slot,
+        {iso("f.arrival_ts")} AS arrivalDate,
+
+        f.departure_dow,
+        f.is_weekend,
+        f.week_of_year,
+        f.month,
+        f.year,
+        f.is_holiday
+    FROM flights_compact f
+    JOIN flight_keys k ON k.id = f.id
+    LEFT JOIN routes r ON r.id = f.route_id
+    LEFT JOIN airports src ON src.id = r.origin_id
+    LEFT JOIN airports dst ON dst.id = r.destination_id
+    """)
+    cursor.execute(f"""
+    CREATE VIEW IF NOT EXISTS prices AS
+    SELECT
+        k.key AS flight_id,
+        {iso("p.query_ts")} AS query_date,
+
+        p.price,
+        c.code AS currencyCode,
+        c.symbol AS currencySymbol,
+        p.days_before_departure,
+        p.query_dow,
+        p.query_time_slot
+    FROM prices_compact p
+    JOIN flight_keys k ON k.id = p.flight_id
+    LEFT JOIN currencies c ON c.id = p.currency_id
+    """)
+    # version is bumped by every write that adds prices and keys the
+    # fragment cache, generation by every write that deletes prices
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS data_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL,
+        updated TEXT,
+        generation INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+    INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)
+    """)
+    # running sums behind the dashboard charts, see update_aggregates
+    for table, keys in PRICE_AGGREGATES:
+        key_columns = ", ".join(f"{key} INTEGER NOT NULL" for key in keys)
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            {key_columns},
+            price_sum REAL NOT NULL,
+            price_count INTEGER NOT NULL,
+
+            PRIMARY KEY({", ".join(keys)})
+            )
+        """)
+
+
+def connect_db(db_path=DB_PATH):
+    conn = configure_connection(sqlite3.connect(db_path))
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA user_version")
+    if cursor.fetchone()[0] < SCHEMA_VERSION:
+        migrate_schema(conn)
     return conn
 
 
-def save_flights(conn, all_flights):
+def migrate_schema(conn):
+    '''
+    Brings a database up to SCHEMA_VERSION in one transaction. Version 2
+    converts the old TEXT keyed flights/prices/price_intervals tables to
+    the integer keyed schema, prices keep their rowids. Version 3 fills
+    the aggregate tables from the prices already stored. Version 4 gives
+    the flights of the baseline tracker the keys make_flight_id builds
+    now, see merge_flight_keys. Version 5 adds the data generation, see
+    bump_data_generation. Returns the number of migrated prices rows.
+    '''
     cursor = conn.cursor()
-    now = datetime.now().isoformat()
-    query_dow = datetime.now().weekday() 
-    query_time_slot = get_current_time_slot()
+    cursor.execute("PRAGMA user_version")
+    version = cursor.fetchone()[0]
+    cursor.execute("BEGIN")
 
-    for flight_id, info in all_flights.items():
-        # -------- insert into flights table --------
-        cursor.execute("""
-            INSERT OR IGNORE INTO flights (
-                id,
-                flight_number,
-
-                departureAirport_countryName,
-                departureAirport_cityName,
-                departureAirport_iataCode,
-                departureAirport_macCode,
-                departureAirport_seoName,
-
-                arrivalAirport_countryName,
-                arrivalAirport_cityName,
-                arrivalAirport_iataCode,
-                arrivalAirport_macCode,
-                arrivalAirport_seoName,
-
-                departureDate,
-                departure_time_slot,
-                arrivalDate,
-
-                departure_dow,
-                is_weekend,
-                week_of_year,
-                month,
-                year,
-                is_holiday
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            flight_id,
-            info.get("flight_number"),
-
-            info.get("departureAirport_countryName"),
-            info.get("departureAirport_cityName"),
-            info.get("departureAirport_iataCode"),
-            info.get("departureAirport_macCode"),
-            info.get("departureAirport_seoName"),
-
-            info.get("arrivalAirport_countryName"),
-            info.get("arrivalAirport_cityName"),
-            info.get("arrivalAirport_iataCode"),
-            info.get("arrivalAirport_macCode"),
-            info.get("arrivalAirport_seoName"),
-
-            info.get("departureDate"),
-            info.get("departure_time_slot"),
-            info.get("arrivalDate"),
-
-            info.get("departure_dow"),
-            info.get("is_weekend"),
-            info.get("week_of_year"),
-            info.get("month"),
-            info.get("year"),
-            info.get("is_holiday")
-        ))
+    migrated = 0
+    if version < 2:
+        migrated = convert_text_keys(cursor)
+    create_schema(cursor)
+    if version < 5:
+        cursor.execute("PRAGMA table_info(data_version)")
+        if "generation" not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute("ALTER TABLE data_version ADD COLUMN "
+                           "generation INTEGER NOT NULL DEFAULT 0")
+    dropped = 0
+    if version < 4:
+        dropped = merge_flight_keys(cursor)
+    if version < 3 or dropped:
+        # databases migrated before had their aggregates started empty
+        fill_aggregates(cursor)
+    if version < 4:
+        bump_data_version(cursor)
+        bump_data_generation(cursor)
 
-        # -------- insert into prices table --------
+    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+    return migrated
+
+
+def convert_text_keys(cursor):
+    '''
+    Moves the rows of the old TEXT keyed tables into the integer keyed
+    schema and drops the old tables. Returns the number of prices rows.
+    '''
+    cursor.execute("""
+        SELECT name FROM sqlite_master
+        WHERE type = 'table'
+            AND name IN ('flights', 'prices', 'price_intervals')
+    """)
+    old_tables = {row[0] for row in cursor.fetchall()}
+    for table in old_tables:
+        cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_v1")
+    for index in ["idx_flights_departure", "idx_flights_route",
+                  "idx_prices_price", "idx_prices_query_date",
+                  "idx_price_intervals_price",
+                  "idx_price_intervals_valid_from"]:
+        cursor.execute(f"DROP INDEX IF EXISTS {index}")
+
+    create_schema(cursor)
+
+    migrated = 0
+    if "flights" in old_tables:
+        cursor.execute("DROP TABLE IF EXISTS temp.staged_flights")
         cursor.execute("""
-            INSERT OR IGNORE INTO prices (
+            CREATE TEMP TABLE staged_flights AS
+            SELECT * FROM flights_v1 ORDER BY rowid
+        """)
+        insert_staged_flights(cursor)
+        cursor.execute("DROP TABLE temp.staged_flights")
+    for table, time_column in [("prices", "query_date"),
+                               ("price_intervals", "valid_from")]:
+        if table not in old_tables:
+            continue
+        cursor.execute(f"""
+            INSERT INTO currencies (code, symbol)
+            SELECT DISTINCT currencyCode, currencySymbol FROM {table}_v1 p
+            WHERE currencyCode IS NOT NULL AND NOT EXISTS (
+                SELECT 1 FROM currencies c
+                WHERE c.code = p.currencyCode
+                    AND c.symbol IS p.currencySymbol
+            )
+        """)
+    if "prices" in old_tables:
+        cursor.execute(f"""
+            INSERT OR IGNORE INTO prices_compact (
+                rowid,
                 flight_id,
-                query_date,
+                query_ts,
                 price,
-                currencyCode,
-                currencySymbol,
+                currency_id,
                 days_before_departure,
                 query_dow,
                 query_time_slot
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
+            SELECT
+                p.rowid,
+                k.id,
+                {epoch("p.query_date")},
+                p.price,
+                c.id,
+                p.days_before_departure,
+                p.query_dow,
+                p.query_time_slot
+            FROM prices_v1 p
+            JOIN flight_keys k ON k.key = p.flight_id
+            LEFT JOIN currencies c
+                ON c.code = p.currencyCode AND c.symbol IS p.currencySymbol
+            ORDER BY p.rowid
+        """)
+        migrated = cursor.rowcount
+    if "price_intervals" in old_tables:
+        cursor.execute(f"""
+            INSERT OR IGNORE INTO price_intervals (
+                flight_id,
+                valid_from,
+                valid_to,
+                price,
+                currency_id,
+                observations
+            )
+            SELECT
+                k.id,
+                {epoch("i.valid_from")},
+                {epoch("i.valid_to")},
+                i.price,
+                c.id,
+                i.observations
+            FROM price_intervals_v1 i
+            JOIN flight_keys k ON k.key = i.flight_id
+            LEFT JOIN currencies c
+                ON c.code = i.currencyCode AND c.symbol IS i.currencySymbol
+        """)
+    for table in old_tables:
+        cursor.execute(f"DROP TABLE {table}_v1")
+    return migrated
+
+
+def normalize_flight_key(key):
+    '''
+    The key make_flight_id builds for a key of the baseline tracker,
+    which had whitespace in front of _ORIGIN_DESTINATION
+    '''
+    return "_".join(part.strip() for part in key.split("_"))
+
+
+def merge_flight_keys(cursor):
+    '''
+    Renames the flight keys with whitespace to their normalized form. A
+    flight stored under both keys is merged into the row of the old key:
+    its prices and price intervals move over, observations at a time the
+    old key already has are dropped. Returns the number of dropped rows.
+    '''
+    cursor.execute("SELECT id, key FROM flight_keys WHERE key LIKE '% %'")
+    dropped = 0
+    for old_id, key in cursor.fetchall():
+        new_key = normalize_flight_key(key)
+        if new_key == key:
+            continue
+        cursor.execute("SELECT id FROM flight_keys WHERE key = ?",
+                       (new_key,))
+        row = cursor.fetchone()
+        if row is not None:
+            new_id = row[0]
+            for table in ["prices_compact", "price_intervals"]:
+                cursor.execute(f"""
+                    UPDATE OR IGNORE {table} SET flight_id = ?
+                    WHERE flight_id = ?
+                """, (old_id, new_id))
+                cursor.execute(f"DELETE FROM {table} WHERE flight_id = ?",
+                               (new_id,))
+                dropped += cursor.rowcount
+            cursor.execute("DELETE FROM flights_compact WHERE id = ?",
+                           (new_id,))
+            cursor.execute("DELETE FROM flight_keys WHERE id = ?", (new_id,))
+        cursor.execute("UPDATE flight_keys SET key = ? WHERE id = ?",
+                       (new_key, old_id))
+    return dropped
+
+
+def flight_rows(all_flights, query_time=None):
+    '''
+    Turns the parsed flights dict into rows for the flights and prices
+    tables, all prices get the same query_date.
+    '''
+    query_time = query_time or datetime.now()
+    now = query_time.isoformat()
+    query_dow = query_time.weekday()
+    query_time_slot = get_time_slot(query_time.hour)
+
+    flights = []
+    prices = []
+    for flight_id, info in all_flights.items():
+        flights.append((
+            flight_id,
+            *(info.get(column) for column in FLIGHT_COLUMNS)
+        ))
+        prices.append((
             flight_id,
             now,
             info.get("price"),
@@ -197,32 +679,634 @@ def save_flights(conn, all_flights):
             query_dow,
             query_time_slot
         ))
+    return flights, prices
 
-    conn.commit()
 
+def stage_flights(cursor, flights):
+    # temp table shaped like the old flights table
+    columns = ", ".join(FLIGHT_COLUMNS)
+    cursor.execute(f"""
+    CREATE TEMP TABLE IF NOT EXISTS staged_flights (
+        id TEXT PRIMARY KEY,
+        {columns}
+        )
+    """)
+    cursor.execute("DELETE FROM staged_flights")
+    cursor.executemany(f"""
+        INSERT OR IGNORE INTO staged_flights (id, {columns})
+        VALUES ({", ".join("?" * (len(FLIGHT_COLUMNS) + 1))})
+    """, flights)
 
-def save_raw_data(conn, api_response, origin, destination, departure_date):
-    now = datetime.now().isoformat()
-    cursor = conn.cursor()
-    compressed = compress_json(api_response)
-    response_hash = hash_json(api_response, now)
 
+def insert_staged_flights(cursor):
+    '''
+    Adds the flights of staged_flights that are not stored yet, with their
+    airports and routes
+    '''
     cursor.execute("""
-        INSERT INTO raw_api_responses (
-            query_date,
-            origin,
-            destination,
-            departure_date,
-            response_gzip,
-            response_hash
+        INSERT OR IGNORE INTO airports (
+            iataCode,
+            countryName,
+            cityName,
+            macCode,
+            seoName
+        )
+        SELECT
+            departureAirport_iataCode,
+            departureAirport_countryName,
+            departureAirport_cityName,
+            departureAirport_macCode,
+            departureAirport_seoName
+        FROM staged_flights
+        WHERE departureAirport_iataCode IS NOT NULL
+        UNION ALL
+        SELECT
+            arrivalAirport_iataCode,
+            arrivalAirport_countryName,
+            arrivalAirport_cityName,
+            arrivalAirport_macCode,
+            arrivalAirport_seoName
+        FROM staged_flights
+        WHERE arrivalAirport_iataCode IS NOT NULL
+    """)
+    cursor.execute("""
+        INSERT OR IGNORE INTO routes (origin_id, destination_id)
+        SELECT DISTINCT src.id, dst.id
+        FROM staged_flights s
+        JOIN airports src ON src.iataCode = s.departureAirport_iataCode
+        JOIN airports dst ON dst.iataCode = s.arrivalAirport_iataCode
+    """)
+    cursor.execute("""
+        INSERT OR IGNORE INTO flight_keys (key)
+        SELECT id FROM staged_flights
+    """)
+    cursor.execute(f"""
+        INSERT OR IGNORE INTO flights_compact (
+            id,
+            flight_number,
+            route_id,
+
+            departure_ts,
+            departure_time_slot,
+            arrival_ts,
+
+            departure_dow,
+            is_weekend,
+            week_of_year,
+            month,
+            year,
+            is_holiday
+        )
+        SELECT
+            k.id,
+            s.flight_number,
+            r.id,
+
+            {epoch("s.departureDate")},
+            s.departure_time_slot,
+            {epoch("s.arrivalDate")},
+
+            s.departure_dow,
+            s.is_weekend,
+            s.week_of_year,
+            s.month,
+            s.year,
+            s.is_holiday
+        FROM staged_flights s
+        JOIN flight_keys k ON k.key = s.id
+        LEFT JOIN airports src ON src.iataCode = s.departureAirport_iataCode
+        LEFT JOIN airports dst ON dst.iataCode = s.arrivalAirport_iataCode
+        LEFT JOIN routes r
+            ON r.origin_id = src.id AND r.destination_id = dst.id
+    """)
+
+
+def stage_prices(cursor):
+    # empty temp table shaped like prices_compact
+    cursor.execute("""
+    CREATE TEMP TABLE IF NOT EXISTS staged_prices (
+        flight_id INTEGER,
+        query_ts INTEGER,
+
+        price REAL,
+        currency_id INTEGER,
+        days_before_departure INTEGER,
+        query_dow INTEGER,
+        query_time_slot INTEGER,
+
+        PRIMARY KEY(flight_id, query_ts)
+        )
+    """)
+    cursor.execute("DELETE FROM staged_prices")
+
+
+def stage_price_rows(cursor, prices):
+    '''
+    Fills staged_prices from PRICE_COLUMNS tuples, resolving the flight
+    keys and currencies to their ids
+    '''
+    columns = ", ".join(PRICE_COLUMNS)
+    cursor.execute(f"""
+    CREATE TEMP TABLE IF NOT EXISTS staged_price_rows ({columns})
+    """)
+    cursor.execute("DELETE FROM staged_price_rows")
+    cursor.executemany(f"""
+        INSERT INTO staged_price_rows ({columns})
+        VALUES ({", ".join("?" * len(PRICE_COLUMNS))})
+    """, prices)
+    cursor.execute("""
+        INSERT INTO currencies (code, symbol)
+        SELECT DISTINCT currencyCode, currencySymbol FROM staged_price_rows s
+        WHERE currencyCode IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM currencies c
+            WHERE c.code = s.currencyCode AND c.symbol IS s.currencySymbol
+        )
+    """)
+
+    stage_prices(cursor)
+    cursor.execute(f"""
+        INSERT OR IGNORE INTO staged_prices (
+            flight_id,
+            query_ts,
+            price,
+            currency_id,
+            days_before_departure,
+            query_dow,
+            query_time_slot
+        )
+        SELECT
+            k.id,
+            {epoch("s.query_date")},
+            s.price,
+            c.id,
+            s.days_before_departure,
+            s.query_dow,
+            s.query_time_slot
+        FROM staged_price_rows s
+        JOIN flight_keys k ON k.key = s.flight_id
+        LEFT JOIN currencies c
+            ON c.code = s.currencyCode AND c.symbol IS s.currencySymbol
+    """)
+
+
+def insert_flight_rows(cursor, flights, prices):
+    # -------- insert into flights and its lookup tables --------
+    stage_flights(cursor, flights)
+    insert_staged_flights(cursor)
+
+    # -------- stage prices, keep only the new ones --------
+    stage_price_rows(cursor, prices)
+    cursor.execute("""
+        DELETE FROM staged_prices
+        WHERE EXISTS (
+            SELECT 1 FROM prices_compact p
+            WHERE p.flight_id = staged_prices.flight_id
+                AND p.query_ts = staged_prices.query_ts
+        )
+    """)
+
+    if PRICE_STORAGE == PRICE_STORAGE_INTERVALS:
+        added = insert_price_intervals(cursor)
+    else:
+        # -------- insert into prices table --------
+        cursor.execute("""
+            INSERT INTO prices_compact (
+                flight_id,
+                query_ts,
+                price,
+                currency_id,
+                days_before_departure,
+                query_dow,
+                query_time_slot
+            )
+            SELECT
+                flight_id,
+                query_ts,
+                price,
+                currency_id,
+                days_before_departure,
+                query_dow,
+                query_time_slot
+            FROM staged_prices
+        """)
+        added = cursor.rowcount
+    if added > 0:
+        update_aggregates(cursor, "staged_prices")
+        bump_data_version(cursor)
+    return added
+
+
+def insert_price_intervals(cursor):
+    '''
+    Folds staged_prices into price_intervals: a price equal to the one of
+    the flight's latest interval extends it, a changed price opens a new
+    interval. Queries already covered by an interval are dropped from
+    staged_prices, so it is left with the observations that were added.
+    Returns their number.
+    '''
+    cursor.execute("""
+        DELETE FROM staged_prices
+        WHERE EXISTS (
+            SELECT 1 FROM price_intervals i
+            WHERE i.flight_id = staged_prices.flight_id
+                AND i.valid_from <= staged_prices.query_ts
+                AND i.valid_to >= staged_prices.query_ts
+        )
+    """)
+    cursor.execute("""
+        SELECT i.flight_id, i.valid_from, i.valid_to, i.price,
+               i.currency_id, i.observations
+        FROM price_intervals i
+        WHERE i.flight_id IN (SELECT flight_id FROM staged_prices)
+            AND i.valid_from = (
+                SELECT MAX(valid_from) FROM price_intervals
+                WHERE flight_id = i.flight_id
+            )
+    """)
+    latest = {row[0]: list(row[1:]) for row in cursor.fetchall()}
+    changed = set()
+    opened = []
+
+    cursor.execute("""
+        SELECT flight_id, query_ts, price, currency_id
+        FROM staged_prices
+        ORDER BY flight_id, query_ts
+    """)
+    staged = cursor.fetchall()
+    for flight_id, query_ts, price, currency_id in staged:
+        interval = latest.get(flight_id)
+        if interval is not None and query_ts < interval[0]:
+            # an observation older than the latest interval gets its own
+            opened.append((flight_id, query_ts, query_ts, price,
+                           currency_id, 1))
+        elif interval is not None and interval[2:4] == [price, currency_id]:
+            interval[1] = query_ts
+            interval[4] += 1
+            changed.add(flight_id)
+        else:
+            if interval is not None and flight_id in changed:
+                opened.append((flight_id, *interval))
+            latest[flight_id] = [query_ts, query_ts, price, currency_id, 1]
+            changed.add(flight_id)
+
+    for flight_id in changed:
+        opened.append((flight_id, *latest[flight_id]))
+    cursor.executemany("""
+        INSERT OR REPLACE INTO price_intervals (
+            flight_id,
+            valid_from,
+            valid_to,
+            price,
+            currency_id,
+            observations
         )
         VALUES (?, ?, ?, ?, ?, ?)
-    """, (
+    """, opened)
+    return len(staged)
+
+
+def bump_data_version(cursor):
+    cursor.execute("""
+        UPDATE data_version
+        SET version = version + 1, updated = ?
+        WHERE id = 1
+    """, (datetime.now().isoformat(),))
+
+
+def bump_data_generation(cursor):
+    # prices were deleted or flight ids reused, readers that keep state
+    # across versions (the fare index) start over
+    cursor.execute("""
+        UPDATE data_version SET generation = generation + 1 WHERE id = 1
+    """)
+
+
+def get_data_version(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT version FROM data_version WHERE id = 1")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def get_data_generation(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT generation FROM data_version WHERE id = 1")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def update_aggregates(cursor, source, weight="1"):
+    '''
+    Adds the prices of `source` (a table shaped like prices_compact) to
+    the running sums and counts of the dashboard aggregate tables, every
+    row counts `weight` times (a column of `source` or a constant)
+    '''
+    for table, keys in PRICE_AGGREGATES:
+        columns = ", ".join(keys)
+        not_null = " AND ".join(f"{key} IS NOT NULL" for key in keys)
+        cursor.execute(f"""
+            INSERT INTO {table} ({columns}, price_sum, price_count)
+            SELECT {columns}, SUM(p.price * {weight}), SUM({weight})
+            FROM {source} p
+            JOIN flights_compact f ON f.id = p.flight_id
+            WHERE p.price IS NOT NULL AND {not_null}
+            GROUP BY {columns}
+            ON CONFLICT({columns}) DO UPDATE SET
+                price_sum = price_sum + excluded.price_sum,
+                price_count = price_count + excluded.price_count
+        """)
+
+
+def interval_days(source="price_intervals"):
+    '''
+    Recursive CTE `days` over the intervals of `source`, a table or
+    subquery shaped like price_intervals: one row per day an interval
+    covers, numbered by `day`. The observations of an interval are spread
+    evenly over its days, DAY_OBSERVATIONS is the share of one day.
+    '''
+    return f"""
+        days(flight_id, query_day, day, days, valid_from,
+             price, currency_id, observations) AS (
+            SELECT p.flight_id, date(p.valid_from, 'unixepoch'), 0,
+                   CAST(julianday(date(p.valid_to, 'unixepoch'))
+                        - julianday(date(p.valid_from, 'unixepoch'))
+                        AS INTEGER) + 1,
+                   p.valid_from, p.price, p.currency_id, p.observations
+            FROM {source} p
+            UNION ALL
+            SELECT flight_id, date(query_day, '+1 day'), day + 1, days,
+                   valid_from, price, currency_id, observations
+            FROM days
+            WHERE day + 1 < days
+        )"""
+
+
+def stage_interval_samples(cursor):
+    '''
+    Expands price_intervals into the temp table interval_samples, shaped
+    like prices_compact plus an `observations` weight: one row per day an
+    interval covers, its observations spread evenly over those days.
+    The query time slot of all samples is the one of valid_from.
+    '''
+    cursor.execute("DROP TABLE IF EXISTS temp.interval_samples")
+    cursor.execute(f"""
+        CREATE TEMP TABLE interval_samples AS
+        WITH RECURSIVE {interval_days()}
+        SELECT
+            d.flight_id,
+            {epoch("d.query_day")} AS query_ts,
+            d.price,
+            d.currency_id,
+            CAST(julianday(date(f.departure_ts, 'unixepoch'))
+                 - julianday(d.query_day) AS INTEGER)
+                AS days_before_departure,
+            (CAST(strftime('%w', d.query_day) AS INTEGER) + 6) % 7
+                AS query_dow,
+            (CAST(strftime('%H', d.valid_from, 'unixepoch') AS INTEGER)
+             + 1) % 24 / 4 AS query_time_slot,
+            {DAY_OBSERVATIONS} AS observations
+        FROM days d
+        JOIN flights_compact f ON f.id = d.flight_id
+        WHERE {DAY_OBSERVATIONS} > 0
+    """)
+
+
+def fill_aggregates(cursor):
+    '''
+    Recomputes all aggregate tables from the full prices history,
+    stored rows and intervals alike
+    '''
+    for table, _ in PRICE_AGGREGATES:
+        cursor.execute(f"DELETE FROM {table}")
+    update_aggregates(cursor, "prices_compact")
+    stage_interval_samples(cursor)
+    update_aggregates(cursor, "interval_samples", "p.observations")
+    cursor.execute("DROP TABLE temp.interval_samples")
+
+
+def rebuild_aggregates(conn):
+    # fill_aggregates in a transaction of its own
+    cursor = conn.cursor()
+    fill_aggregates(cursor)
+    bump_data_version(cursor)
+    conn.commit()
+
+
+def convert_prices_to_intervals(conn, batch_size=BATCH_SIZE):
+    '''
+    Moves the stored prices rows into price_intervals, batch_size flights
+    per transaction. Returns (converted rows, intervals).
+    '''
+    cursor = conn.cursor()
+    converted = 0
+    last_id = -1
+    while True:
+        cursor.execute("""
+            SELECT DISTINCT flight_id FROM prices_compact
+            WHERE flight_id > ?
+            ORDER BY flight_id
+            LIMIT ?
+        """, (last_id, batch_size))
+        flight_ids = [row[0] for row in cursor.fetchall()]
+        if not flight_ids:
+            break
+        last_id = flight_ids[-1]
+
+        marks = ",".join("?" * len(flight_ids))
+        stage_prices(cursor)
+        cursor.execute(f"""
+            INSERT INTO staged_prices
+            SELECT flight_id, query_ts, price, currency_id,
+                   days_before_departure, query_dow, query_time_slot
+            FROM prices_compact
+            WHERE flight_id IN ({marks})
+        """, flight_ids)
+        converted += insert_price_intervals(cursor)
+        cursor.execute(f"""
+            DELETE FROM prices_compact WHERE flight_id IN ({marks})
+        """, flight_ids)
+        bump_data_generation(cursor)
+        conn.commit()
+
+    cursor.execute("SELECT COUNT(*) FROM price_intervals")
+    return converted, cursor.fetchone()[0]
+
+
+def save_flights(conn, all_flights, fare_index=None):
+    flights, prices = flight_rows(all_flights)
+    insert_flight_rows(conn.cursor(), flights, prices)
+    conn.commit()
+    if fare_index is not None:
+        fare_index.refresh(conn)
+
+
+def raw_row(api_response, origin, destination, departure_date,
+            query_time=None, query_date=None):
+    now = query_date or (query_time or datetime.now()).isoformat()
+    raw = canonical_json(api_response)
+    return (
         now,
         origin,
         destination,
         departure_date,
-        compressed,
-        response_hash
-    ))
+        raw,
+        hashlib.sha256(raw).digest()
+    )
+
+
+def insert_raw_rows(cursor, rows, registry=None):
+    '''
+    Stores payloads not seen before (only those get compressed) and one
+    observation per row. Returns the bytes of the new payloads.
+    '''
+    codec = (registry or CodecRegistry(cursor.connection)).default()
+    rows = list(rows)
+    stored = 0
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = rows[start:start + BATCH_SIZE]
+        hashes = list({row[5] for row in batch})
+        cursor.execute(f"""
+            SELECT hash FROM raw_payloads
+            WHERE hash IN ({",".join("?" * len(hashes))})
+        """, hashes)
+        known = {row[0] for row in cursor.fetchall()}
+
+        new_payloads = {}
+        for row in batch:
+            if row[5] not in known and row[5] not in new_payloads:
+                new_payloads[row[5]] = codec.compress(row[4])
+
+        cursor.executemany("""
+            INSERT OR IGNORE INTO raw_payloads (hash, payload, codec, dict_id)
+            VALUES (?, ?, ?, ?)
+        """, [(h, payload, codec.name, codec.dict_id)
+              for h, payload in new_payloads.items()])
+        stored += sum(len(payload) for payload in new_payloads.values())
+        cursor.executemany("""
+            INSERT INTO raw_observations (
+                query_date,
+                origin,
+                destination,
+                departure_date,
+                payload_id
+            )
+            SELECT ?, ?, ?, ?, id FROM raw_payloads WHERE hash = ?
+        """, [(q, o, d, dep, h) for q, o, d, dep, _, h in batch])
+    return stored
+
+
+def save_raw_data(conn, api_response, origin, destination, departure_date):
+    row = raw_row(api_response, origin, destination, departure_date)
+    insert_raw_rows(conn.cursor(), [row])
     conn.commit()
+
+
+def save_raw_data_many(conn, rows, batch_size=BATCH_SIZE):
+    '''
+    Writes raw_row tuples with one commit per batch_size rows
+    '''
+    cursor = conn.cursor()
+    rows = list(rows)
+    for start in range(0, len(rows), batch_size):
+        insert_raw_rows(cursor, rows[start:start + batch_size])
+        conn.commit()
+
+
+class BufferedWriter:
+    """
+    Collects raw responses and parsed flights of a tracker run and writes
+    them in one transaction per database once `max_rows` rows are buffered
+    or `max_seconds` passed since the last flush.
+
+    Markers added with `add_done` are handed to `on_flush` after the rows
+    buffered before them are committed. A FareIndex passed as `fare_index`
+    is refreshed after every commit of prices. `stats` sums up all
+    flushes.
+    """
+
+    def __init__(self, conn, conn_raw, max_rows=BATCH_SIZE, max_seconds=5.0,
+                 on_flush=None, fare_index=None):
+        self.conn = conn
+        self.conn_raw = conn_raw
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.on_flush = on_flush
+        self.fare_index = fare_index
+        self.registry = CodecRegistry(conn_raw)
+        self._raw = []
+        self._flights = []
+        self._prices = []
+        self._done = []
+        self._last_flush = time.monotonic()
+        self.stats = {"flushes": 0, "seconds": 0.0, "raw_rows": 0,
+                      "raw_bytes": 0, "price_rows": 0, "fares_changed": 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+    def __len__(self):
+        return len(self._raw) + len(self._prices)
+
+    def add_raw(self, api_response, origin, destination, departure_date,
+                query_time=None):
+        self._raw.append(raw_row(api_response, origin, destination,
+                                 departure_date, query_time))
+
+    def add_flights(self, all_flights):
+        self.add_rows(*flight_rows(all_flights))
+
+    def add_rows(self, flights, prices):
+        # rows as flight_rows returns them
+        self._flights.extend(flights)
+        self._prices.extend(prices)
+
+    def add_done(self, marker):
+        self._done.append(marker)
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        elapsed = time.monotonic() - self._last_flush
+        if len(self) >= self.max_rows or elapsed >= self.max_seconds:
+            self.flush()
+
+    def flush(self):
+        # every buffer is emptied right after its own commit; a write that
+        # fails is rolled back and keeps its rows for the next flush
+        start = time.perf_counter()
+        raw_rows, price_rows = len(self._raw), len(self._prices)
+        if self._raw:
+            try:
+                raw_bytes = insert_raw_rows(self.conn_raw.cursor(), self._raw,
+                                            self.registry)
+                self.conn_raw.commit()
+            except BaseException:
+                self.conn_raw.rollback()
+                raise
+            self._raw = []
+            self.stats["raw_bytes"] += raw_bytes
+            self.stats["raw_rows"] += raw_rows
+        if self._prices:
+            try:
+                inserted = insert_flight_rows(self.conn.cursor(),
+                                              self._flights, self._prices)
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+            self._flights = []
+            self._prices = []
+            self.stats["price_rows"] += inserted
+            if self.fare_index is not None:
+                self.stats["fares_changed"] += self.fare_index.refresh(
+                    self.conn)
+        if raw_rows or price_rows:
+            self.stats["flushes"] += 1
+            self.stats["seconds"] += time.perf_counter() - start
+        done, self._done = self._done, []
+        if done and self.on_flush:
+            self.on_flush(done)
+        self._last_flush = time.monotonic()
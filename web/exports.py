@@ -0,0 +1,245 @@
+import io
+import csv
+import json
+import zlib
+
+from app_utilities import DAY_AFTER, check_dates, flight_filters
+from db import epoch, iso
+
+
+# --- Streaming ---
+EXPORT_BATCH = 5000     # rows read per query, the memory bound of a stream
+GZIP_LEVEL = 6
+
+# keyset of a resume position past every price of a flight
+LAST_TS = 2 ** 63 - 1
+
+PRICE_COLUMNS = [
+    "flight_id", "query_date", "valid_to", "observations", "price",
+    "currencyCode", "currencySymbol", "days_before_departure", "query_dow",
+    "query_time_slot",
+]
+
+
+def _flight_ids(filters):
+    # condition on p.flight_id, flights_compact ids of the filters
+    if not filters:
+        return []
+    return [f"""p.flight_id IN (
+        SELECT f.id FROM flights_compact f WHERE {" AND ".join(filters)})"""]
+
+
+def _batches(conn, sql, bind, position, batch_size):
+    '''
+    Runs a keyset query batch after batch until it comes back short;
+    bind(position, limit) returns the parameters of a batch. The query
+    selects the two keyset columns last, they are cut off. Every batch is
+    its own read, the tracker's writes go on in between.
+    '''
+    cursor = conn.cursor()
+    cursor.row_factory = None   # plain tuples, not sqlite3.Row
+    while True:
+        rows = cursor.execute(sql, bind(position, batch_size)).fetchall()
+        if rows:
+            yield [row[:-2] for row in rows]
+            position = rows[-1][-2:]
+        if len(rows) < batch_size:
+            return
+
+
+def flight_export(pool, origin=None, destination=None, date_from=None,
+                  date_to=None, after=None, batch_size=EXPORT_BATCH):
+    '''
+    Rows of the flights view by departure, optionally limited to a route
+    and a departure window. `after` is the flight id of the last row
+    received, the export resumes behind it.
+
+    Returns (columns, batches); batches is a generator of row lists that
+    holds one pooled connection until it is exhausted or closed.
+    Raises ValueError for an unknown `after` or an invalid date.
+    '''
+    dates = check_dates(date_from=date_from, date_to=date_to)
+    filters, params = flight_filters(origin, destination, **dates)
+
+    with pool.connection() as conn:
+        position = (-LAST_TS, 0)
+        if after:
+            row = conn.execute("""
+                SELECT f.departure_ts, f.id
+                FROM flight_keys k
+                JOIN flights_compact f ON f.id = k.id
+                WHERE k.key = ?
+            """, (after,)).fetchone()
+            if row is None:
+                raise ValueError(f"unknown flight {after}")
+            position = tuple(row)
+        columns = [column[0] for column in conn.execute(
+            "SELECT * FROM flights LIMIT 0").description]
+
+    # page the compact rows on the departure index, then join the view
+    where = " AND ".join(filters + ["(f.departure_ts, f.id) > (?, ?)"])
+    sql = f"""
+        WITH page AS (
+            SELECT f.id, f.departure_ts
+            FROM flights_compact f
+            WHERE {where}
+            ORDER BY f.departure_ts, f.id
+            LIMIT ?
+        )
+        SELECT v.*, page.departure_ts, page.id
+        FROM page
+        JOIN flight_keys k ON k.id = page.id
+        JOIN flights v ON v.id = k.key
+        ORDER BY page.departure_ts, page.id
+    """
+
+    def bind(position, limit):
+        return params + list(position) + [limit]
+
+    def batches():
+        with pool.connection() as conn:
+            yield from _batches(conn, sql, bind, position, batch_size)
+
+    return columns, batches()
+
+
+def price_export(pool, origin=None, destination=None, date_from=None,
+                 date_to=None, query_from=None, query_to=None, after=None,
+                 after_query_date=None, batch_size=EXPORT_BATCH):
+    '''
+    Every price observation by flight and query time: the prices rows,
+    valid_to equal to query_date and one observation each, and the price
+    intervals with the queries they stand for. Route and departure
+    filters select the flights, query_from/query_to the query dates (an
+    interval overlapping them is included).
+
+    `after` and `after_query_date` are flight_id and query_date of the
+    last row received, without a query date the export resumes with the
+    next flight. Returns (columns, batches) as flight_export does.
+    '''
+    dates = check_dates(date_from=date_from, date_to=date_to,
+                         query_from=query_from, query_to=query_to)
+    query_from, query_to = dates.pop("query_from"), dates.pop("query_to")
+    filters, params = flight_filters(origin, destination, **dates)
+
+    row_filters = _flight_ids(filters)
+    interval_filters = _flight_ids(filters)
+    query_params = []
+    if query_from:
+        row_filters.append(f"p.query_ts >= {epoch('?')}")
+        interval_filters.append(f"p.valid_to >= {epoch('?')}")
+        query_params.append(query_from)
+    if query_to:
+        row_filters.append(f"p.query_ts < {epoch(DAY_AFTER)}")
+        interval_filters.append(f"p.valid_from < {epoch(DAY_AFTER)}")
+        query_params.append(query_to)
+
+    with pool.connection() as conn:
+        position = (0, 0)
+        if after:
+            row = conn.execute(f"""
+                SELECT id, {epoch('?')} FROM flight_keys WHERE key = ?
+            """, (after_query_date, after)).fetchone()
+            if row is None:
+                raise ValueError(f"unknown flight {after}")
+            flight_id, query_ts = row
+            if not after_query_date:
+                query_ts = LAST_TS
+            elif query_ts is None:
+                raise ValueError(f"invalid query date {after_query_date}")
+            position = (flight_id, query_ts)
+
+    # both tables are read in primary key order and merged without a
+    # sort; the keyset applies to each of them
+    row_where = " AND ".join(
+        row_filters + ["(p.flight_id, p.query_ts) > (?, ?)"])
+    interval_where = " AND ".join(
+        interval_filters + ["(p.flight_id, p.valid_from) > (?, ?)"])
+    sql = f"""
+        SELECT
+            k.key,
+            {iso("p.query_ts")},
+            {iso("p.query_ts")},
+            1,
+            p.price,
+            c.code,
+            c.symbol,
+            p.days_before_departure,
+            p.query_dow,
+            p.query_time_slot,
+            p.flight_id,
+            p.query_ts
+        FROM prices_compact p
+        JOIN flight_keys k ON k.id = p.flight_id
+        LEFT JOIN currencies c ON c.id = p.currency_id
+        WHERE {row_where}
+        UNION ALL
+        SELECT
+            k.key,
+            {iso("p.valid_from")},
+            {iso("p.valid_to")},
+            p.observations,
+            p.price,
+            c.code,
+            c.symbol,
+            NULL,
+            NULL,
+            NULL,
+            p.flight_id,
+            p.valid_from
+        FROM price_intervals p
+        JOIN flight_keys k ON k.id = p.flight_id
+        LEFT JOIN currencies c ON c.id = p.currency_id
+        WHERE {interval_where}
+        ORDER BY 11, 12
+        LIMIT ?
+    """
+
+    def bind(position, limit):
+        branch = params + query_params + list(position)
+        return branch + branch + [limit]
+
+    def batches():
+        with pool.connection() as conn:
+            yield from _batches(conn, sql, bind, position, batch_size)
+
+    return PRICE_COLUMNS, batches()
+
+
+def csv_chunks(columns, batches):
+    # the header goes out before the first query runs
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+    yield buffer.getvalue().encode("utf-8")
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+
+
+def ndjson_chunks(columns, batches):
+    # json.dumps with options builds a new encoder per call
+    encode = json.JSONEncoder(separators=(",", ":")).encode
+    for rows in batches:
+        yield "".join(
+            encode(dict(zip(columns, row))) + "\n" for row in rows
+        ).encode("utf-8")
+
+
+def gzip_chunks(chunks, level=GZIP_LEVEL):
+    '''
+    One gzip stream over all chunks. Every chunk is flushed, so the
+    client can decode each batch as soon as it arrives.
+    '''
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+EXPORT_FORMATS = {
+    "csv": (csv_chunks, "text/csv"),
+    "ndjson": (ndjson_chunks, "application/x-ndjson"),
+}
@@ -0,0 +1,238 @@
+import math
+import threading
+from datetime import date, timedelta
+
+from db import get_data_generation, get_data_version
+
+
+DAY_SECONDS = 24 * 60 * 60
+EPOCH_DAY = date(1970, 1, 1)
+NO_FARE = (math.inf, -1)
+
+# days added on both sides when a route's range has to grow
+RANGE_SLACK = 31
+
+# (table, query time column) of the stored prices
+PRICE_SOURCES = [
+    ("prices_compact", "query_ts"),
+    ("price_intervals", "valid_from"),
+]
+
+
+def day_number(value):
+    return (value - EPOCH_DAY).days
+
+
+class MinTree:
+    """
+    Segment tree over a fixed number of leaves holding (price, day)
+    pairs. Setting a leaf and the minimum of a leaf range are O(log n).
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.nodes = [NO_FARE] * (2 * size)
+
+    def set(self, leaf, value):
+        i = leaf + self.size
+        self.nodes[i] = value
+        while i > 1:
+            i //= 2
+            self.nodes[i] = min(self.nodes[2 * i], self.nodes[2 * i + 1])
+
+    def min(self, first, last):
+        # leaves first..last inclusive
+        result = NO_FARE
+        lo, hi = first + self.size, last + self.size + 1
+        while lo < hi:
+            if lo & 1:
+                result = min(result, self.nodes[lo])
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                result = min(result, self.nodes[hi])
+            lo //= 2
+            hi //= 2
+        return result
+
+
+class RouteFares:
+    """
+    The latest price of every flight of one route, by departure day, and
+    a MinTree over the cheapest flight of each day
+    """
+
+    def __init__(self):
+        self.first_day = None
+        self.tree = MinTree(0)
+        self.days = {}          # day -> {flight key: price}
+
+    def _grow(self, day):
+        first = min(self.days, default=day)
+        last = max(self.days, default=day)
+        self.first_day = min(first, day) - RANGE_SLACK
+        self.tree = MinTree(max(last, day) + RANGE_SLACK - self.first_day + 1)
+        for known in self.days:
+            self._update_leaf(known)
+
+    def _update_leaf(self, day):
+        flights = self.days.get(day)
+        cheapest = min(flights.values()) if flights else math.inf
+        self.tree.set(day - self.first_day,
+                      (cheapest, day) if flights else NO_FARE)
+
+    def set_price(self, day, key, price):
+        if self.first_day is None or not \
+                0 <= day - self.first_day < self.tree.size:
+            self._grow(day)
+        flights = self.days.setdefault(day, {})
+        if price is None:
+            flights.pop(key, None)
+        else:
+            flights[key] = price
+        self._update_leaf(day)
+
+    def cheapest(self, first_day=None, last_day=None):
+        '''
+        (price, day, flight key) of the cheapest departure between the
+        days, both included, or None
+        '''
+        if self.first_day is None:
+            return None
+        first = max(0, (first_day if first_day is not None
+                        else self.first_day) - self.first_day)
+        last = min(self.tree.size - 1, (last_day if last_day is not None
+                                        else math.inf) - self.first_day)
+        if first > last:
+            return None
+        price, day = self.tree.min(first, int(last))
+        if day < 0:
+            return None
+        flights = self.days[day]
+        key = min(flights, key=flights.get)
+        return price, day, key
+
+
+class FareIndex:
+    """
+    In-memory cheapest-date search over the latest observed price of
+    every flight, one RouteFares per route.
+
+    `refresh` brings the index up to date with the database. It reads
+    only the price rows added since the previous refresh, by rowid, and
+    does nothing while the data_version that save_flights bumps is
+    unchanged, so it can run before every query. Queries then answer
+    from memory. A new data generation (prices deleted, flight ids
+    reused) rebuilds the index.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.routes = {}        # (origin, destination) -> RouteFares
+        self.version = None
+        self.generation = None
+        self._rowids = {}       # price table -> highest rowid applied
+        self._latest = {}       # flight id -> query time of its price
+
+    def refresh(self, conn):
+        '''
+        Applies the prices added since the last refresh, returns the
+        number of flights whose price changed
+        '''
+        version = get_data_version(conn)
+        generation = get_data_generation(conn)
+        with self._lock:
+            if version == self.version and generation == self.generation:
+                return 0
+            if self.version is not None and (version < self.version
+                                             or generation != self.generation):
+                # another database or a reset one
+                self._reset()
+            changed = self._apply(conn)
+            self.version = version
+            self.generation = generation
+            return changed
+
+    def _apply(self, conn):
+        routes = {
+            route_id: (origin, destination)
+            for route_id, origin, destination in conn.execute("""
+                SELECT r.id, src.iataCode, dst.iataCode
+                FROM routes r
+                JOIN airports src ON src.id = r.origin_id
+                JOIN airports dst ON dst.id = r.destination_id
+            """)
+        }
+        changed = 0
+        for table, time_column in PRICE_SOURCES:
+            # rows added up to now, later ones wait for the next refresh;
+            # replayed rows may be older than the price a flight has
+            first = self._rowids.get(table, 0)
+            last = conn.execute(
+                f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+            if last <= first:
+                continue
+            # the latest price per flight among the new rows, a row taking
+            # MAX() comes with the price of that row; an interval extended
+            # in place keeps its price
+            rows = conn.execute(f"""
+                SELECT p.flight_id, MAX(p.{time_column}), p.price, k.key,
+                       f.route_id, f.departure_ts
+                FROM {table} p
+                JOIN flights_compact f ON f.id = p.flight_id
+                JOIN flight_keys k ON k.id = p.flight_id
+                WHERE p.rowid > ? AND p.rowid <= ?
+                GROUP BY p.flight_id
+            """, (first, last))
+            for flight_id, ts, price, key, route_id, departure_ts in rows:
+                if ts <= self._latest.get(flight_id, -1) \
+                        or route_id not in routes:
+                    continue
+                self._latest[flight_id] = ts
+                route = self.routes.get(routes[route_id])
+                if route is None:
+                    route = self.routes[routes[route_id]] = RouteFares()
+                route.set_price(departure_ts // DAY_SECONDS, key, price)
+                changed += 1
+            self._rowids[table] = last
+        return changed
+
+    def cheapest_date(self, origin, destination, date_from=None,
+                      date_to=None):
+        '''
+        The cheapest departure of a route between two dates (both
+        included) as a dict with date, price and flight_id, or None
+        '''
+        with self._lock:
+            route = self.routes.get((origin.upper(), destination.upper()))
+            found = route and route.cheapest(
+                date_from and day_number(date_from),
+                date_to and day_number(date_to))
+        if not found:
+            return None
+        price, day, key = found
+        return {
+            "origin": origin.upper(),
+            "destination": destination.upper(),
+            "date": (EPOCH_DAY + timedelta(day)).isoformat(),
+            "price": price,
+            "flight_id": key,
+        }
+
+    def cheapest_destinations(self, origin, date_from=None, date_to=None,
+                              limit=None):
+        '''
+        The cheapest departure to every destination of `origin` between
+        two dates, cheapest first
+        '''
+        origin = origin.upper()
+        with self._lock:
+            destinations = [destination for (src, destination)
+                            in self.routes if src == origin]
+        found = [self.cheapest_date(origin, destination, date_from, date_to)
+                 for destination in destinations]
+        found = sorted((f for f in found if f), key=lambda f: f["price"])
+        return found[:limit] if limit else found
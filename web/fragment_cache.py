@@ -0,0 +1,109 @@
+import os
+import time
+import sqlite3
+
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DB_PATH_CACHE = os.path.join(BASE_DIR, "data", "fragment_cache.db")
+
+# --- Eviction ---
+MAX_ENTRIES = 64
+TTL_SECONDS = 24 * 60 * 60
+
+
+class FragmentCache:
+    """
+    Rendered page fragments keyed by (name, data version). The cache is a
+    SQLite file, so every gunicorn worker and the tracker's pre-warm step
+    share it. Entries older than `ttl` are dropped and the least recently
+    used ones are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, db_path=DB_PATH_CACHE, max_entries=MAX_ENTRIES,
+                 ttl=TTL_SECONDS):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = self._connect()
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS fragments (
+            name TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            value TEXT NOT NULL,
+            created REAL NOT NULL,
+            last_used REAL NOT NULL,
+
+            PRIMARY KEY(name, version)
+            )
+        """)
+        conn.commit()
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get(self, name, version):
+        conn = self._connect()
+        try:
+            now = time.time()
+            row = conn.execute("""
+                SELECT value FROM fragments
+                WHERE name = ? AND version = ? AND created > ?
+            """, (name, version, now - self.ttl)).fetchone()
+            if row is None:
+                return None
+            conn.execute("""
+                UPDATE fragments SET last_used = ?
+                WHERE name = ? AND version = ?
+            """, (now, name, version))
+            conn.commit()
+            return row[0]
+        finally:
+            conn.close()
+
+    def set(self, name, version, value):
+        conn = self._connect()
+        try:
+            now = time.time()
+            conn.execute("""
+                INSERT OR REPLACE INTO fragments (
+                    name, version, value, created, last_used
+                )
+                VALUES (?, ?, ?, ?, ?)
+            """, (name, version, value, now, now))
+            # older versions of the same fragment are never read again
+            conn.execute("""
+                DELETE FROM fragments WHERE name = ? AND version < ?
+            """, (name, version))
+            self._evict(conn, now)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM fragments WHERE created <= ?",
+                     (now - self.ttl,))
+        conn.execute("""
+            DELETE FROM fragments WHERE rowid IN (
+                SELECT rowid FROM fragments
+                ORDER BY last_used DESC
+                LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+
+    def get_or_render(self, name, version, render):
+        value = self.get(name, version)
+        if value is None:
+            value = render()
+            self.set(name, version, value)
+        return value
+
+    def clear(self):
+        conn = self._connect()
+        conn.execute("DELETE FROM fragments")
+        conn.commit()
+        conn.close()
@@ -0,0 +1,48 @@
+'''
+gunicorn settings of the dashboard, start it from web/ with
+
+    gunicorn app:app
+
+The app is imported once in the master and the workers are forked from
+it, so they start with the modules already loaded instead of importing
+flask, pandas and plotly each on its own.
+'''
+import os
+
+
+bind = os.environ.get("FLIGHTTRACKER_BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("FLIGHTTRACKER_WORKERS", 2))
+threads = 4
+
+# --- Fork mode ---
+preload_app = True
+# modules the app only imports on first use, loaded before the fork
+WARM_MODULES = ["pandas", "plotly", "plotly.offline"]
+
+
+def when_ready(server):
+    # runs in the master after the preload, before the first fork
+    import importlib
+    from contextlib import closing
+
+    import app
+    import app_utilities
+    from db import connect_db
+
+    for name in WARM_MODULES:
+        importlib.import_module(name)
+    server.log.info("Warmed %s", ", ".join(WARM_MODULES))
+
+    # the workers inherit the built fare index and only apply new prices,
+    # the connection is closed before the fork
+    if os.path.exists(app_utilities.DB_PATH):
+        with closing(connect_db(app_utilities.DB_PATH)) as conn:
+            app.fare_index.refresh(conn)
+        server.log.info("Built the fare index")
+
+
+def post_fork(server, worker):
+    # sqlite connections must not cross a fork, a worker opens its own
+    import app_utilities
+
+    app_utilities._pools.clear()
@@ -0,0 +1,224 @@
+import argparse
+
+import db
+import raw_codecs
+import replay
+
+
+def migrate_raw(args):
+    conn = db.connect_db_raw(args.db_raw)
+    migrated, payloads = db.migrate_raw_api_responses(conn)
+    print(f"Migrated {migrated} raw responses into {payloads} payloads")
+    conn.close()
+
+
+def recompress_raw(args):
+    conn = db.connect_db_raw(args.db_raw)
+    registry = raw_codecs.CodecRegistry(conn)
+    dict_id = raw_codecs.train_dictionary(conn, registry, args.samples,
+                                          args.dict_size)
+    codec = registry.get(raw_codecs.CODEC_ZSTD_DICT, dict_id)
+    stats = raw_codecs.recompress_payloads(conn, codec, registry)
+    if args.vacuum:
+        conn.execute("VACUUM")
+    conn.close()
+
+    mib = stats["raw_bytes"] / 2 ** 20
+    print(f"Recompressed {stats['payloads']} payloads "
+          f"({mib:.1f} MiB json) with dictionary {dict_id}")
+    print(f"Size before: {stats['bytes_before']} bytes")
+    print(f"Size after:  {stats['bytes_after']} bytes "
+          f"({stats['bytes_after'] / max(stats['bytes_before'], 1):.1%})")
+    for label, key in [("Old decode", "old_decode_seconds"),
+                       ("Encode", "encode_seconds"),
+                       ("Decode", "decode_seconds")]:
+        print(f"{label}: {mib / max(stats[key], 1e-9):.1f} MiB/s")
+
+
+def migrate_schema(args):
+    # connect_db migrates an old database on first use
+    conn = db.connect_db(args.db)
+    if args.vacuum:
+        conn.execute("VACUUM")
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    print(f"{args.db} is at schema version {version}")
+    conn.close()
+
+
+def rebuild_aggregates(args):
+    conn = db.connect_db(args.db)
+    db.rebuild_aggregates(conn)
+    for table, _ in db.PRICE_AGGREGATES:
+        count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        print(f"{table}: {count} buckets")
+    conn.close()
+
+
+def prices_to_intervals(args):
+    conn = db.connect_db(args.db)
+    converted, intervals = db.convert_prices_to_intervals(conn)
+    if args.vacuum:
+        conn.execute("VACUUM")
+    conn.close()
+    print(f"Converted {converted} prices into {intervals} price intervals")
+
+
+def replay_raw(args):
+    conn = db.connect_db(args.db)
+    conn_raw = db.connect_db_raw(args.db_raw)
+    replay.connect_checkpoint(conn)
+    if args.fresh:
+        replay.reset_derived_tables(conn)
+    try:
+        observations, rows, seconds = replay.replay(
+            conn, conn_raw, chunk_size=args.chunk_size,
+            workers=args.workers)
+    except ValueError as e:
+        raise SystemExit(f"{e} with replay --fresh")
+    print(f"Replayed {observations} observations into {rows} prices "
+          f"in {seconds:.1f}s ({observations / max(seconds, 1e-9):.0f} "
+          f"observations/s, {rows / max(seconds, 1e-9):.0f} rows/s)")
+    conn.close()
+    conn_raw.close()
+
+
+def export_columnar(args):
+    import columnar
+
+    export_dir = args.export_dir or columnar.EXPORT_DIR
+    conn = db.connect_db(args.db)
+    exported = columnar.export_prices(conn, export_dir)
+    print(f"Exported {exported} prices to {export_dir}")
+    conn.close()
+
+
+def plan_refresh(args):
+    from refresh_planner import RefreshPlanner
+    from scheduler import (DB_PATH_SCHEDULER, Scheduler,
+                           connect_scheduler_db, load_routes)
+    import tracker_main
+
+    routes = load_routes()
+    conn = db.connect_db(args.db)
+    scheduler = Scheduler(connect_scheduler_db(args.db_scheduler
+                                               or DB_PATH_SCHEDULER))
+    tiers = scheduler.due_jobs(routes)
+    planner = RefreshPlanner(conn, budget=args.budget,
+                             window_days=args.window_days
+                             or tracker_main.window_days)
+    scheduler.planner = planner
+    planned = scheduler.due_jobs(routes)
+    print(f"Refresh tiers: {len(tiers)} dates, "
+          f"{planner.requests(tiers)} requests")
+    print(f"Planner:       {len(planned)} dates, "
+          f"{planner.requests(planned)} requests")
+    for job in planned[:args.show]:
+        print(f"  {job.origin}-{job.destination} {job.departure_date}")
+    conn.close()
+
+
+def tracker_runs(args):
+    from run_metrics import recent_runs
+    from scheduler import DB_PATH_SCHEDULER, connect_scheduler_db
+
+    conn = connect_scheduler_db(args.db_scheduler or DB_PATH_SCHEDULER)
+    print(f"{'started':19} {'status':10} {'jobs':>5} {'reqs':>5} "
+          f"{'retry':>5} {'p95 ms':>7} {'crawl s':>8} {'parse s':>8} "
+          f"{'db s':>6} {'prices':>7} {'total s':>8}")
+    for run in reversed(recent_runs(conn, args.last)):
+        print(f"{run['started']:19} {run['status']:10} {run['jobs']:5} "
+              f"{run['requests']:5} {run['retries']:5} "
+              f"{run['fetch_p95_ms'] or 0:7.0f} "
+              f"{run['crawl_seconds'] or 0:8.1f} "
+              f"{run['parse_seconds'] or 0:8.2f} "
+              f"{run['db_write_seconds'] or 0:6.2f} "
+              f"{run['rows_inserted']:7} {run['seconds'] or 0:8.1f}")
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FlightTracker maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser(
+        "migrate-raw",
+        help="move raw_api_responses into the content-addressed raw store")
+    p.add_argument("--db-raw", default=db.DB_PATH_RAW)
+    p.set_defaults(func=migrate_raw)
+
+    p = subparsers.add_parser(
+        "recompress-raw",
+        help="train a zstd dictionary and recompress the raw payloads")
+    p.add_argument("--db-raw", default=db.DB_PATH_RAW)
+    p.add_argument("--samples", type=int, default=raw_codecs.DICT_SAMPLES)
+    p.add_argument("--dict-size", type=int, default=raw_codecs.DICT_SIZE)
+    p.add_argument("--vacuum", action="store_true",
+                   help="reclaim the freed pages afterwards")
+    p.set_defaults(func=recompress_raw)
+
+    p = subparsers.add_parser(
+        "migrate-schema",
+        help="convert flights.db to the integer keyed schema")
+    p.add_argument("--db", default=db.DB_PATH)
+    p.add_argument("--vacuum", action="store_true",
+                   help="reclaim the freed pages afterwards")
+    p.set_defaults(func=migrate_schema)
+
+    p = subparsers.add_parser(
+        "rebuild-aggregates",
+        help="backfill the dashboard aggregate tables from all prices")
+    p.add_argument("--db", default=db.DB_PATH)
+    p.set_defaults(func=rebuild_aggregates)
+
+    p = subparsers.add_parser(
+        "prices-to-intervals",
+        help="fold the stored prices rows into change-only price intervals")
+    p.add_argument("--db", default=db.DB_PATH)
+    p.add_argument("--vacuum", action="store_true",
+                   help="reclaim the freed pages afterwards")
+    p.set_defaults(func=prices_to_intervals)
+
+    p = subparsers.add_parser(
+        "replay",
+        help="rebuild flights and prices from the raw store")
+    p.add_argument("--db", default=db.DB_PATH)
+    p.add_argument("--db-raw", default=db.DB_PATH_RAW)
+    p.add_argument("--chunk-size", type=int, default=replay.CHUNK_SIZE)
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--fresh", action="store_true",
+                   help="empty flights, prices and aggregates first")
+    p.set_defaults(func=replay_raw)
+
+    p = subparsers.add_parser(
+        "export-columnar",
+        help="append new prices to the partitioned parquet export")
+    p.add_argument("--db", default=db.DB_PATH)
+    p.add_argument("--export-dir", default=None)
+    p.set_defaults(func=export_columnar)
+
+    p = subparsers.add_parser(
+        "plan-refresh",
+        help="show the requests the refresh planner would make now")
+    p.add_argument("--db", default=db.DB_PATH)
+    p.add_argument("--db-scheduler", default=None)
+    p.add_argument("--budget", type=int, default=None,
+                   help="most requests to plan")
+    p.add_argument("--window-days", type=int, default=None,
+                   help="consecutive dates asked for in one request, "
+                        "the tracker's setting by default")
+    p.add_argument("--show", type=int, default=20,
+                   help="number of planned requests to list")
+    p.set_defaults(func=plan_refresh)
+
+    p = subparsers.add_parser(
+        "runs", help="timings and counts of the last tracker runs")
+    p.add_argument("--db-scheduler", default=None)
+    p.add_argument("--last", type=int, default=10)
+    p.set_defaults(func=tracker_runs)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
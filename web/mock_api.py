@@ -0,0 +1,274 @@
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import date, timedelta
+
+from flask import Flask, jsonify, request
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+import db
+import synthetic
+from raw_codecs import CodecRegistry
+
+
+# --- Defaults ---
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8099
+DEFAULT_LIMIT = 16
+RETRY_AFTER = 1  # seconds, sent with every 429
+
+
+class RawReplay:
+    """
+    Serves the responses recorded in the raw store. Every route and
+    departure day replays its observations in recording order, one per
+    request, and keeps repeating the last one.
+    """
+
+    def __init__(self, db_path_raw):
+        self.db_path_raw = db_path_raw
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._served = {}
+
+        conn = db.connect_db_raw(db_path_raw)
+        self.registry = CodecRegistry(conn)
+        self.index = {}
+        cursor = conn.execute("""
+            SELECT origin, destination, departure_date, payload_id
+            FROM raw_observations
+            ORDER BY id
+        """)
+        for origin, destination, departure_date, payload_id in cursor:
+            key = (origin, destination, departure_date)
+            self.index.setdefault(key, []).append(payload_id)
+        conn.close()
+
+    def _conn(self):
+        # sqlite connections stay in the thread that opened them
+        if not hasattr(self._local, "conn"):
+            self._local.conn = db.connect_db_raw(self.db_path_raw)
+        return self._local.conn
+
+    def fares(self, origin, destination, day):
+        key = (origin, destination, day.isoformat())
+        payload_ids = self.index.get(key)
+        if not payload_ids:
+            return []
+        with self._lock:
+            position = self._served.get(key, 0)
+            self._served[key] = position + 1
+        payload_id = payload_ids[min(position, len(payload_ids) - 1)]
+        codec, dict_id, payload = self._conn().execute("""
+            SELECT codec, dict_id, payload FROM raw_payloads WHERE id = ?
+        """, (payload_id,)).fetchone()
+        data = json.loads(self.registry.decompress(codec, dict_id, payload))
+        return data.get("fares", [])
+
+
+class SyntheticFares:
+    # deterministic fares of synthetic.py, priced as of today
+
+    def fares(self, origin, destination, day):
+        return synthetic.one_way_fares(origin, destination, day)["fares"]
+
+
+class MockApi:
+    """
+    Stand-in for the oneWayFares endpoint. Every request waits `latency`
+    (+- `jitter`) seconds, then fails with a 5xx at `error_rate`, with a
+    429 at `rate_limit_rate` or when more than `throttle` requests per
+    second arrive (a token bucket with a burst of `throttle`).
+    """
+
+    def __init__(self, source=None, latency=0.0, jitter=0.0, error_rate=0.0,
+                 rate_limit_rate=0.0, throttle=None, seed=None):
+        self.source = source or SyntheticFares()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.throttle = throttle
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = float(throttle or 0)
+        self._updated = time.monotonic()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stats = {"requests": 0, "ok": 0, "errors": 0,
+                          "rate_limited": 0, "throttled": 0}
+            self.notifications = []
+
+    def notify(self, topic, headers, message):
+        # ntfy stand-in, keeps what the tracker would have published
+        with self._lock:
+            self.notifications.append({
+                "topic": topic,
+                "title": headers.get("Title"),
+                "tags": headers.get("Tags"),
+                "message": message,
+            })
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _roll(self):
+        with self._lock:
+            return self._random.random()
+
+    def _take_token(self):
+        if not self.throttle:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.throttle, self._tokens
+                               + (now - self._updated) * self.throttle)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def _delay(self):
+        if self.latency or self.jitter:
+            with self._lock:
+                spread = self._random.uniform(-self.jitter, self.jitter)
+            time.sleep(max(0.0, self.latency + spread))
+
+    def response(self, args):
+        '''
+        Returns (status, headers, body) for the query arguments of a
+        oneWayFares request
+        '''
+        self._count("requests")
+        self._delay()
+
+        if not self._take_token():
+            self._count("throttled")
+            return 429, {"Retry-After": str(RETRY_AFTER)}, \
+                {"message": "Too Many Requests"}
+        roll = self._roll()
+        if roll < self.error_rate:
+            self._count("errors")
+            return 503, {}, {"message": "Service Unavailable"}
+        if roll < self.error_rate + self.rate_limit_rate:
+            self._count("rate_limited")
+            return 429, {"Retry-After": str(RETRY_AFTER)}, \
+                {"message": "Too Many Requests"}
+
+        try:
+            origin = args["departureAirportIataCode"]
+            destination = args["arrivalAirportIataCode"]
+            day_from = date.fromisoformat(args["outboundDepartureDateFrom"])
+            day_to = date.fromisoformat(
+                args.get("outboundDepartureDateTo") or day_from.isoformat())
+            limit = int(args.get("limit", DEFAULT_LIMIT))
+            offset = int(args.get("offset", 0))
+        except (KeyError, ValueError):
+            self._count("errors")
+            return 400, {}, {"message": "Bad Request"}
+
+        fares = []
+        day = day_from
+        while day <= day_to:
+            fares.extend(self.source.fares(origin, destination, day))
+            day += timedelta(days=1)
+        page = fares[offset:offset + limit]
+
+        self._count("ok")
+        return 200, {}, {
+            "arrivalAirportCategories": None,
+            "fares": page,
+            "nextPage": offset + limit if offset + limit < len(fares)
+            else None,
+            "size": len(page),
+            "total": len(fares),
+        }
+
+
+def create_app(mock):
+    app = Flask(__name__)
+
+    @app.route("/farfnd/3/oneWayFares")
+    def one_way_fares():
+        status, headers, body = mock.response(request.args)
+        return jsonify(body), status, headers
+
+    @app.route("/_mock/stats")
+    def stats():
+        return jsonify(mock.stats)
+
+    @app.route("/_mock/ntfy/<topic>", methods=["POST"])
+    def ntfy(topic):
+        mock.notify(topic, request.headers,
+                    request.get_data().decode("utf-8"))
+        return jsonify({"topic": topic})
+
+    @app.route("/_mock/ntfy")
+    def notifications():
+        return jsonify(mock.notifications)
+
+    @app.route("/_mock/reset", methods=["POST"])
+    def reset():
+        mock.reset()
+        return jsonify(mock.stats)
+
+    return app
+
+
+class _QuietHandler(WSGIRequestHandler):
+    # no access log line per request of a load test
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def serve_in_thread(mock, host=DEFAULT_HOST, port=0):
+    '''
+    Starts the mock on a background thread, port 0 picks a free port.
+    Returns (server, base_url); stop it with server.shutdown().
+    '''
+    server = make_server(host, port, create_app(mock), threaded=True,
+                         request_handler=_QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Local stand-in for the Ryanair oneWayFares api, run "
+                    "the tracker with FLIGHTTRACKER_API_URL pointing here "
+                    "and FLIGHTTRACKER_NTFY_URL at /_mock/ntfy/<topic>")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--replay", metavar="RAW_DB", default=None,
+                        help="serve the responses of a raw store instead "
+                             "of synthetic fares")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="milliseconds every response is delayed")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="milliseconds of random +- latency")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests answered with 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0,
+                        help="fraction of requests answered with 429")
+    parser.add_argument("--throttle", type=float, default=None,
+                        help="requests per second before answering 429")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    source = RawReplay(args.replay) if args.replay else None
+    mock = MockApi(source, latency=args.latency / 1000,
+                   jitter=args.jitter / 1000, error_rate=args.error_rate,
+                   rate_limit_rate=args.rate_limit_rate,
+                   throttle=args.throttle, seed=args.seed)
+    create_app(mock).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import gzip
+import time
+import random
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:  # raw store falls back to gzip
+    zstandard = None
+
+
+CODEC_GZIP = "gzip"
+CODEC_ZSTD_DICT = "zstd-dict"
+
+ZSTD_LEVEL = 9
+DICT_SIZE = 64 * 1024
+DICT_SAMPLES = 5000
+
+
+class GzipCodec:
+    name = CODEC_GZIP
+    dict_id = None
+
+    def compress(self, raw: bytes) -> bytes:
+        return gzip.compress(raw)
+
+    def decompress(self, blob: bytes) -> bytes:
+        return gzip.decompress(blob)
+
+
+class ZstdDictCodec:
+    """
+    zstd with a dictionary trained on earlier responses. The responses
+    are small and alike, so most of their bytes are found in the
+    dictionary instead of being repeated in every blob.
+    """
+    name = CODEC_ZSTD_DICT
+
+    def __init__(self, dict_id, dict_data, level=ZSTD_LEVEL):
+        if zstandard is None:
+            raise RuntimeError("zstandard is required for the zstd-dict codec")
+        self.dict_id = dict_id
+        zstd_dict = zstandard.ZstdCompressionDict(dict_data)
+        zstd_dict.precompute_compress(level=level)
+        self._compressor = zstandard.ZstdCompressor(
+            level=level, dict_data=zstd_dict, write_content_size=True,
+            write_checksum=False, write_dict_id=False)
+        self._decompressor = zstandard.ZstdDecompressor(dict_data=zstd_dict)
+
+    def compress(self, raw: bytes) -> bytes:
+        return self._compressor.compress(raw)
+
+    def decompress(self, blob: bytes) -> bytes:
+        return self._decompressor.decompress(blob)
+
+
+class CodecRegistry:
+    """
+    Resolves the (codec, dict_id) stored next to every raw payload and
+    picks the codec for new payloads: the newest zstd dictionary when
+    one exists, gzip otherwise.
+    """
+
+    def __init__(self, conn, dictionaries=None):
+        self.conn = conn
+        self._codecs = {(CODEC_GZIP, None): GzipCodec()}
+        for dict_id, dict_data in (dictionaries or {}).items():
+            self._codecs[(CODEC_ZSTD_DICT, dict_id)] = \
+                ZstdDictCodec(dict_id, dict_data)
+
+    def dictionaries(self):
+        '''
+        Returns {dict_id: dict_data} of every stored dictionary, used to
+        set up registries in processes without a connection
+        '''
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT id, dict_data FROM raw_dictionaries")
+        return dict(cursor.fetchall())
+
+    def get(self, codec, dict_id=None):
+        key = (codec, dict_id)
+        if key not in self._codecs:
+            if codec != CODEC_ZSTD_DICT:
+                raise ValueError(f"Unknown raw payload codec: {codec}")
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT dict_data FROM raw_dictionaries "
+                           "WHERE id = ?", (dict_id,))
+            row = cursor.fetchone()
+            if row is None:
+                raise ValueError(f"Unknown zstd dictionary: {dict_id}")
+            self._codecs[key] = ZstdDictCodec(dict_id, row[0])
+        return self._codecs[key]
+
+    def default(self):
+        if zstandard is None:
+            return self.get(CODEC_GZIP)
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT MAX(id) FROM raw_dictionaries")
+        dict_id = cursor.fetchone()[0]
+        if dict_id is None:
+            return self.get(CODEC_GZIP)
+        return self.get(CODEC_ZSTD_DICT, dict_id)
+
+    def decompress(self, codec, dict_id, blob):
+        return self.get(codec, dict_id).decompress(blob)
+
+
+def train_dictionary(conn, registry=None, samples=DICT_SAMPLES,
+                     dict_size=DICT_SIZE):
+    '''
+    Trains a zstd dictionary on a random sample of the stored payloads,
+    saves it to raw_dictionaries and returns its id
+    '''
+    if zstandard is None:
+        raise RuntimeError("zstandard is required to train a dictionary")
+    registry = registry or CodecRegistry(conn)
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT MAX(id) FROM raw_payloads")
+    max_id = cursor.fetchone()[0] or 0
+    ids = random.sample(range(1, max_id + 1), min(samples, max_id))
+    raw_samples = []
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        cursor.execute(f"""
+            SELECT codec, dict_id, payload FROM raw_payloads
+            WHERE id IN ({",".join("?" * len(chunk))})
+        """, chunk)
+        raw_samples.extend(registry.decompress(*row)
+                           for row in cursor.fetchall())
+    if len(raw_samples) < 10:
+        raise ValueError("Not enough raw payloads to train a dictionary")
+
+    dict_data = zstandard.train_dictionary(dict_size, raw_samples).as_bytes()
+    cursor.execute("""
+        INSERT INTO raw_dictionaries (created, dict_data)
+        VALUES (?, ?)
+    """, (datetime.now().isoformat(), dict_data))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def recompress_payloads(conn, codec, registry=None, batch_size=500):
+    '''
+    Re-encodes every raw payload that is not stored with `codec` yet.
+    Each blob is decoded again after encoding to verify the round trip.
+    Returns a dict with sizes and encode/decode timings.
+    '''
+    registry = registry or CodecRegistry(conn)
+    stats = {
+        "payloads": 0,
+        "raw_bytes": 0,
+        "bytes_before": 0,
+        "bytes_after": 0,
+        "old_decode_seconds": 0.0,
+        "encode_seconds": 0.0,
+        "decode_seconds": 0.0,
+    }
+    cursor = conn.cursor()
+    last_id = 0
+
+    while True:
+        cursor.execute("""
+            SELECT id, codec, dict_id, payload FROM raw_payloads
+            WHERE id > ? AND NOT (codec = ? AND dict_id IS ?)
+            ORDER BY id
+            LIMIT ?
+        """, (last_id, codec.name, codec.dict_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+
+        updates = []
+        for payload_id, old_codec, old_dict_id, blob in rows:
+            start = time.perf_counter()
+            raw = registry.decompress(old_codec, old_dict_id, blob)
+            decoded = time.perf_counter()
+            new_blob = codec.compress(raw)
+            encoded = time.perf_counter()
+            if codec.decompress(new_blob) != raw:
+                raise ValueError(f"Round trip failed for {payload_id}")
+            stats["old_decode_seconds"] += decoded - start
+            stats["encode_seconds"] += encoded - decoded
+            stats["decode_seconds"] += time.perf_counter() - encoded
+
+            stats["payloads"] += 1
+            stats["raw_bytes"] += len(raw)
+            stats["bytes_before"] += len(blob)
+            stats["bytes_after"] += len(new_blob)
+            updates.append((new_blob, codec.name, codec.dict_id, payload_id))
+
+        cursor.executemany("""
+            UPDATE raw_payloads SET payload = ?, codec = ?, dict_id = ?
+            WHERE id = ?
+        """, updates)
+        conn.commit()
+        last_id = rows[-1][0]
+
+    return stats
@@ -0,0 +1,66 @@
+import queue
+import sqlite3
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+
+# --- Read connection tuning ---
+MMAP_SIZE = 256 * 2 ** 20      # bytes of the file mapped into memory
+CACHE_SIZE_KIB = 64 * 1024     # page cache per connection
+CACHED_STATEMENTS = 256        # prepared statements kept per connection
+MAX_IDLE = 16                  # connections a pool keeps between requests
+
+
+class ReadPool:
+    """
+    Long-lived read-only connections to one SQLite database. A thread
+    checks a connection out, uses it alone and returns it, so the next
+    request reuses the open file, the warm page cache and the prepared
+    statements. Connections open with mode=ro and query_only; in WAL mode
+    they read the last committed state while the tracker writes.
+    """
+
+    def __init__(self, db_path, max_idle=MAX_IDLE):
+        self.db_path = db_path
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+
+    def _open(self):
+        conn = sqlite3.connect(
+            f"file:{pathname2url(self.db_path)}?mode=ro", uri=True,
+            check_same_thread=False, cached_statements=CACHED_STATEMENTS)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA query_only=ON")
+        cursor.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
@@ -0,0 +1,207 @@
+import math
+from datetime import date, datetime, timedelta
+
+
+# (max days until departure, longest a date may go without a query)
+# the last tier catches everything further out
+MAX_STALENESS = [
+    (7, timedelta(0)),
+    (30, timedelta(days=2)),
+    (90, timedelta(days=7)),
+    (None, timedelta(days=14)),
+]
+
+HISTORY_DAYS = 60          # price history the volatility is estimated from
+CHANGE_PROBABILITY = 0.5   # re-query once a change is at least this likely
+PRIOR_DAYS = 3.0           # weight of the route's rate in a date's estimate
+DEFAULT_CHANGE_RATE = 1.0  # changes per day when a route has no history
+
+
+def max_staleness(days_out):
+    for max_days, staleness in MAX_STALENESS:
+        if max_days is None or days_out <= max_days:
+            return staleness
+
+
+def price_changes(conn, since):
+    '''
+    Observed fare changes per (origin, destination, departure_date) since
+    `since`, as {key: (changes, observed days)}. Row stored prices count
+    the price changes between consecutive queries of a flight, interval
+    stored prices the intervals after the first one. A day with several
+    flights counts the changes of all of them over the average span.
+    '''
+    since_ts = int((since - datetime(1970, 1, 1)).total_seconds())
+    cursor = conn.execute("""
+        WITH observed AS (
+            SELECT
+                p.flight_id,
+                p.price IS NOT LAG(p.price) OVER w AS changed,
+                p.query_ts - LAG(p.query_ts) OVER w AS seconds
+            FROM prices_compact p
+            WHERE p.query_ts >= ?
+            WINDOW w AS (PARTITION BY p.flight_id ORDER BY p.query_ts)
+        ),
+        per_flight AS (
+            SELECT flight_id,
+                   SUM(changed) AS changes,
+                   SUM(seconds) AS seconds
+            FROM observed
+            WHERE seconds IS NOT NULL
+            GROUP BY flight_id
+
+            UNION ALL
+
+            SELECT flight_id,
+                   COUNT(*) - 1 AS changes,
+                   MAX(valid_to) - MIN(valid_from) AS seconds
+            FROM price_intervals
+            WHERE valid_to >= ?
+            GROUP BY flight_id
+        )
+        SELECT
+            src.iataCode,
+            dst.iataCode,
+            date(f.departure_ts, 'unixepoch') AS departure_date,
+            SUM(pf.changes),
+            SUM(pf.seconds) / 86400.0 / COUNT(*)
+        FROM per_flight pf
+        JOIN flights_compact f ON f.id = pf.flight_id
+        JOIN routes r ON r.id = f.route_id
+        JOIN airports src ON src.id = r.origin_id
+        JOIN airports dst ON dst.id = r.destination_id
+        GROUP BY r.id, departure_date
+    """, (since_ts, since_ts))
+    return {(origin, destination, departure_date): (changes, days)
+            for origin, destination, departure_date, changes, days
+            in cursor if days}
+
+
+class RefreshPlanner:
+    """
+    Picks the FlightJobs of a tracker run from the observed fare history.
+
+    Every (route, departure date) gets a change rate, its own changes per
+    day smoothed towards its route's rate. The chance that a date's fare
+    changed since its last query is 1 - exp(-rate * days since); dates
+    above `change_probability` are re-queried, the likeliest first, while
+    they fit into `budget` requests. Dates that were never queried or that
+    reached their MAX_STALENESS are always planned, even beyond the
+    budget, so no date goes unqueried longer than its tier allows; their
+    requests count against the budget.
+
+    The crawler asks for up to `window_days` consecutive dates of a route
+    in one request, so requests are counted in such windows: a date next
+    to planned ones may cost nothing.
+    """
+
+    def __init__(self, conn, budget=None,
+                 change_probability=CHANGE_PROBABILITY,
+                 history_days=HISTORY_DAYS, window_days=1):
+        self.conn = conn
+        self.budget = budget
+        self.change_probability = change_probability
+        self.history_days = history_days
+        self.window_days = window_days
+
+    def _windows(self, days):
+        # requests for a run of `days` consecutive dates
+        return -(-days // self.window_days)
+
+    def _added_requests(self, days, day):
+        '''
+        Requests a route's planned `days` (a set of day ordinals) cost
+        more once `day` joins them; joining two runs can save one
+        '''
+        before = 0
+        while day - before - 1 in days:
+            before += 1
+        after = 0
+        while day + after + 1 in days:
+            after += 1
+        return self._windows(before + after + 1) \
+            - self._windows(before) - self._windows(after)
+
+    def requests(self, jobs):
+        '''
+        The requests a crawl of `jobs` takes, one per window of
+        consecutive dates of a route
+        '''
+        days = {}
+        total = 0
+        for job in jobs:
+            route = days.setdefault((job.origin, job.destination), set())
+            day = date.fromisoformat(job.departure_date).toordinal()
+            if day not in route:
+                total += self._added_requests(route, day)
+                route.add(day)
+        return total
+
+    def change_rates(self, now):
+        '''
+        {(origin, destination, departure_date): changes per day} and
+        {(origin, destination): changes per day} of the recent history
+        '''
+        changes = price_changes(self.conn,
+                                now - timedelta(days=self.history_days))
+        totals = {}
+        for (origin, destination, _), (count, days) in changes.items():
+            route_count, route_days = totals.get((origin, destination),
+                                                 (0, 0.0))
+            totals[(origin, destination)] = (route_count + count,
+                                             route_days + days)
+        route_rates = {route: count / days
+                       for route, (count, days) in totals.items() if days}
+
+        date_rates = {}
+        for key, (count, days) in changes.items():
+            prior = route_rates.get(key[:2], DEFAULT_CHANGE_RATE)
+            date_rates[key] = (count + prior * PRIOR_DAYS) \
+                / (days + PRIOR_DAYS)
+        return date_rates, route_rates
+
+    def plan(self, jobs, last_fetched, now=None):
+        '''
+        The jobs to query now, in their given (priority) order.
+        `last_fetched` maps a job to the time of its last query.
+        '''
+        now = now or datetime.now()
+        date_rates, route_rates = self.change_rates(now)
+
+        required = set()
+        optional = []
+        for job in jobs:
+            fetched = last_fetched.get(job)
+            if fetched is None:
+                required.add(job)
+                continue
+            departure = datetime.strptime(job.departure_date, "%Y-%m-%d")
+            since = now - fetched
+            if since >= max_staleness((departure.date() - now.date()).days):
+                required.add(job)
+                continue
+            rate = date_rates.get(
+                tuple(job), route_rates.get((job.origin, job.destination),
+                                            DEFAULT_CHANGE_RATE))
+            chance = 1 - math.exp(-rate * since.total_seconds() / 86400)
+            if chance >= self.change_probability:
+                optional.append((chance, job))
+
+        optional.sort(key=lambda entry: entry[0], reverse=True)
+        planned = set(required)
+        if self.budget is None:
+            planned.update(job for _, job in optional)
+        else:
+            # required dates first, they are planned whatever they cost
+            days = {}
+            used = 0
+            for job in [*required, *(job for _, job in optional)]:
+                route = days.setdefault((job.origin, job.destination), set())
+                day = date.fromisoformat(job.departure_date).toordinal()
+                cost = self._added_requests(route, day)
+                if job not in required and used + cost > self.budget:
+                    continue
+                used += cost
+                route.add(day)
+                planned.add(job)
+        return [job for job in jobs if job in planned]
@@ -0,0 +1,150 @@
+import os
+import json
+import time
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from db import (
+    PRICE_AGGREGATES,
+    bump_data_generation,
+    bump_data_version,
+    insert_flight_rows,
+    iter_raw_chunks)
+from raw_codecs import CodecRegistry
+from tracker_utilitis import parse_rows
+
+
+CHUNK_SIZE = 2000
+
+# registry of the worker process, set up by _init_worker
+_registry = None
+
+
+def _init_worker(dictionaries):
+    global _registry
+    _registry = CodecRegistry(None, dictionaries)
+
+
+def parse_chunk(rows, registry=None):
+    '''
+    Decompresses and parses one chunk of raw observations.
+    Returns (flights rows, prices rows) ready for db.insert_flight_rows,
+    every price carries the query_date of its observation.
+    '''
+    registry = registry or _registry
+    responses = []
+    query_times = []
+    decoded = {}
+    for _, query_date, _, _, _, codec, dict_id, payload in rows:
+        # observations of unchanged fares share their payload
+        if payload not in decoded:
+            raw = registry.decompress(codec, dict_id, payload)
+            decoded[payload] = json.loads(raw)
+        responses.append(decoded[payload])
+        query_times.append(datetime.fromisoformat(query_date))
+
+    return parse_rows(responses, query_times)
+
+
+def connect_checkpoint(conn):
+    cursor = conn.cursor()
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS replay_checkpoint (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        last_raw_id INTEGER NOT NULL,
+        rows INTEGER NOT NULL,
+        updated TEXT
+        )
+    """)
+    cursor.execute("""
+    INSERT OR IGNORE INTO replay_checkpoint (id, last_raw_id, rows)
+    VALUES (1, 0, 0)
+    """)
+    conn.commit()
+    cursor.execute("SELECT last_raw_id, rows FROM replay_checkpoint")
+    return cursor.fetchone()
+
+
+def reset_derived_tables(conn):
+    '''
+    Empties flights, prices, price_intervals, the aggregates and the
+    checkpoint so the replay rebuilds them from scratch
+    '''
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM prices_compact")
+    cursor.execute("DELETE FROM price_intervals")
+    cursor.execute("DELETE FROM flights_compact")
+    cursor.execute("DELETE FROM flight_keys")
+    for table, _ in PRICE_AGGREGATES:
+        cursor.execute(f"DELETE FROM {table}")
+    cursor.execute("DELETE FROM replay_checkpoint")
+    bump_data_version(cursor)
+    bump_data_generation(cursor)
+    conn.commit()
+
+
+def _report(rows, observations, start, last_id):
+    elapsed = time.monotonic() - start
+    print(f"raw id {last_id}: {observations} observations, {rows} prices, "
+          f"{observations / max(elapsed, 1e-9):.0f} observations/s")
+
+
+def replay(conn, conn_raw, chunk_size=CHUNK_SIZE, workers=None,
+           report=_report):
+    '''
+    Rebuilds flights and prices from the raw store. Raw observations are
+    read in id chunks, parsed in a process pool and bulk loaded; each
+    chunk is committed together with the checkpoint, so a stopped replay
+    continues after the last committed chunk.
+    At most two chunks per worker are in memory at any time.
+    Returns (observations, prices rows, seconds) of this call. Raises
+    ValueError for a database with prices that no replay started.
+    '''
+    workers = workers or os.cpu_count() or 1
+    last_id, total_rows = connect_checkpoint(conn)
+    if last_id == 0 and conn.execute("""
+            SELECT EXISTS (SELECT 1 FROM prices_compact)
+                OR EXISTS (SELECT 1 FROM price_intervals)
+            """).fetchone()[0]:
+        # the tracker's prices were not written at the query times of
+        # the raw store, replaying over them would add every one twice
+        raise ValueError("the database has prices no replay wrote, "
+                         "rebuild them from scratch instead")
+    dictionaries = CodecRegistry(conn_raw).dictionaries()
+
+    cursor = conn.cursor()
+    observations = 0
+    replayed_rows = 0
+    start = time.monotonic()
+
+    def write(result, chunk_last_id, size):
+        nonlocal total_rows, replayed_rows, observations
+        flights, prices = result
+        insert_flight_rows(cursor, flights, prices)
+        total_rows += len(prices)
+        replayed_rows += len(prices)
+        observations += size
+        cursor.execute("""
+            UPDATE replay_checkpoint
+            SET last_raw_id = ?, rows = ?, updated = ?
+            WHERE id = 1
+        """, (chunk_last_id, total_rows, datetime.now().isoformat()))
+        conn.commit()
+        if report:
+            report(total_rows, observations, start, chunk_last_id)
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(dictionaries,)) as pool:
+        pending = deque()
+        for rows in iter_raw_chunks(conn_raw, last_id, chunk_size):
+            future = pool.submit(parse_chunk, rows)
+            pending.append((future, rows[-1][0], len(rows)))
+            if len(pending) >= 2 * workers:
+                future, chunk_last_id, size = pending.popleft()
+                write(future.result(), chunk_last_id, size)
+        while pending:
+            future, chunk_last_id, size = pending.popleft()
+            write(future.result(), chunk_last_id, size)
+
+    return observations, replayed_rows, time.monotonic() - start
@@ -0,0 +1,206 @@
+import sys
+import time
+import random
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import httpx
+import tenacity
+
+
+# --- Timeouts (seconds) ---
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 20.0
+
+# --- Retries ---
+MAX_ATTEMPTS = 5
+BACKOFF_INITIAL = 1.0   # seconds, doubled per attempt with full jitter
+BACKOFF_MAX = 60.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# --- Circuit breaker ---
+FAILURE_THRESHOLD = 5   # consecutive failures that open a host's circuit
+RESET_TIMEOUT = 30.0    # seconds an open circuit rejects requests
+TRIAL_POLL = 0.5        # seconds between checks while a trial call runs
+
+
+class RetryableStatus(Exception):
+    """
+    A response the API may answer differently when asked again: a 429 or
+    a 5xx. `retry_after` holds the seconds of a Retry-After header.
+    """
+
+    def __init__(self, status, url, retry_after=None):
+        super().__init__(f"{status} from {url}")
+        self.status = status
+        self.url = url
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def retry_after(response):
+    '''
+    Seconds of the Retry-After header, given as seconds or as a date
+    '''
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def check_response(response):
+    '''
+    Raises RetryableStatus for 429/5xx and the client's HTTPError for the
+    other error statuses; works for requests and httpx responses
+    '''
+    if response.status_code in RETRY_STATUSES:
+        raise RetryableStatus(response.status_code, str(response.url),
+                              retry_after(response))
+    response.raise_for_status()
+
+
+def is_retryable(error):
+    if isinstance(error, (RetryableStatus, httpx.TransportError)):
+        return True
+    # requests is only loaded by the callers using it, see get_flight
+    requests = sys.modules.get("requests")
+    return requests is not None and isinstance(
+        error, (requests.ConnectionError, requests.Timeout))
+
+
+def is_rate_limited(error):
+    return isinstance(error, RetryableStatus) and error.status == 429
+
+
+class wait_retry_after(tenacity.wait.wait_base):
+    """
+    Waits as long as the server's Retry-After asks, plus a little jitter
+    so parallel workers do not come back at once; otherwise jittered
+    exponential backoff.
+    """
+
+    def __init__(self, initial=BACKOFF_INITIAL, maximum=BACKOFF_MAX):
+        self.maximum = maximum
+        self.backoff = tenacity.wait_random_exponential(multiplier=initial,
+                                                        max=maximum)
+
+    def __call__(self, retry_state):
+        error = retry_state.outcome.exception()
+        seconds = getattr(error, "retry_after", None)
+        if seconds is None:
+            return self.backoff(retry_state)
+        return min(self.maximum, seconds + random.uniform(0, 1))
+
+
+def retrying(cls=tenacity.Retrying, max_attempts=MAX_ATTEMPTS, **kwargs):
+    '''
+    The retry policy of API requests, pass tenacity.AsyncRetrying for
+    coroutines. The last error is re-raised once attempts run out.
+    '''
+    return cls(
+        stop=tenacity.stop_after_attempt(max_attempts),
+        wait=wait_retry_after(),
+        retry=tenacity.retry_if_exception(is_retryable),
+        reraise=True,
+        **kwargs
+    )
+
+
+class CircuitBreaker:
+    """
+    Stops calling a host after `failure_threshold` consecutive failures.
+    The open circuit rejects calls with CircuitOpenError for
+    `reset_timeout` seconds, then lets a single trial call through
+    (half-open): its success closes the circuit, a failure opens it again.
+    Rate limiting does not count as a failure, it is handled by backoff.
+    """
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD,
+                 reset_timeout=RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.down_since = None  # first opening since the last success
+        self._trial = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def retry_in(self):
+        '''
+        Seconds until the circuit lets a call through, 0 if it does now
+        '''
+        state = self.state
+        if state == "open":
+            return self.reset_timeout - (time.monotonic() - self.opened_at)
+        if state == "half-open" and self._trial:
+            return min(TRIAL_POLL, self.reset_timeout)
+        return 0.0
+
+    def before_call(self):
+        state = self.state
+        if state == "open" or (state == "half-open" and self._trial):
+            raise CircuitOpenError(
+                f"circuit open after {self.failures} failures")
+        if state == "half-open":
+            self._trial = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.down_since = None
+        self._trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial = False
+        if self.opened_at is not None \
+                or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            if self.down_since is None:
+                self.down_since = self.opened_at
+
+    @contextmanager
+    def guard(self):
+        self.before_call()
+        try:
+            yield
+        except Exception as e:
+            if is_retryable(e) and not is_rate_limited(e):
+                self.record_failure()
+            else:
+                # a 429 or 4xx is still an answer, the host is up
+                self.record_success()
+            raise
+        self.record_success()
+
+
+_breakers = {}
+
+
+def breaker_for(url):
+    host = urlsplit(url).netloc
+    if host not in _breakers:
+        _breakers[host] = CircuitBreaker()
+    return _breakers[host]
@@ -0,0 +1,263 @@
+import os
+import json
+import time
+import queue
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+
+import httpx
+
+
+# ntfy topic of the run notifications, point it at mock_api.py in tests
+NTFY_URL = os.environ.get("FLIGHTTRACKER_NTFY_URL",
+                          "https://ntfy.sh/Krzysztof_is_doing_1234")
+NOTIFY_TIMEOUT = 10.0  # seconds
+
+# upper bounds of the fetch latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = [25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class RunMetrics:
+    """
+    Timings and counters of one tracker run. `stage` times a block and
+    adds up repeated blocks of the same name, `record_request` keeps the
+    latency and outcome of every API request.
+    """
+
+    def __init__(self):
+        self.started = datetime.now()
+        self._start = time.perf_counter()
+        self.seconds = None
+        self.status = "running"
+        self.error = None
+        self.scheduler_run_id = None
+        self.stages = {}
+        self.counters = {}
+        self.statuses = {}
+        self.latencies = []
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) \
+                + time.perf_counter() - start
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def record_request(self, seconds, status):
+        # status is the http status or the name of the error
+        self.latencies.append(seconds)
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+
+    def add_writer_stats(self, stats):
+        self.stages["db_write"] = self.stages.get("db_write", 0.0) \
+            + stats["seconds"]
+        self.count("rows_inserted", stats["price_rows"])
+        self.count("raw_rows", stats["raw_rows"])
+        self.count("bytes_stored", stats["raw_bytes"])
+        self.count("fares_changed", stats["fares_changed"])
+
+    def finish(self, error=None):
+        self.seconds = time.perf_counter() - self._start
+        self.status = "failed" if error is not None else "successful"
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    def percentile(self, q):
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q))]
+
+    def histogram(self):
+        '''
+        {"<=25ms": n, ..., ">10000ms": n} of the request latencies
+        '''
+        counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        for seconds in self.latencies:
+            counts[bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS]
+        labels.append(f">{LATENCY_BUCKETS_MS[-1]}ms")
+        return dict(zip(labels, counts))
+
+    def row(self):
+        '''
+        The tracker_runs row of the run, in column order
+        '''
+        def ms(value):
+            return None if value is None else value * 1000
+
+        errors = sum(count for status, count in self.statuses.items()
+                     if not status.startswith("2"))
+        return (
+            self.scheduler_run_id,
+            self.started.isoformat(timespec="seconds"),
+            self.seconds,
+            self.status,
+            self.error,
+            self.counters.get("jobs", 0),
+            self.counters.get("jobs_failed", 0),
+            len(self.latencies),
+            self.counters.get("retries", 0),
+            errors,
+            ms(self.percentile(0.5)),
+            ms(self.percentile(0.95)),
+            ms(max(self.latencies, default=None)),
+            self.stages.get("crawl"),
+            self.stages.get("parse"),
+            self.stages.get("db_write"),
+            self.counters.get("rows_inserted", 0),
+            self.counters.get("bytes_stored", 0),
+            json.dumps({"stages": self.stages, "counters": self.counters,
+                        "statuses": self.statuses,
+                        "latency_histogram": self.histogram()}),
+        )
+
+
+def create_runs_table(conn):
+    # one row per tracker invocation, a resumed scheduler run has several
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS tracker_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        scheduler_run_id INTEGER,
+        started TEXT NOT NULL,
+        seconds REAL,
+        status TEXT NOT NULL,
+        error TEXT,
+
+        jobs INTEGER,
+        jobs_failed INTEGER,
+        requests INTEGER,
+        retries INTEGER,
+        request_errors INTEGER,
+        fetch_p50_ms REAL,
+        fetch_p95_ms REAL,
+        fetch_max_ms REAL,
+
+        crawl_seconds REAL,
+        parse_seconds REAL,
+        db_write_seconds REAL,
+        rows_inserted INTEGER,
+        bytes_stored INTEGER,
+
+        details TEXT
+        )
+    """)
+    conn.commit()
+
+
+def save_run(conn, metrics):
+    create_runs_table(conn)
+    cursor = conn.execute(f"""
+        INSERT INTO tracker_runs (
+            scheduler_run_id, started, seconds, status, error,
+            jobs, jobs_failed, requests, retries, request_errors,
+            fetch_p50_ms, fetch_p95_ms, fetch_max_ms,
+            crawl_seconds, parse_seconds, db_write_seconds,
+            rows_inserted, bytes_stored, details
+        )
+        VALUES ({", ".join("?" * 19)})
+    """, metrics.row())
+    conn.commit()
+    return cursor.lastrowid
+
+
+def recent_runs(conn, limit=10):
+    create_runs_table(conn)
+    cursor = conn.execute("""
+        SELECT * FROM tracker_runs ORDER BY id DESC LIMIT ?
+    """, (limit,))
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def summary(run, previous=None):
+    '''
+    Notification text of a tracker_runs row, compared with the previous
+    successful run
+    '''
+    def ms(value):
+        return "-" if value is None else f"{value:.0f} ms"
+
+    def seconds(value):
+        return f"{value or 0:.1f} s"
+
+    lines = [f"{run['jobs']} jobs ({run['jobs_failed']} failed) "
+             f"in {seconds(run['seconds'])}"]
+    if previous:
+        lines[0] += f", previous run {seconds(previous['seconds'])} " \
+                    f"for {previous['jobs']} jobs"
+    lines.append(f"{run['requests']} requests, {run['retries']} retries, "
+                 f"{run['request_errors']} errors")
+    lines.append(f"fetch p50 {ms(run['fetch_p50_ms'])}, "
+                 f"p95 {ms(run['fetch_p95_ms'])}, "
+                 f"max {ms(run['fetch_max_ms'])}")
+    lines.append(f"crawl {seconds(run['crawl_seconds'])}, "
+                 f"parse {seconds(run['parse_seconds'])}, "
+                 f"db writes {seconds(run['db_write_seconds'])}")
+    lines.append(f"{run['rows_inserted']} prices inserted, "
+                 f"{run['bytes_stored'] / 2 ** 20:.2f} MiB raw stored")
+    if run["error"]:
+        lines.append(run["error"])
+    return "\n".join(lines)
+
+
+class Notifier:
+    """
+    Posts messages to ntfy from a background thread, so a slow or
+    unreachable ntfy server never holds up the tracker. `close` waits at
+    most `timeout` seconds for the messages still queued.
+    """
+
+    def __init__(self, url=NTFY_URL, timeout=NOTIFY_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._send_queued,
+                                        daemon=True)
+        self._thread.start()
+
+    def send(self, message, title=None, tags=None):
+        headers = {}
+        if title:
+            headers["Title"] = title
+        if tags:
+            headers["Tags"] = ",".join(tags)
+        self._queue.put((message, headers))
+
+    def _send_queued(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            message, headers = item
+            try:
+                httpx.post(self.url, content=message.encode("utf-8"),
+                           headers=headers, timeout=self.timeout)
+            except httpx.HTTPError as e:
+                print(f"Notification failed: {e}")
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(self.timeout)
+
+
+def report_run(conn, metrics, notifier):
+    '''
+    Stores the metrics of a finished run in tracker_runs and queues its
+    summary on the notifier
+    '''
+    save_run(conn, metrics)
+    run, *earlier = recent_runs(conn, 50)
+    previous = next((other for other in earlier
+                     if other["status"] == "successful"), None)
+    notifier.send(summary(run, previous),
+                  title=f"Tracker {metrics.status}",
+                  tags=["white_check_mark"] if metrics.status == "successful"
+                  else ["warning"])
@@ -0,0 +1,252 @@
+import os
+import sqlite3
+from collections import namedtuple
+from datetime import datetime, date, timedelta
+
+import yaml
+
+from crawler import FlightJob
+
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DB_PATH_SCHEDULER = os.path.join(BASE_DIR, "data", "scheduler.db")
+ROUTES_PATH = os.path.join(os.path.dirname(__file__), "routes.yaml")
+
+Route = namedtuple("Route", ["origin", "destination", "days_to_track",
+                             "priority"])
+
+# (max days until departure, minimum time between two queries)
+# the last tier catches everything further out
+REFRESH_TIERS = [
+    (14, timedelta(0)),
+    (60, timedelta(hours=20)),
+    (150, timedelta(days=3)),
+    (None, timedelta(days=7)),
+]
+
+# runs an item is tried in before it is given up, see Scheduler.start_run
+MAX_ITEM_ATTEMPTS = 3
+
+
+def load_routes(path=ROUTES_PATH):
+    '''
+    Reads the route list from the yaml config and returns a list of Routes.
+    Raises ValueError for a priority that is not above 0, jobs are
+    ranked by days out divided by the priority.
+    '''
+    with open(path, encoding="utf-8") as f:
+        config = yaml.safe_load(f) or {}
+
+    routes = []
+    for entry in config.get("routes", []):
+        route = Route(
+            origin=entry["origin"].upper(),
+            destination=entry["destination"].upper(),
+            days_to_track=int(entry.get("days_to_track", 250)),
+            priority=float(entry.get("priority", 1))
+        )
+        if not route.priority > 0:
+            raise ValueError(
+                f"{path}: route {route.origin}-{route.destination} needs a "
+                f"priority above 0, not {entry['priority']}")
+        routes.append(route)
+    return routes
+
+
+def refresh_interval(days_out):
+    for max_days, interval in REFRESH_TIERS:
+        if max_days is None or days_out <= max_days:
+            return interval
+
+
+def expand_routes(routes, today=None):
+    '''
+    Expands routes into FlightJobs, one per route and departure date.
+    Duplicates are dropped and the list is ordered by priority:
+    near-term dates of high priority routes come first.
+    '''
+    today = today or date.today()
+    weighted = {}
+
+    for route in routes:
+        for n in range(route.days_to_track):
+            departure_date = (today + timedelta(days=n)).strftime("%Y-%m-%d")
+            job = FlightJob(route.origin, route.destination, departure_date)
+            rank = n / route.priority
+            if job not in weighted or rank < weighted[job]:
+                weighted[job] = rank
+
+    return sorted(weighted, key=lambda job: (weighted[job], job))
+
+
+def connect_scheduler_db(db_path=DB_PATH_SCHEDULER):
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    # last successful query per route and departure date
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS schedule_state (
+        origin TEXT NOT NULL,
+        destination TEXT NOT NULL,
+        departure_date TEXT NOT NULL,
+        last_fetched TEXT NOT NULL,
+
+        PRIMARY KEY(origin, destination, departure_date)
+        )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS scheduler_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        started TEXT NOT NULL,
+        finished TEXT
+        )
+    """)
+    # work items of a run, a crashed run resumes from the open ones
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS scheduler_items (
+        run_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        origin TEXT NOT NULL,
+        destination TEXT NOT NULL,
+        departure_date TEXT NOT NULL,
+        done INTEGER NOT NULL DEFAULT 0,
+        attempts INTEGER NOT NULL DEFAULT 0,
+
+        PRIMARY KEY(run_id, origin, destination, departure_date),
+        FOREIGN KEY(run_id) REFERENCES scheduler_runs(id)
+        )
+    """)
+    cursor.execute("PRAGMA table_info(scheduler_items)")
+    if "attempts" not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute("ALTER TABLE scheduler_items "
+                       "ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+    conn.commit()
+    return conn
+
+
+class Scheduler:
+    """
+    Turns the route config into the work items of a tracker run and keeps
+    track of which items are finished. Due items follow REFRESH_TIERS, or
+    the `planner` (a RefreshPlanner) when one is given.
+    """
+
+    def __init__(self, conn, planner=None):
+        self.conn = conn
+        self.planner = planner
+        self.given_up = []      # jobs start_run dropped after failing
+
+    def _is_due(self, job, now, last_fetched):
+        if last_fetched is None:
+            return True
+        departure = datetime.strptime(job.departure_date, "%Y-%m-%d")
+        days_out = (departure.date() - now.date()).days
+        return now - last_fetched >= refresh_interval(days_out)
+
+    def due_jobs(self, routes, now=None):
+        now = now or datetime.now()
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT origin, destination, departure_date, last_fetched
+            FROM schedule_state
+        """)
+        last_fetched = {
+            FlightJob(o, d, dep): datetime.fromisoformat(fetched)
+            for o, d, dep, fetched in cursor.fetchall()
+        }
+        jobs = expand_routes(routes, now.date())
+        if self.planner is not None:
+            return self.planner.plan(jobs, last_fetched, now)
+        return [
+            job for job in jobs
+            if self._is_due(job, now, last_fetched.get(job))
+        ]
+
+    def open_run(self):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT id FROM scheduler_runs
+            WHERE finished IS NULL
+            ORDER BY id DESC
+            LIMIT 1
+        """)
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def pending_jobs(self, run_id):
+        # open items of a run as (job, runs it was tried in)
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT origin, destination, departure_date, attempts
+            FROM scheduler_items
+            WHERE run_id = ? AND done = 0
+            ORDER BY position
+        """, (run_id,))
+        return [(FlightJob(*row[:3]), row[3] + 1)
+                for row in cursor.fetchall()]
+
+    def start_run(self, routes, now=None):
+        '''
+        Returns (run_id, jobs) of a new run over all due items. The open
+        items of an unfinished run go first; an item still open after
+        MAX_ITEM_ATTEMPTS runs is given up and left out of this run, the
+        jobs are in `given_up`.
+        '''
+        now = now or datetime.now()
+        carried = {}
+        self.given_up = []
+        run_id = self.open_run()
+        if run_id is not None:
+            for job, attempts in self.pending_jobs(run_id):
+                if attempts < MAX_ITEM_ATTEMPTS:
+                    carried[job] = attempts
+                else:
+                    self.given_up.append(job)
+            self.finish_run(run_id, now)
+
+        given_up = set(self.given_up)
+        jobs = list(carried) + [
+            job for job in self.due_jobs(routes, now)
+            if job not in carried and job not in given_up
+        ]
+        cursor = self.conn.cursor()
+        cursor.execute("INSERT INTO scheduler_runs (started) VALUES (?)",
+                       (now.isoformat(),))
+        run_id = cursor.lastrowid
+        cursor.executemany("""
+            INSERT INTO scheduler_items (
+                run_id, position, origin, destination, departure_date,
+                attempts
+            )
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(run_id, position, *job, carried.get(job, 0))
+              for position, job in enumerate(jobs)])
+        self.conn.commit()
+        return run_id, jobs
+
+    def mark_done(self, run_id, jobs, now=None):
+        now = (now or datetime.now()).isoformat()
+        cursor = self.conn.cursor()
+        cursor.executemany("""
+            UPDATE scheduler_items SET done = 1
+            WHERE run_id = ? AND origin = ? AND destination = ?
+                AND departure_date = ?
+        """, [(run_id, *job) for job in jobs])
+        cursor.executemany("""
+            INSERT INTO schedule_state (
+                origin, destination, departure_date, last_fetched
+            )
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(origin, destination, departure_date)
+            DO UPDATE SET last_fetched = excluded.last_fetched
+        """, [(*job, now) for job in jobs])
+        self.conn.commit()
+
+    def finish_run(self, run_id, now=None):
+        now = (now or datetime.now()).isoformat()
+        cursor = self.conn.cursor()
+        cursor.execute("UPDATE scheduler_runs SET finished = ? WHERE id = ?",
+                       (now, run_id))
+        cursor.execute("DELETE FROM scheduler_items WHERE run_id = ?",
+                       (run_id,))
+        self.conn.commit()
@@ -0,0 +1,76 @@
+// Draws the dashboard charts from the /api/... json payloads.
+// Plotly itself is loaded once from /plotly.min.js.
+
+function fetchChartData(url) {
+    return fetch(url).then(function (response) {
+        return response.json();
+    });
+}
+
+function drawAvgPriceDbd(elementId, url) {
+    fetchChartData(url).then(function (data) {
+        Plotly.newPlot(elementId, [{
+            x: data.days_before_departure,
+            y: data.avg_price,
+            mode: "lines+markers",
+            type: "scatter"
+        }], {
+            title: {text: "Average Price vs Days Before Departure"},
+            xaxis: {title: {text: "Days Before Departure"}, autorange: "reversed"},
+            yaxis: {title: {text: "Average Price (€)"}}
+        }, {responsive: true});
+    });
+}
+
+function drawHeatmap(elementId, data, matrix) {
+    // empty cells are shown as "N/A"
+    var text = matrix.map(function (row) {
+        return row.map(function (value) {
+            return value === null ? "N/A" : String(value);
+        });
+    });
+    Plotly.newPlot(elementId, [{
+        z: matrix,
+        x: data.day_labels.slice(0, matrix[0].length),
+        y: data.time_labels.slice(0, matrix.length),
+        text: text,
+        texttemplate: "%{text}",
+        type: "heatmap",
+        colorbar: {title: {text: "Avg Price"}},
+        hovertemplate: "Day of Week: %{x}<br>Time Slot: %{y}<br>Avg Price: %{text}<extra></extra>"
+    }], {
+        xaxis: {title: {text: "Day of Week"}},
+        yaxis: {title: {text: "Time Slot"}, autorange: "reversed"}
+    }, {responsive: true});
+}
+
+function drawPricingMatrices(queriesId, departuresId, url) {
+    fetchChartData(url).then(function (data) {
+        drawHeatmap(queriesId, data, data.queries);
+        drawHeatmap(departuresId, data, data.departures);
+    });
+}
+
+function drawPriceDevelopment(elementId, url) {
+    fetchChartData(url).then(function (data) {
+        var traces = data.series.map(function (series) {
+            return {
+                x: series.days_before_departure,
+                y: series.avg_price,
+                mode: "lines+markers",
+                type: "scatter",
+                name: series.name
+            };
+        });
+        Plotly.newPlot(elementId, traces, {
+            title: {text: "Flight Price Development by Departure Weekday"},
+            xaxis: {title: {text: "Days before departure"}, autorange: "reversed"},
+            yaxis: {title: {text: "Average flight price"}},
+            legend: {title: {text: "Departure weekday"}},
+            plot_bgcolor: "white",
+            autosize: true,
+            height: 600,
+            margin: {l: 50, r: 50, t: 60, b: 50}
+        }, {responsive: true});
+    });
+}
@@ -0,0 +1,267 @@
+import zlib
+import random
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+
+import db
+from tracker_utilitis import holiday_dates, make_flight_id
+
+
+# iata -> (countryName, name, seoName, city name, city code,
+#          countryCode, macCode)
+AIRPORTS = {
+    "VLC": ("Spain", "Valencia", "valencia", "Valencia", "VALENCIA",
+            "es", None),
+    "MAD": ("Spain", "Madrid", "madrid", "Madrid", "MADRID", "es", None),
+    "PMI": ("Spain", "Palma de Mallorca", "palma", "Palma",
+            "PALMA_DE_MALLORCA", "es", None),
+    "BER": ("Germany", "Berlin Brandenburg", "berlin-brandenburg",
+            "Berlin", "BERLIN", "de", None),
+    "STN": ("United Kingdom", "London Stansted", "london-stansted",
+            "London", "LONDON", "gb", "LON"),
+    "BGY": ("Italy", "Milan Bergamo", "milan-bergamo", "Milan", "MILAN",
+            "it", "MIL"),
+    "CRL": ("Belgium", "Brussels Charleroi", "brussels-charleroi",
+            "Brussels", "BRUSSELS", "be", "BRU"),
+    "DUB": ("Ireland", "Dublin", "dublin", "Dublin", "DUBLIN", "ie", None),
+}
+
+ROUTES = [
+    ("VLC", "BER"),
+    ("BER", "VLC"),
+    ("VLC", "STN"),
+    ("MAD", "BGY"),
+    ("PMI", "CRL"),
+    ("DUB", "MAD"),
+]
+
+# scheduled departures of a route per day, the count varies by day
+DEPARTURE_TIMES = [time(6, 0), time(9, 35), time(13, 10), time(17, 45),
+                   time(21, 20)]
+FLIGHT_MINUTES = 150
+
+CURRENCY = ("EUR", "€")
+
+
+def _seed(*parts):
+    return zlib.crc32("|".join(map(str, parts)).encode("utf-8"))
+
+
+def flight_number(origin, destination, slot):
+    return f"FR{1000 + _seed(origin, destination, slot) % 8000}"
+
+
+def departures(origin, destination, day, flights_per_day=None):
+    '''
+    The departure datetimes of a route on a day, stable across calls
+    '''
+    rng = random.Random(_seed(origin, destination, day.isoformat()))
+    count = flights_per_day if flights_per_day is not None \
+        else rng.choice([0, 1, 1, 2, 2, 3])
+    slots = sorted(rng.sample(range(len(DEPARTURE_TIMES)), count))
+    return [(slot, datetime.combine(day, DEPARTURE_TIMES[slot]))
+            for slot in slots]
+
+
+def fare_price(origin, destination, departure, query_day):
+    '''
+    Price of a flight as seen on query_day: a route base price that
+    rises towards departure and is repriced every few days, so most
+    consecutive queries see an unchanged fare
+    '''
+    base = 15 + _seed(origin, destination) % 60
+    days_before = max((departure.date() - query_day).days, 0)
+    late = max(0, 45 - days_before) / 45
+    flight_seed = _seed(origin, destination, departure.isoformat())
+    step = 2 + flight_seed % 5
+    rng = random.Random(flight_seed + query_day.toordinal() // step)
+    price = base * (1 + 1.5 * late) * rng.uniform(0.7, 1.4)
+    return int(price) + 0.99
+
+
+def _airport(iata):
+    country, name, seo, city, city_code, country_code, mac = AIRPORTS[iata]
+    city_info = {"name": city, "code": city_code, "countryCode": country_code}
+    if mac:
+        city_info["macCode"] = mac
+    return {
+        "countryName": country,
+        "iataCode": iata,
+        "name": name,
+        "seoName": seo,
+        "city": city_info,
+    }
+
+
+def _price(value):
+    main, fraction = f"{value:.2f}".split(".")
+    return {
+        "value": value,
+        "valueMainUnit": main,
+        "valueFractionalUnit": fraction,
+        "currencyCode": CURRENCY[0],
+        "currencySymbol": CURRENCY[1],
+    }
+
+
+def fare(origin, destination, slot, departure, price):
+    arrival = departure + timedelta(minutes=FLIGHT_MINUTES)
+    number = flight_number(origin, destination, slot)
+    flight_key = (f"FR~{number[2:]}~ ~~{origin}~{departure:%m/%d/%Y %H:%M}"
+                  f"~{destination}~{arrival:%m/%d/%Y %H:%M}~~")
+    return {
+        "outbound": {
+            "departureAirport": _airport(origin),
+            "arrivalAirport": _airport(destination),
+            "departureDate": departure.isoformat(),
+            "arrivalDate": arrival.isoformat(),
+            "price": _price(price),
+            "flightKey": flight_key,
+            "flightNumber": number,
+            "previousPrice": None,
+            "priceUpdated": 1700000000000,
+        },
+        "summary": {
+            "price": _price(price),
+            "previousPrice": None,
+            "newRoute": False,
+        },
+    }
+
+
+def one_way_fares(origin, destination, departure_date, query_time=None):
+    '''
+    A oneWayFares response for one route and departure day as the API
+    returns it, with no fares on days without flights
+    '''
+    if isinstance(departure_date, str):
+        departure_date = date.fromisoformat(departure_date)
+    query_day = (query_time or datetime.now()).date()
+    fares = [
+        fare(origin, destination, slot, departure,
+             fare_price(origin, destination, departure, query_day))
+        for slot, departure in departures(origin, destination,
+                                          departure_date)
+    ]
+    return {
+        "arrivalAirportCategories": None,
+        "fares": fares,
+        "nextPage": None,
+        "size": len(fares),
+        "total": len(fares),
+    }
+
+
+def payloads(n, start=date(2026, 3, 1), query_time=None, routes=ROUTES):
+    '''
+    n non-empty payloads over consecutive departure days of the routes,
+    as [(origin, destination, departure_date, data)]
+    '''
+    result = []
+    day = start
+    while len(result) < n:
+        for origin, destination in routes:
+            data = one_way_fares(origin, destination, day, query_time)
+            if data["total"] and len(result) < n:
+                result.append((origin, destination, day.isoformat(), data))
+        day += timedelta(days=1)
+    return result
+
+
+def _flight_row(origin, destination, slot, departure):
+    arrival = departure + timedelta(minutes=FLIGHT_MINUTES)
+    number = flight_number(origin, destination, slot)
+    src, dst = AIRPORTS[origin], AIRPORTS[destination]
+    iso = departure.isoformat()
+    return (
+        make_flight_id(number, iso, origin, destination),
+        number,
+        src[0], src[3], origin, src[6], src[2],
+        dst[0], dst[3], destination, dst[6], dst[2],
+        iso,
+        db.get_time_slot(departure.hour),
+        arrival.isoformat(),
+        departure.weekday(),
+        int(departure.weekday() >= 5),
+        departure.isocalendar()[1],
+        departure.month,
+        departure.year,
+        int(departure.date() in holiday_dates(departure.year)),
+    )
+
+
+def populate(conn, n_prices, start=datetime(2025, 1, 1, 5),
+             interval=timedelta(hours=12), horizon_days=120,
+             flights_per_day=3, routes=ROUTES, batch_size=50_000,
+             report=None):
+    '''
+    Fills a flights database with n_prices price observations: a run
+    every `interval` from `start` queries every flight departing within
+    `horizon_days`. Rows go through db.insert_flight_rows, so the
+    aggregates and the storage mode match a tracked database.
+    Returns the number of flights.
+    '''
+    per_run = len(routes) * flights_per_day * horizon_days
+    runs = -(-n_prices // per_run)
+    last_day = (start + runs * interval).date() + timedelta(horizon_days)
+
+    flights = []
+    day = start.date()
+    while day <= last_day:
+        for origin, destination in routes:
+            for slot, departure in departures(origin, destination, day,
+                                              flights_per_day):
+                flights.append((departure, origin, destination, slot))
+        day += timedelta(days=1)
+    flights.sort()
+    departure_times = [flight[0] for flight in flights]
+    rows = {}
+
+    cursor = conn.cursor()
+    new_flights = []
+    prices = []
+    written = 0
+    run = 0
+    while written + len(prices) < n_prices:
+        query_time = start + run * interval
+        query_day = query_time.date()
+        query_date = query_time.isoformat()
+        query_dow = query_time.weekday()
+        query_time_slot = db.get_time_slot(query_time.hour)
+        first = bisect_right(departure_times, query_time)
+        last = bisect_right(departure_times,
+                            query_time + timedelta(horizon_days))
+        for departure, origin, destination, slot in flights[first:last]:
+            key = (departure, origin, destination, slot)
+            row = rows.get(key)
+            if row is None:
+                row = rows[key] = _flight_row(origin, destination, slot,
+                                              departure)
+                new_flights.append(row)
+            prices.append((
+                row[0],
+                query_date,
+                fare_price(origin, destination, departure, query_day),
+                *CURRENCY,
+                (departure.date() - query_day).days,
+                query_dow,
+                query_time_slot,
+            ))
+            if written + len(prices) >= n_prices:
+                break
+            if len(prices) >= batch_size:
+                db.insert_flight_rows(cursor, new_flights, prices)
+                conn.commit()
+                written += len(prices)
+                new_flights, prices = [], []
+                if report:
+                    report(written, n_prices)
+        run += 1
+
+    if prices:
+        db.insert_flight_rows(cursor, new_flights, prices)
+        conn.commit()
+        written += len(prices)
+        if report:
+            report(written, n_prices)
+    return len(rows)
@@ -0,0 +1,129 @@
+import os
+import sys
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+import synthetic  # noqa: E402
+import app_utilities  # noqa: E402
+
+
+# the TEXT keyed tables of databases from before the schema versions
+BASELINE_SCHEMA = """
+CREATE TABLE flights (
+    id TEXT PRIMARY KEY,
+    flight_number TEXT,
+
+    departureAirport_countryName TEXT,
+    departureAirport_cityName TEXT,
+    departureAirport_iataCode TEXT,
+    departureAirport_macCode TEXT,
+    departureAirport_seoName TEXT,
+
+    arrivalAirport_countryName TEXT,
+    arrivalAirport_cityName TEXT,
+    arrivalAirport_iataCode TEXT,
+    arrivalAirport_macCode TEXT,
+    arrivalAirport_seoName TEXT,
+
+    departureDate TEXT,
+    departure_time_slot INTEGER,
+    arrivalDate TEXT,
+
+    departure_dow INTEGER,
+    is_weekend INTEGER,
+    week_of_year INTEGER,
+    month INTEGER,
+    year INTEGER,
+    is_holiday INTEGER
+    );
+CREATE TABLE prices (
+    flight_id TEXT,
+    query_date TEXT,
+
+    price REAL,
+    currencyCode TEXT,
+    currencySymbol TEXT,
+    days_before_departure INTEGER,
+    query_dow INTEGER,
+    query_time_slot INTEGER,
+
+    PRIMARY KEY(flight_id, query_date),
+    FOREIGN KEY(flight_id) REFERENCES flights(id)
+    );
+"""
+
+
+@pytest.fixture(autouse=True)
+def price_storage(monkeypatch):
+    # tests run in rows mode whatever the environment says
+    monkeypatch.setattr(db, "PRICE_STORAGE", db.PRICE_STORAGE_ROWS)
+
+
+@pytest.fixture
+def write_baseline():
+    '''
+    Copies the flights and prices of a database into a new database
+    with the baseline schema, `rename` maps the flight ids
+    '''
+    def write(path, source, rename=lambda key: key):
+        with closing(sqlite3.connect(path)) as conn:
+            conn.executescript(BASELINE_SCHEMA)
+            for table in ["flights", "prices"]:
+                rows = source.execute(f"SELECT * FROM {table}").fetchall()
+                marks = ", ".join("?" * len(rows[0]))
+                conn.executemany(
+                    f"INSERT INTO {table} VALUES ({marks})",
+                    [(rename(row[0]), *row[1:]) for row in rows])
+            conn.commit()
+        return path
+
+    return write
+
+
+@pytest.fixture
+def statistics(monkeypatch):
+    '''
+    get_statistics of the database at a path, read through the
+    dashboard's read-only connections
+    '''
+    def statistics(path, **filters):
+        monkeypatch.setattr(app_utilities, "DB_PATH", str(path))
+        return app_utilities.get_statistics(**filters)
+
+    return statistics
+
+
+@pytest.fixture
+def dashboard_db(tmp_path, monkeypatch):
+    '''
+    Fills a database with synthetic.populate and points the dashboard's
+    read-only connections at it, returns its path
+    '''
+    def populate(n_prices, **kwargs):
+        path = str(tmp_path / "flights.db")
+        with closing(db.connect_db(path)) as conn:
+            synthetic.populate(conn, n_prices, **kwargs)
+        monkeypatch.setattr(app_utilities, "DB_PATH", path)
+        return path
+
+    monkeypatch.setattr(app_utilities, "_pools", {})
+    yield populate
+    for pool in app_utilities._pools.values():
+        pool.close()
+
+
+@pytest.fixture
+def client(dashboard_db, tmp_path, monkeypatch):
+    # the Flask test client over a small synthetic database
+    import app
+    from fragment_cache import FragmentCache
+
+    dashboard_db(400, horizon_days=30, flights_per_day=1)
+    monkeypatch.setattr(app, "cache",
+                        FragmentCache(str(tmp_path / "fragments.db")))
+    return app.app.test_client()
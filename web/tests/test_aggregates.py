@@ -0,0 +1,83 @@
+from contextlib import closing
+
+import pytest
+
+import db
+import app_utilities
+
+
+# the dashboard aggregates as a GROUP BY over every stored price
+GROUPED = {
+    "agg_price_dbd": """
+        SELECT p.days_before_departure, SUM(p.price), COUNT(*)
+        FROM prices p
+        GROUP BY 1 ORDER BY 1""",
+    "agg_price_query_slot": """
+        SELECT p.query_time_slot, p.query_dow, SUM(p.price), COUNT(*)
+        FROM prices p
+        GROUP BY 1, 2 ORDER BY 1, 2""",
+    "agg_price_departure_slot": """
+        SELECT f.departure_time_slot, f.departure_dow,
+               SUM(p.price), COUNT(*)
+        FROM prices p JOIN flights f ON f.id = p.flight_id
+        GROUP BY 1, 2 ORDER BY 1, 2""",
+    "agg_price_dbd_dow": """
+        SELECT p.days_before_departure, f.departure_dow,
+               SUM(p.price), COUNT(*)
+        FROM prices p JOIN flights f ON f.id = p.flight_id
+        GROUP BY 1, 2 ORDER BY 1, 2""",
+}
+
+
+def aggregates(conn):
+    tables = {}
+    for table, keys in db.PRICE_AGGREGATES:
+        columns = ", ".join(keys)
+        tables[table] = conn.execute(f"""
+            SELECT {columns}, price_sum, price_count FROM {table}
+            ORDER BY {columns}""").fetchall()
+    return tables
+
+
+def assert_grouped(conn):
+    for table, rows in aggregates(conn).items():
+        expected = conn.execute(GROUPED[table]).fetchall()
+        assert [row[:-2] for row in rows] == [row[:-2] for row in expected]
+        assert [row[-1] for row in rows] == [row[-1] for row in expected]
+        assert [row[-2] for row in rows] \
+            == pytest.approx([row[-2] for row in expected])
+
+
+def test_batches_keep_the_aggregates_grouped(dashboard_db):
+    # every batch adds its own prices to the running sums
+    path = dashboard_db(3000, horizon_days=20, batch_size=400)
+    with closing(db.connect_db(path)) as conn:
+        assert_grouped(conn)
+
+
+def test_rebuild_backfills_the_aggregates(dashboard_db):
+    path = dashboard_db(1500, horizon_days=20)
+    with closing(db.connect_db(path)) as conn:
+        tracked = aggregates(conn)
+        for table, _ in db.PRICE_AGGREGATES:
+            conn.execute(f"DELETE FROM {table}")
+        conn.commit()
+
+        db.rebuild_aggregates(conn)
+        assert aggregates(conn).keys() == tracked.keys()
+        for table, rows in aggregates(conn).items():
+            assert len(rows) == len(tracked[table]) > 0
+        assert_grouped(conn)
+
+
+def test_dashboard_reads_the_aggregates(dashboard_db):
+    path = dashboard_db(1500, horizon_days=20)
+    with closing(db.connect_db(path)) as conn:
+        expected = conn.execute(GROUPED["agg_price_dbd"]).fetchall()
+
+    frame = app_utilities.fetch_avg_price_dbd()
+    assert list(frame["days_before_departure"]) \
+        == [row[0] for row in reversed(expected)]
+    assert list(frame["num_samples"]) == [row[2] for row in reversed(expected)]
+    assert list(frame["avg_price"]) == pytest.approx(
+        [round(row[1] / row[2], 2) for row in reversed(expected)])
@@ -0,0 +1,58 @@
+from contextlib import closing
+from datetime import datetime
+
+import pytest
+
+import db
+import synthetic
+import app_utilities
+from tracker_utilitis import parse_response
+
+
+CHARTS = {
+    "/api/avg_price_dbd": {"days_before_departure", "avg_price",
+                           "num_samples"},
+    "/api/pricing_matrices": {"day_labels", "time_labels", "queries",
+                              "departures"},
+    "/api/price_development": {"series"},
+}
+
+
+@pytest.mark.parametrize("url", list(CHARTS))
+def test_chart_data_is_json(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.mimetype == "application/json"
+    assert set(response.get_json()) == CHARTS[url]
+    assert response.headers["ETag"]
+    assert "no-cache" in response.headers["Cache-Control"]
+
+
+def test_matrices_are_six_by_seven(client):
+    data = client.get("/api/pricing_matrices").get_json()
+    for matrix in [data["queries"], data["departures"]]:
+        assert len(matrix) == 6
+        assert all(len(row) == 7 for row in matrix)
+
+
+def test_etag_follows_the_data_version(client):
+    first = client.get("/api/avg_price_dbd")
+    etag = first.headers["ETag"]
+
+    unchanged = client.get("/api/avg_price_dbd",
+                           headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304
+    assert unchanged.get_data() == b""
+
+    query_time = datetime(2026, 2, 20, 7, 30)
+    flights = parse_response(
+        synthetic.one_way_fares("VLC", "BER", "2026-03-02", query_time),
+        query_time.date())
+    with closing(db.connect_db(app_utilities.DB_PATH)) as conn:
+        db.save_flights(conn, flights)
+
+    changed = client.get("/api/avg_price_dbd",
+                         headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.get_json() != first.get_json()
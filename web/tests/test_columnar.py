@@ -0,0 +1,82 @@
+from datetime import datetime
+
+import pytest
+
+import db
+import synthetic
+from tracker_utilitis import parse_response
+
+columnar = pytest.importorskip("columnar")
+
+
+def track(conn, query_time, n=20):
+    # the prices of one tracker run
+    for _, _, _, data in synthetic.payloads(n, query_time=query_time):
+        flights, prices = db.flight_rows(
+            parse_response(data, query_time.date()), query_time)
+        db.insert_flight_rows(conn.cursor(), flights, prices)
+    conn.commit()
+
+
+def exported_rows(export_dir):
+    return columnar.read_prices(export_dir=export_dir).num_rows
+
+
+def test_export_survives_reused_rowids(tmp_path):
+    export_dir = str(tmp_path / "prices")
+    conn = db.connect_db(str(tmp_path / "flights.db"))
+    synthetic.populate(conn, 500, horizon_days=30, flights_per_day=1)
+
+    assert columnar.export_prices(conn, export_dir) == 500
+    assert columnar.export_prices(conn, export_dir) == 0
+
+    # the prices are deleted, new ones start over at rowid 1
+    db.convert_prices_to_intervals(conn)
+    track(conn, datetime(2026, 2, 20, 7, 30))
+    added = conn.execute("SELECT COUNT(*) FROM prices_compact").fetchone()[0]
+    assert conn.execute("SELECT MIN(rowid) FROM prices_compact").fetchone() \
+        == (1,)
+
+    assert columnar.export_prices(conn, export_dir) == added
+    assert exported_rows(export_dir) == 500 + added
+
+
+def test_export_starts_over_after_a_migration(tmp_path):
+    # exported from a version 3 database with baseline flight keys
+    export_dir = str(tmp_path / "prices")
+    conn = db.connect_db(str(tmp_path / "flights.db"))
+    track(conn, datetime(2026, 2, 20, 7, 30))
+    conn.execute("UPDATE flight_keys SET key = REPLACE(key, '_VLC', "
+                 "'     _VLC')")
+    conn.execute("PRAGMA user_version = 3")
+    conn.commit()
+    total = conn.execute("SELECT COUNT(*) FROM prices_compact").fetchone()[0]
+    assert columnar.export_prices(conn, export_dir) == total
+
+    db.migrate_schema(conn)
+
+    assert columnar.export_prices(conn, export_dir) == total
+    keys = columnar.read_prices(["flight_id"], export_dir=export_dir)
+    assert keys.num_rows == total
+    assert not any(" " in key for key in keys["flight_id"].to_pylist())
+
+
+def test_export_reads_price_intervals(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "PRICE_STORAGE", db.PRICE_STORAGE_INTERVALS)
+    export_dir = str(tmp_path / "prices")
+    conn = db.connect_db(str(tmp_path / "flights.db"))
+    synthetic.populate(conn, 500, horizon_days=30, flights_per_day=1)
+    intervals = conn.execute(
+        "SELECT COUNT(*) FROM price_intervals").fetchone()[0]
+    assert intervals > 0
+
+    assert columnar.export_prices(conn, export_dir) == intervals
+    assert columnar.export_prices(conn, export_dir) == 0
+
+    # only the intervals a new run starts are appended
+    track(conn, datetime(2026, 2, 20, 7, 30))
+    added = conn.execute(
+        "SELECT COUNT(*) FROM price_intervals").fetchone()[0] - intervals
+    assert added > 0
+    assert columnar.export_prices(conn, export_dir) == added
+    assert exported_rows(export_dir) == intervals + added
@@ -0,0 +1,183 @@
+import time
+import asyncio
+from datetime import date, timedelta
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+import pytest
+import tenacity
+
+import synthetic
+from crawler import CrawlError, Crawler, FlightJob
+from retry_policy import is_retryable
+
+
+BAD_DAY = "2026-03-05"
+
+
+def handler(request):
+    # oneWayFares of a date range, a 404 for every range with BAD_DAY
+    query = {key: values[0] for key, values
+             in parse_qs(urlsplit(str(request.url)).query).items()}
+    first = query["outboundDepartureDateFrom"]
+    last = query["outboundDepartureDateTo"]
+    if first <= BAD_DAY <= last:
+        return httpx.Response(404, json={"message": "not found"})
+    fares = []
+    day = date.fromisoformat(first)
+    while day <= date.fromisoformat(last):
+        fares += synthetic.one_way_fares(
+            query["departureAirportIataCode"],
+            query["arrivalAirportIataCode"], day)["fares"]
+        day += timedelta(days=1)
+    offset, limit = int(query["offset"]), int(query["limit"])
+    page = fares[offset:offset + limit]
+    return httpx.Response(200, json={
+        "fares": page, "size": len(page), "total": len(fares),
+        "nextPage": None, "arrivalAirportCategories": None})
+
+
+def serve(monkeypatch, crawler, handler):
+    # the crawler's requests go to `handler` instead of the network
+    monkeypatch.setattr(crawler, "_client", lambda: httpx.AsyncClient(
+        transport=httpx.MockTransport(handler)))
+
+
+def days(n, start=date(2026, 3, 10)):
+    return [FlightJob("VLC", "BER", (start + timedelta(i)).isoformat())
+            for i in range(n)]
+
+
+@pytest.fixture
+def crawler(monkeypatch):
+    crawler = Crawler(rate=1000, burst=1000, window_days=7,
+                      base_url="http://api.test")
+    serve(monkeypatch, crawler, handler)
+    return crawler
+
+
+async def collect_all(crawler, jobs):
+    return {job: data async for job, data in crawler.stream(jobs)}
+
+
+async def collect(crawler, jobs):
+    results = {}
+    with pytest.raises(CrawlError) as failure:
+        async for job, data in crawler.stream(jobs):
+            results[job] = data
+    return results, failure.value.errors
+
+
+def test_failed_window_falls_back_to_single_days(crawler):
+    start = date(2026, 3, 1)
+    jobs = [FlightJob("VLC", "BER", (start + timedelta(n)).isoformat())
+            for n in range(14)]
+
+    results, errors = asyncio.run(collect(crawler, jobs))
+
+    assert list(errors) == [FlightJob("VLC", "BER", BAD_DAY)]
+    assert len(results) == 13
+    for job, data in results.items():
+        expected = synthetic.one_way_fares("VLC", "BER", job.departure_date)
+        assert data["fares"] == expected["fares"]
+
+
+def flaky_api(monkeypatch, crawler, failures):
+    '''
+    Answers the first `failures` requests with a 503 (all of them for
+    None) and counts the requests, retries do not back off
+    '''
+    sent = []
+
+    def flaky(request):
+        sent.append(request)
+        if failures is None or len(sent) <= failures:
+            return httpx.Response(503)
+        return handler(request)
+
+    serve(monkeypatch, crawler, flaky)
+    monkeypatch.setattr("crawler.retrying", lambda cls, attempts: cls(
+        stop=tenacity.stop_after_attempt(attempts),
+        wait=tenacity.wait_none(),
+        retry=tenacity.retry_if_exception(is_retryable),
+        reraise=True))
+    return sent
+
+
+def test_error_burst_waits_for_the_circuit():
+    crawler = Crawler(rate=1000, burst=1000, reset_timeout=0.2,
+                      base_url="http://api.test")
+    jobs = days(30)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        sent = flaky_api(monkeypatch, crawler, failures=8)
+
+        done = asyncio.run(collect_all(crawler, jobs))
+
+    assert sorted(done) == jobs
+    # the burst and one request per job, none while the circuit was open
+    assert len(sent) == 8 + len(jobs)
+    assert crawler._breakers["api.test"].state == "closed"
+
+
+def test_circuit_open_past_patience_fails_the_jobs():
+    crawler = Crawler(rate=1000, burst=1000, reset_timeout=0.05,
+                      circuit_patience=0.3, base_url="http://api.test")
+    jobs = days(30)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        sent = flaky_api(monkeypatch, crawler, failures=None)
+        results, errors = asyncio.run(collect(crawler, jobs))
+
+    assert results == {}
+    assert sorted(errors) == jobs
+    assert len(sent) < 30
+
+
+def test_concurrency_and_rate_limit(monkeypatch):
+    crawler = Crawler(concurrency=4, rate=40, burst=5,
+                      base_url="http://api.test")
+    in_flight = []
+    most = 0
+
+    async def slow(request):
+        nonlocal most
+        in_flight.append(request)
+        most = max(most, len(in_flight))
+        await asyncio.sleep(0.02)
+        in_flight.remove(request)
+        return handler(request)
+
+    serve(monkeypatch, crawler, slow)
+    jobs = days(25)
+    start = time.monotonic()
+    results = asyncio.run(collect_all(crawler, jobs))
+    elapsed = time.monotonic() - start
+
+    assert sorted(results) == jobs
+    for job, data in results.items():
+        assert data["fares"] == synthetic.one_way_fares(
+            "VLC", "BER", job.departure_date)["fares"]
+    assert most == 4
+    # the burst goes out at once, the other requests at the rate
+    assert elapsed >= (len(jobs) - 5) / 40 * 0.9
+
+
+def test_rate_limited_host_slows_down(monkeypatch):
+    crawler = Crawler(rate=50, burst=5, base_url="http://api.test")
+    limited = []
+
+    def too_many(request):
+        if len(limited) < 2:
+            limited.append(time.monotonic())
+            return httpx.Response(429, headers={"Retry-After": "0.2"})
+        return handler(request)
+
+    serve(monkeypatch, crawler, too_many)
+    start = time.monotonic()
+    results = asyncio.run(collect_all(crawler, days(6)))
+
+    assert sorted(results) == days(6)
+    # held for the Retry-After, at half the rate from then on
+    assert time.monotonic() - start >= 0.2
+    bucket, = crawler._buckets.values()
+    assert bucket.rate < crawler.rate
+    assert bucket.rate >= crawler.rate * 0.5
@@ -0,0 +1,36 @@
+import csv
+import io
+
+import pytest
+
+
+def rows(response):
+    return list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+
+
+@pytest.mark.parametrize("url", [
+    "/export/flights?date_from=garbage",
+    "/export/flights?date_to=2026-02-30",
+    "/export/prices?query_from=notadate",
+    "/export/prices?query_to=yesterday",
+    "/export/prices?date_from=2026-13-01",
+])
+def test_invalid_dates_are_rejected(client, url):
+    assert client.get(url).status_code == 400
+
+
+def test_date_filters(client):
+    everything = rows(client.get("/export/prices"))
+    assert len(everything) == 401
+
+    window = rows(client.get(
+        "/export/prices?query_from=2025-01-02&query_to=2025-01-02"))
+    dates = {row[1][:10] for row in window[1:]}
+    assert dates == {"2025-01-02"}
+
+    flights = rows(client.get(
+        "/export/flights?date_from=2025-01-10&date_to=2025-01-12"))
+    column = flights[0].index("departureDate")
+    assert flights[1:]
+    assert all("2025-01-10" <= row[column][:10] <= "2025-01-12"
+               for row in flights[1:])
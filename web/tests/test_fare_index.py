@@ -0,0 +1,122 @@
+from datetime import datetime
+
+import db
+import synthetic
+from fare_index import FareIndex
+from replay import connect_checkpoint, reset_derived_tables
+from tracker_utilitis import parse_response
+
+
+def cheapest_by_query(conn, origin, destination):
+    # the latest price of every flight, the cheapest of them
+    return conn.execute("""
+        SELECT k.key, p.price
+        FROM prices_compact p
+        JOIN flight_keys k ON k.id = p.flight_id
+        JOIN flights f ON f.id = k.key
+        WHERE f.departureAirport_iataCode = ?
+            AND f.arrivalAirport_iataCode = ?
+            AND p.query_ts = (SELECT MAX(query_ts) FROM prices_compact
+                              WHERE flight_id = p.flight_id)
+        ORDER BY p.price
+        LIMIT 1
+    """, (origin, destination)).fetchone()
+
+
+def test_cheapest_date_follows_new_prices(tmp_path):
+    conn = db.connect_db(str(tmp_path / "flights.db"))
+    synthetic.populate(conn, 600, horizon_days=30, flights_per_day=1)
+    index = FareIndex()
+    assert index.refresh(conn) > 0
+    assert index.refresh(conn) == 0
+
+    found = index.cheapest_date("VLC", "BER")
+    assert (found["flight_id"], found["price"]) \
+        == tuple(cheapest_by_query(conn, "VLC", "BER"))
+
+    # a lower price of another route's flight in the next run
+    key, _ = cheapest_by_query(conn, "BER", "VLC")
+    flight_id = conn.execute("SELECT id FROM flight_keys WHERE key = ?",
+                             (key,)).fetchone()[0]
+    conn.execute("""
+        INSERT INTO prices_compact (flight_id, query_ts, price)
+        SELECT ?, MAX(query_ts) + 3600, 1.0 FROM prices_compact
+    """, (flight_id,))
+    db.bump_data_version(conn.cursor())
+    conn.commit()
+
+    assert index.refresh(conn) == 1
+    assert index.cheapest_date("BER", "VLC")["price"] == 1.0
+    assert index.cheapest_date("BER", "VLC")["flight_id"] == key
+
+
+def test_rebuilt_after_a_key_migration(tmp_path):
+    conn = db.connect_db(str(tmp_path / "flights.db"))
+    synthetic.populate(conn, 300, horizon_days=30, flights_per_day=1)
+    conn.execute("UPDATE flight_keys SET key = REPLACE(key, '_VLC', "
+                 "'     _VLC')")
+    conn.execute("PRAGMA user_version = 3")
+    conn.commit()
+    index = FareIndex()
+    index.refresh(conn)
+    assert " " in index.cheapest_date("VLC", "BER")["flight_id"]
+
+    db.migrate_schema(conn)
+    index.refresh(conn)
+
+    assert " " not in index.cheapest_date("VLC", "BER")["flight_id"]
+
+
+def test_rows_older_than_the_index_are_applied(tmp_path):
+    conn = db.connect_db(str(tmp_path / "flights.db"))
+    synthetic.populate(conn, 300, horizon_days=30, flights_per_day=1)
+    index = FareIndex()
+    index.refresh(conn)
+
+    # a replay adds a route queried before everything indexed so far
+    synthetic.populate(conn, 100, start=datetime(2024, 6, 1, 5),
+                       horizon_days=30, flights_per_day=1,
+                       routes=[("PMI", "VLC")])
+    assert index.refresh(conn) > 0
+
+    found = index.cheapest_date("PMI", "VLC")
+    assert (found["flight_id"], found["price"]) \
+        == tuple(cheapest_by_query(conn, "PMI", "VLC"))
+
+
+def test_rebuilt_after_a_fresh_replay(tmp_path):
+    conn = db.connect_db(str(tmp_path / "flights.db"))
+    synthetic.populate(conn, 300, horizon_days=30, flights_per_day=1)
+    index = FareIndex()
+    index.refresh(conn)
+    assert index.cheapest_date("VLC", "BER") is not None
+
+    # replay --fresh, the same flight ids now belong to another route
+    connect_checkpoint(conn)
+    reset_derived_tables(conn)
+    synthetic.populate(conn, 300, horizon_days=30, flights_per_day=1,
+                       routes=[("PMI", "VLC")])
+    index.refresh(conn)
+
+    assert index.cheapest_date("VLC", "BER") is None
+    found = index.cheapest_date("PMI", "VLC")
+    assert (found["flight_id"], found["price"]) \
+        == tuple(cheapest_by_query(conn, "PMI", "VLC"))
+
+
+def test_writer_refreshes_after_every_commit(tmp_path):
+    index = FareIndex()
+    writer = db.BufferedWriter(db.connect_db(str(tmp_path / "flights.db")),
+                               db.connect_db_raw(str(tmp_path / "raw.db")),
+                               fare_index=index)
+    query_time = datetime(2026, 2, 20, 7, 30)
+    for origin, destination, day, data in synthetic.payloads(
+            20, query_time=query_time):
+        writer.add_rows(*db.flight_rows(
+            parse_response(data, query_time.date()), query_time))
+    writer.flush()
+
+    assert writer.stats["fares_changed"] > 0
+    found = index.cheapest_date("VLC", "BER")
+    assert (found["flight_id"], found["price"]) \
+        == tuple(cheapest_by_query(writer.conn, "VLC", "BER"))
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+import charts
+from fragment_cache import FragmentCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return FragmentCache(str(tmp_path / "cache" / "fragments.db"),
+                         max_entries=3)
+
+
+def counting(value):
+    calls = []
+
+    def render():
+        calls.append(value)
+        return value
+
+    return render, calls
+
+
+def test_renders_once_per_data_version(cache):
+    render, calls = counting("<div>v1</div>")
+    assert cache.get_or_render("chart", 1, render) == "<div>v1</div>"
+    assert cache.get_or_render("chart", 1, render) == "<div>v1</div>"
+    assert len(calls) == 1
+
+    render, calls = counting("<div>v2</div>")
+    assert cache.get_or_render("chart", 2, render) == "<div>v2</div>"
+    assert len(calls) == 1
+    # a newer version replaces the older ones
+    assert cache.get("chart", 1) is None
+
+
+def test_expired_and_least_recently_used_entries_go(cache):
+    for name in ["a", "b", "c"]:
+        cache.set(name, 1, name)
+    cache.get("a", 1)
+    cache.set("d", 1, "d")
+    assert cache.get("b", 1) is None
+    assert [cache.get(name, 1) for name in "acd"] == ["a", "c", "d"]
+
+    cache.ttl = 0
+    assert cache.get("a", 1) is None
+
+
+def test_prewarm_builds_every_chart(cache, dashboard_db, monkeypatch):
+    dashboard_db(600, horizon_days=20)
+    version = charts.prewarm(cache)
+
+    for name, build in list(charts.CHART_DATA.items()):
+        cached = cache.get(name, version)
+        assert json.loads(cached) == json.loads(json.dumps(build()))
+
+        # served from the cache, the builder is not called again
+        monkeypatch.setitem(charts.CHART_DATA, name, None)
+        assert charts.get_chart_json(name, cache) == cached
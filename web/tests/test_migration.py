@@ -0,0 +1,132 @@
+import db
+import synthetic
+
+
+def aggregates(conn):
+    return {
+        table: conn.execute(
+            f"SELECT * FROM {table} ORDER BY {', '.join(keys)}").fetchall()
+        for table, keys in db.PRICE_AGGREGATES
+    }
+
+
+def test_migrate_baseline_database(tmp_path, write_baseline, statistics):
+    reference = db.connect_db(str(tmp_path / "reference.db"))
+    synthetic.populate(reference, 2000, horizon_days=30, flights_per_day=1)
+    path = write_baseline(str(tmp_path / "baseline.db"), reference)
+
+    conn = db.connect_db(path)
+
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    assert version == db.SCHEMA_VERSION
+    tables = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert not {"flights", "prices", "flights_v1", "prices_v1"} & tables
+    assert conn.execute("SELECT COUNT(*) FROM prices").fetchone()[0] == 2000
+
+    # the aggregates are filled in the migration itself
+    assert aggregates(conn) == aggregates(reference)
+    assert statistics(path) == statistics(tmp_path / "reference.db")
+    assert statistics(path)["total_prices"] == 2000
+    assert statistics(path, origin="VLC", query_from="2025-01-02") \
+        == statistics(tmp_path / "reference.db", origin="VLC",
+                      query_from="2025-01-02")
+
+
+def test_migrate_version_2_fills_empty_aggregates(tmp_path, statistics):
+    path = str(tmp_path / "flights.db")
+    conn = db.connect_db(path)
+    synthetic.populate(conn, 500, horizon_days=30, flights_per_day=1)
+    expected = aggregates(conn)
+    for table, _ in db.PRICE_AGGREGATES:
+        conn.execute(f"DELETE FROM {table}")
+    conn.execute("PRAGMA user_version = 2")
+    conn.commit()
+    conn.close()
+
+    conn = db.connect_db(path)
+    assert aggregates(conn) == expected
+    assert statistics(path)["total_prices"] == 500
+
+
+def baseline_key(key):
+    # the baseline make_flight_id left the indentation of its line
+    # continuation in the key
+    prefix, origin, destination = key.rsplit("_", 2)
+    return f"{prefix}     _{origin}_{destination}"
+
+
+def keys(conn):
+    return {row[0] for row in conn.execute("SELECT key FROM flight_keys")}
+
+
+def test_migrate_baseline_flight_keys(tmp_path, write_baseline, statistics):
+    reference = db.connect_db(str(tmp_path / "reference.db"))
+    synthetic.populate(reference, 1000, horizon_days=30, flights_per_day=1)
+    path = write_baseline(str(tmp_path / "baseline.db"), reference,
+                          rename=baseline_key)
+
+    conn = db.connect_db(path)
+
+    assert keys(conn) == keys(reference)
+    assert statistics(path) == statistics(tmp_path / "reference.db")
+
+
+def test_merge_flights_stored_under_both_keys(tmp_path, statistics):
+    reference_path = str(tmp_path / "reference.db")
+    reference = db.connect_db(reference_path)
+    synthetic.populate(reference, 1000, horizon_days=30, flights_per_day=1)
+    reference.close()
+
+    # a version 3 database written by the baseline tracker first and by
+    # the current one from the fourth query on, without a fresh replay
+    path = str(tmp_path / "flights.db")
+    with open(reference_path, "rb") as src, open(path, "wb") as dst:
+        dst.write(src.read())
+    conn = db.connect_db(path)
+    reference = db.connect_db(reference_path)
+    split_ts = conn.execute("""
+        SELECT DISTINCT query_ts FROM prices_compact
+        ORDER BY query_ts LIMIT 1 OFFSET 3
+    """).fetchone()[0]
+    flights = conn.execute("SELECT id, key FROM flight_keys").fetchall()
+    for flight_id, key in flights:
+        old_id = conn.execute("INSERT INTO flight_keys (key) VALUES (?)",
+                              (baseline_key(key),)).lastrowid
+        conn.execute("""
+            INSERT INTO flights_compact
+            SELECT ?, flight_number, route_id, departure_ts,
+                   departure_time_slot, arrival_ts, departure_dow,
+                   is_weekend, week_of_year, month, year, is_holiday
+            FROM flights_compact WHERE id = ?
+        """, (old_id, flight_id))
+        conn.execute("""
+            UPDATE prices_compact SET flight_id = ?
+            WHERE flight_id = ? AND query_ts < ?
+        """, (old_id, flight_id, split_ts))
+    # a price the replay wrote again under the new key
+    old_id, *price = conn.execute("""
+        SELECT p.* FROM prices_compact p
+        JOIN flight_keys k ON k.id = p.flight_id
+        WHERE k.key LIKE '% %' LIMIT 1
+    """).fetchone()
+    new_id = conn.execute("""
+        SELECT n.id FROM flight_keys o
+        JOIN flight_keys n ON n.key = REPLACE(o.key, ' ', '')
+        WHERE o.id = ?
+    """, (old_id,)).fetchone()[0]
+    conn.execute("INSERT INTO prices_compact VALUES (?, ?, ?, ?, ?, ?, ?)",
+                 (new_id, *price))
+    # aggregates that match neither
+    db.update_aggregates(conn.cursor(), "prices_compact")
+    conn.execute("PRAGMA user_version = 3")
+    conn.commit()
+    conn.close()
+
+    conn = db.connect_db(path)
+
+    assert keys(conn) == keys(reference)
+    assert conn.execute("SELECT COUNT(*) FROM flights_compact").fetchone() \
+        == reference.execute("SELECT COUNT(*) FROM flights_compact").fetchone()
+    assert aggregates(conn) == aggregates(reference)
+    assert statistics(path) == statistics(reference_path)
@@ -0,0 +1,106 @@
+import pytest
+
+import db
+import app_utilities
+from exports import flight_export, price_export
+
+
+@pytest.fixture
+def pool(dashboard_db):
+    dashboard_db(600, horizon_days=30, flights_per_day=1)
+    return app_utilities.read_pool()
+
+
+@pytest.mark.parametrize("sort", list(app_utilities.FLIGHT_SORT_COLUMNS))
+@pytest.mark.parametrize("descending", [False, True])
+def test_flight_pages_cover_every_flight_once(pool, sort, descending):
+    everything, last = app_utilities.get_all_flights_with_average_price(
+        sort=sort, descending=descending, limit=10_000)
+    assert last is None
+
+    paged = []
+    after = None
+    while True:
+        page, after = app_utilities.get_all_flights_with_average_price(
+            sort=sort, descending=descending, after=after, limit=7)
+        paged.extend(page)
+        if after is None:
+            break
+    assert paged == list(everything)
+
+
+def test_filtered_pages(pool):
+    everything, _ = app_utilities.get_all_flights_with_average_price(
+        origin="VLC", date_from="2025-01-05", limit=10_000)
+    page, after = app_utilities.get_all_flights_with_average_price(
+        origin="VLC", date_from="2025-01-05", limit=5)
+    rest, _ = app_utilities.get_all_flights_with_average_price(
+        origin="VLC", date_from="2025-01-05", after=after, limit=10_000)
+    assert list(page) + list(rest) == list(everything)
+    assert all(flight["departureDate"] >= "2025-01-05"
+               for flight in everything.values())
+
+
+def flatten(batches):
+    return [row for batch in batches for row in batch]
+
+
+def test_exports_resume_behind_the_last_row(pool):
+    columns, batches = price_export(pool, batch_size=64)
+    prices = flatten(batches)
+    assert len(prices) == 600
+
+    # the rows after the 100th, and the next flight after it
+    flight_id, query_date = prices[99][:2]
+    _, batches = price_export(pool, after=flight_id,
+                              after_query_date=query_date, batch_size=64)
+    assert flatten(batches) == prices[100:]
+    _, batches = price_export(pool, after=flight_id)
+    rest = flatten(batches)
+    assert rest == [row for row in prices[100:] if row[0] != flight_id]
+
+    columns, batches = flight_export(pool, batch_size=16)
+    flights = flatten(batches)
+    _, batches = flight_export(pool, after=flights[9][0], batch_size=16)
+    assert flatten(batches) == flights[10:]
+
+    with pytest.raises(ValueError):
+        price_export(pool, after="FR0_unknown")
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_flights_without_a_number_are_paged_once(pool, descending):
+    with db.connect_db(app_utilities.DB_PATH) as conn:
+        conn.execute("UPDATE flights_compact SET flight_number = NULL "
+                     "WHERE id % 3 = 0")
+    everything, _ = app_utilities.get_all_flights_with_average_price(
+        sort="flight", descending=descending, limit=10_000)
+    assert sum(flight["flight_number"] is None
+               for flight in everything.values()) > 0
+
+    paged = []
+    after = None
+    while True:
+        page, after = app_utilities.get_all_flights_with_average_price(
+            sort="flight", descending=descending, after=after, limit=7)
+        paged.extend(page)
+        if after is None:
+            break
+    assert paged == list(everything)
+
+
+@pytest.mark.parametrize("dates", [
+    {"date_from": "garbage"},
+    {"date_to": "2026-02-30"},
+])
+def test_invalid_dates_are_rejected(pool, dates):
+    with pytest.raises(ValueError):
+        app_utilities.get_all_flights_with_average_price(**dates)
+
+
+def test_invalid_dates_are_a_bad_request(pool):
+    import app
+
+    client = app.app.test_client()
+    assert client.get("/all_flights?date_from=2026-13-01").status_code == 400
+    assert client.get("/all_flights?date_from=2025-01-05").status_code == 200
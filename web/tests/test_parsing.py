@@ -0,0 +1,44 @@
+from datetime import datetime
+
+import db
+import synthetic
+from tracker_utilitis import parse_response, parse_rows
+
+
+def test_parse_response_matches_batch_parsing():
+    query_time = datetime(2026, 2, 20, 7, 30)
+    responses = [data for _, _, _, data
+                 in synthetic.payloads(40, query_time=query_time)]
+
+    flights, prices = [], []
+    for data in responses:
+        rows = db.flight_rows(parse_response(data, query_time.date()),
+                              query_time)
+        flights.extend(rows[0])
+        prices.extend(rows[1])
+
+    batch_flights, batch_prices = parse_rows(
+        responses + [None, {"fares": []}], [query_time] * 42)
+
+    assert len(prices) == len(batch_prices) > 40
+    assert set(flights) == set(batch_flights)
+    assert set(prices) == set(batch_prices)
+
+
+def test_batch_rows_carry_their_query_time():
+    first = datetime(2026, 2, 20, 7, 30)
+    second = datetime(2026, 2, 21, 22, 15)
+    data = synthetic.one_way_fares("VLC", "BER", "2026-03-02")
+
+    flights, prices = parse_rows([data, data], [first, second])
+
+    assert len(flights) == len(data["fares"])
+    assert len(prices) == 2 * len(data["fares"])
+    for query_time in [first, second]:
+        expected = db.flight_rows(parse_response(data, query_time.date()),
+                                  query_time)[1]
+        assert set(expected) <= set(prices)
+
+
+def test_parse_response_without_fares():
+    assert parse_response({"fares": [], "total": 0}) is None
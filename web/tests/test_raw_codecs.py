@@ -0,0 +1,59 @@
+from datetime import datetime
+
+import pytest
+
+import db
+import synthetic
+from raw_codecs import (CODEC_GZIP, CODEC_ZSTD_DICT, CodecRegistry,
+                        recompress_payloads, train_dictionary)
+
+pytest.importorskip("zstandard")
+
+QUERY_TIME = datetime(2026, 2, 20, 7, 30)
+
+
+def store(conn, payloads):
+    db.insert_raw_rows(conn.cursor(), [
+        db.raw_row(data, origin, destination, day, QUERY_TIME)
+        for origin, destination, day, data in payloads])
+    conn.commit()
+
+
+def codecs(conn):
+    return dict(conn.execute(
+        "SELECT codec, COUNT(*) FROM raw_payloads GROUP BY codec"))
+
+
+def test_dictionary_recompression_reads_back(tmp_path):
+    conn = db.connect_db_raw(str(tmp_path / "raw.db"))
+    payloads = synthetic.payloads(300, query_time=QUERY_TIME)
+    store(conn, payloads[:200])
+    assert codecs(conn) == {CODEC_GZIP: 200}
+
+    registry = CodecRegistry(conn)
+    dict_id = train_dictionary(conn, registry, dict_size=16 * 1024)
+    stats = recompress_payloads(
+        conn, registry.get(CODEC_ZSTD_DICT, dict_id), registry)
+    assert stats["payloads"] == 200
+    assert stats["bytes_after"] < stats["bytes_before"]
+
+    # new payloads take the dictionary, old and new read back alike
+    store(conn, payloads[200:])
+    assert codecs(conn) == {CODEC_ZSTD_DICT: 300}
+    assert [data for *_, data in db.iter_raw_data(conn)] \
+        == [data for *_, data in payloads]
+
+    # a registry without a connection, as in the replay workers
+    detached = CodecRegistry(None, registry.dictionaries())
+    codec, dict_id, blob = conn.execute(
+        "SELECT codec, dict_id, payload FROM raw_payloads").fetchone()
+    assert db.canonical_json(payloads[0][3]) \
+        == detached.decompress(codec, dict_id, blob)
+
+
+def test_unknown_codec_is_an_error(tmp_path):
+    registry = CodecRegistry(db.connect_db_raw(str(tmp_path / "raw.db")))
+    with pytest.raises(ValueError):
+        registry.decompress("lz4", None, b"")
+    with pytest.raises(ValueError):
+        registry.decompress(CODEC_ZSTD_DICT, 7, b"")
@@ -0,0 +1,63 @@
+import sqlite3
+
+import pytest
+
+import app_utilities
+
+
+@pytest.fixture
+def pool(dashboard_db):
+    dashboard_db(200, horizon_days=20, flights_per_day=1)
+    return app_utilities.read_pool()
+
+
+def test_fetch_all_entries_returns_its_connection(pool):
+    flights = app_utilities.fetch_all_entries()
+    assert len(flights) > 0
+    assert [f["departureDate"] for f in flights] \
+        == sorted((f["departureDate"] for f in flights), reverse=True)
+
+    # back in the pool, not kept by the thread
+    assert pool._idle.qsize() == 1
+    assert pool.db_path not in app_utilities._thread.__dict__.get("conns", {})
+    app_utilities.fetch_all_entries()
+    assert pool._idle.qsize() == 1
+
+
+def test_connections_are_read_only(pool):
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM flights").fetchone()[0]
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM flights_compact")
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("PRAGMA query_only=OFF")
+            conn.execute("CREATE TABLE scratch (id INTEGER)")
+
+
+def test_pool_reuses_its_connections(pool):
+    with pool.connection() as first:
+        with pool.connection() as second:
+            assert first is not second
+    # the last returned goes out first
+    with pool.connection() as again:
+        assert again is first
+    assert pool._idle.qsize() == 2
+
+
+def test_request_holds_one_connection(client, monkeypatch):
+    pool = app_utilities.read_pool()
+    checkouts = []
+    acquire = pool.acquire
+
+    def counted():
+        checkouts.append(acquire())
+        return checkouts[-1]
+
+    monkeypatch.setattr(pool, "acquire", counted)
+
+    for _ in range(2):
+        # the home page runs several queries
+        assert client.get("/").status_code == 200
+    assert len(checkouts) == 2
+    assert checkouts[0] is checkouts[1]
+    assert pool._idle.qsize() == 1
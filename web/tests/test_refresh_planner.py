@@ -0,0 +1,48 @@
+from datetime import date, datetime, timedelta
+
+import db
+from crawler import FlightJob
+from refresh_planner import RefreshPlanner
+
+
+NOW = datetime(2026, 3, 1, 6)
+
+
+def jobs(origin, destination, first, days):
+    return [FlightJob(origin, destination,
+                      (first + timedelta(n)).isoformat())
+            for n in range(days)]
+
+
+def test_requests_count_windows():
+    planner = RefreshPlanner(None, window_days=7)
+    start = date(2026, 4, 1)
+    assert planner.requests(jobs("VLC", "BER", start, 7)) == 1
+    assert planner.requests(jobs("VLC", "BER", start, 8)) == 2
+    # two routes, and a gap splits a run
+    assert planner.requests(jobs("VLC", "BER", start, 3)
+                            + jobs("BER", "VLC", start, 3)) == 2
+    assert planner.requests(jobs("VLC", "BER", start, 2)
+                            + jobs("VLC", "BER", date(2026, 4, 5), 2)) == 2
+    # the day in between joins both runs into one window
+    assert planner.requests(jobs("VLC", "BER", start, 2)
+                            + jobs("VLC", "BER", date(2026, 4, 3), 3)) == 1
+
+
+def test_budget_counts_required_dates_and_windows(tmp_path):
+    conn = db.connect_db(str(tmp_path / "flights.db"))
+    near = jobs("VLC", "BER", NOW.date(), 7)          # within 7 days
+    far = jobs("VLC", "BER", NOW.date() + timedelta(40), 28)
+    # queried two days ago, past the 7 day staleness only for near dates
+    last_fetched = {job: NOW - timedelta(days=2) for job in near + far}
+
+    planner = RefreshPlanner(conn, budget=3, window_days=7)
+    planned = planner.plan(near + far, last_fetched, NOW)
+
+    # the near dates take one request, two windows of far dates fit
+    assert set(near) <= set(planned)
+    assert len(planned) == 7 + 14
+    assert planner.requests(planned) == 3
+
+    planner = RefreshPlanner(conn, budget=0, window_days=7)
+    assert planner.plan(near + far, last_fetched, NOW) == near
@@ -0,0 +1,18 @@
+import pytest
+
+import db
+import replay
+import synthetic
+
+
+def test_replay_refuses_prices_it_did_not_write(tmp_path):
+    conn = db.connect_db(str(tmp_path / "flights.db"))
+    conn_raw = db.connect_db_raw(str(tmp_path / "raw_data.db"))
+    synthetic.populate(conn, 100, horizon_days=30, flights_per_day=1)
+
+    with pytest.raises(ValueError):
+        replay.replay(conn, conn_raw, workers=1, report=None)
+
+    replay.reset_derived_tables(conn)
+    assert replay.replay(conn, conn_raw, workers=1, report=None)[:2] \
+        == (0, 0)
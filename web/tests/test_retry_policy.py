@@ -0,0 +1,88 @@
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import httpx
+import pytest
+
+from retry_policy import (CircuitBreaker, CircuitOpenError, RetryableStatus,
+                          check_response, retry_after, retrying)
+
+
+URL = "http://api.test/farfnd/v4/oneWayFares"
+
+
+def response(status, **headers):
+    return httpx.Response(status, headers=headers,
+                          request=httpx.Request("GET", URL))
+
+
+def test_retry_after_seconds_and_dates():
+    assert retry_after(response(429)) is None
+    assert retry_after(response(429, **{"Retry-After": "7"})) == 7.0
+    assert retry_after(response(429, **{"Retry-After": "soon"})) is None
+
+    when = datetime.now(timezone.utc) + timedelta(seconds=30)
+    seconds = retry_after(response(503, **{"Retry-After": format_datetime(
+        when, usegmt=True)}))
+    assert 25 < seconds <= 30
+
+
+def test_only_429_and_5xx_are_retried():
+    calls = []
+
+    def call(status):
+        calls.append(status)
+        check_response(response(status, **{"Retry-After": "0"}))
+
+    for status, error in [(503, RetryableStatus),
+                          (404, httpx.HTTPStatusError)]:
+        calls.clear()
+        with pytest.raises(error):
+            for attempt in retrying(max_attempts=3, sleep=lambda _: None):
+                with attempt:
+                    call(status)
+        assert len(calls) == (3 if status == 503 else 1)
+
+
+def fail(breaker, status=503):
+    with pytest.raises(RetryableStatus):
+        with breaker.guard():
+            raise RetryableStatus(status, URL)
+
+
+def test_circuit_opens_and_a_trial_closes_it():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.05)
+    for _ in range(2):
+        fail(breaker)
+    # a 429 is an answer, it does not count towards the threshold
+    fail(breaker, 429)
+    assert breaker.state == "closed"
+
+    for _ in range(3):
+        fail(breaker)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert 0 < breaker.retry_in() <= 0.05
+
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    breaker.before_call()
+    # only one trial call at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.down_since is None
+
+
+def test_failed_trial_opens_the_circuit_again():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    fail(breaker)
+    down_since = breaker.down_since
+    time.sleep(0.06)
+
+    fail(breaker)
+    assert breaker.state == "open"
+    assert breaker.down_since == down_since
@@ -0,0 +1,107 @@
+import json
+import time
+import sqlite3
+import threading
+
+import httpx
+import pytest
+
+import run_metrics
+from run_metrics import Notifier, RunMetrics, recent_runs, report_run
+
+
+class Outbox:
+    # stands in for Notifier, keeps the messages
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message, title=None, tags=None):
+        self.sent.append((message, title, tags))
+
+
+def finished_run(latencies, error=None, jobs=10):
+    metrics = RunMetrics()
+    metrics.count("jobs", jobs)
+    for seconds in latencies:
+        metrics.record_request(seconds, 200)
+    metrics.record_request(0.3, 503)
+    metrics.count("retries")
+    with metrics.stage("crawl"):
+        pass
+    metrics.add_writer_stats({"seconds": 0.5, "price_rows": 40,
+                              "raw_rows": 10, "raw_bytes": 2048,
+                              "fares_changed": 3})
+    metrics.finish(error)
+    return metrics
+
+
+def test_latency_percentiles_and_histogram():
+    metrics = finished_run([0.01 * n for n in range(1, 101)])
+
+    # the 503 of finished_run took 0.3 s as well
+    assert metrics.percentile(0.5) == pytest.approx(0.5)
+    assert metrics.percentile(0.95) == pytest.approx(0.95)
+    histogram = metrics.histogram()
+    assert sum(histogram.values()) == len(metrics.latencies) == 101
+    assert histogram["<=25ms"] == 2
+    assert histogram[">10000ms"] == 0
+
+
+def test_report_run_stores_the_row_and_notifies():
+    conn = sqlite3.connect(":memory:")
+    outbox = Outbox()
+
+    report_run(conn, finished_run([0.1, 0.2], jobs=10), outbox)
+    report_run(conn, finished_run([0.1], ValueError("boom"), jobs=20),
+               outbox)
+
+    failed, successful = recent_runs(conn)
+    assert successful["status"] == "successful"
+    assert successful["requests"] == 3
+    assert successful["request_errors"] == 1
+    assert successful["retries"] == 1
+    assert successful["rows_inserted"] == 40
+    assert successful["db_write_seconds"] == 0.5
+    assert json.loads(successful["details"])["counters"]["fares_changed"] \
+        == 3
+    assert failed["error"] == "ValueError: boom"
+
+    (first, title, tags), (second, failed_title, failed_tags) = outbox.sent
+    assert title == "Tracker successful"
+    assert "previous run" not in first
+    assert failed_title == "Tracker failed" and failed_tags == ["warning"]
+    assert "previous run" in second and "for 10 jobs" in second
+    assert "ValueError: boom" in second
+
+
+def test_notifier_does_not_wait_for_ntfy(monkeypatch):
+    release = threading.Event()
+    posted = []
+
+    def slow_post(url, content, headers, timeout):
+        release.wait(5)
+        posted.append((content, headers))
+
+    monkeypatch.setattr(run_metrics.httpx, "post", slow_post)
+    notifier = Notifier("http://ntfy.test/topic", timeout=0.1)
+
+    start = time.monotonic()
+    notifier.send("done", title="Tracker successful", tags=["a", "b"])
+    notifier.close()
+    assert time.monotonic() - start < 1
+
+    release.set()
+    notifier._thread.join(5)
+    assert posted == [(b"done", {"Title": "Tracker successful",
+                                 "Tags": "a,b"})]
+
+
+def test_failed_notification_is_not_an_error(monkeypatch, capsys):
+    def unreachable(url, **kwargs):
+        raise httpx.ConnectError("no route")
+
+    monkeypatch.setattr(run_metrics.httpx, "post", unreachable)
+    notifier = Notifier("http://ntfy.test/topic")
+    notifier.send("done")
+    notifier.close()
+    assert "Notification failed" in capsys.readouterr().out
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from scheduler import (MAX_ITEM_ATTEMPTS, Route, Scheduler,
+                       connect_scheduler_db, load_routes)
+
+
+ROUTES = [Route("VLC", "BER", 5, 1.0)]
+START = datetime(2026, 3, 1, 6)
+
+
+def test_failing_item_does_not_hold_back_the_schedule(tmp_path):
+    scheduler = Scheduler(connect_scheduler_db(str(tmp_path / "s.db")))
+    run_id, jobs = scheduler.start_run(ROUTES, START)
+    assert len(jobs) == 5
+    failing = jobs[2]
+
+    for attempt in range(1, MAX_ITEM_ATTEMPTS + 2):
+        # every date but one is fetched, the run fails
+        now = START + timedelta(days=attempt)
+        scheduler.mark_done(run_id, [job for job in jobs if job != failing],
+                            now)
+        run_id, jobs = scheduler.start_run(ROUTES, now + timedelta(hours=1))
+
+        if attempt < MAX_ITEM_ATTEMPTS:
+            # the open item goes first, the new due dates follow
+            assert jobs[0] == failing
+            assert scheduler.given_up == []
+        else:
+            assert failing not in jobs
+            assert scheduler.given_up == [failing]
+            break
+        assert len(jobs) > 1
+        assert scheduler.open_run() == run_id
+
+
+def test_finished_run_starts_without_open_items(tmp_path):
+    scheduler = Scheduler(connect_scheduler_db(str(tmp_path / "s.db")))
+    run_id, jobs = scheduler.start_run(ROUTES, START)
+    scheduler.mark_done(run_id, jobs, START)
+    scheduler.finish_run(run_id, START)
+
+    # dates within 14 days are due on every run
+    next_id, jobs = scheduler.start_run(ROUTES, START + timedelta(hours=1))
+    assert next_id != run_id
+    assert len(jobs) == 5
+    assert scheduler.pending_jobs(run_id) == []
+
+
+@pytest.mark.parametrize("priority", ["0", "-1", ".nan"])
+def test_routes_need_a_positive_priority(tmp_path, priority):
+    path = tmp_path / "routes.yaml"
+    path.write_text(f"""
+routes:
+  - origin: vlc
+    destination: ber
+  - origin: VLC
+    destination: STN
+    priority: {priority}
+""")
+    with pytest.raises(ValueError, match="VLC-STN"):
+        load_routes(str(path))
+
+    path.write_text(path.read_text().replace(priority, "2.5"))
+    assert load_routes(str(path)) == [Route("VLC", "BER", 250, 1.0),
+                                      Route("VLC", "STN", 250, 2.5)]
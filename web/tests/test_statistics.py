@@ -0,0 +1,82 @@
+import shutil
+from datetime import timedelta
+
+import pytest
+
+import db
+import synthetic
+import app_utilities
+
+
+WINDOWS = [
+    {},
+    {"origin": "VLC"},
+    {"origin": "BER", "destination": "VLC", "date_from": "2025-01-20"},
+    {"query_from": "2025-01-02", "query_to": "2025-01-02"},
+    {"query_from": "2025-01-05"},
+    {"query_to": "2025-01-03"},
+    {"origin": "MAD", "query_from": "2025-01-03", "query_to": "2025-01-06",
+     "date_to": "2025-02-01"},
+]
+
+
+@pytest.fixture
+def rows_db(tmp_path):
+    # one query per day, an interval has one observation on each day
+    path = str(tmp_path / "rows.db")
+    conn = db.connect_db(path)
+    synthetic.populate(conn, 3000, interval=timedelta(days=1),
+                       horizon_days=40, flights_per_day=2)
+    conn.close()
+    return path
+
+
+@pytest.mark.parametrize("window", WINDOWS)
+def test_converted_intervals_match_rows(tmp_path, rows_db, statistics,
+                                        window):
+    path = str(tmp_path / "intervals.db")
+    shutil.copy(rows_db, path)
+    conn = db.connect_db(path)
+    converted, intervals = db.convert_prices_to_intervals(conn)
+    conn.close()
+    assert converted == 3000 and intervals < converted
+
+    expected = statistics(rows_db, **window)
+    assert expected["total_prices"] > 0
+    assert statistics(path, **window) == pytest.approx(expected)
+
+
+def test_interval_storage_matches_rows(tmp_path, monkeypatch, rows_db,
+                                       statistics):
+    monkeypatch.setattr(db, "PRICE_STORAGE", db.PRICE_STORAGE_INTERVALS)
+    path = str(tmp_path / "intervals.db")
+    conn = db.connect_db(path)
+    synthetic.populate(conn, 3000, interval=timedelta(days=1),
+                       horizon_days=40, flights_per_day=2)
+    assert conn.execute("SELECT COUNT(*) FROM prices_compact").fetchone() \
+        == (0,)
+    conn.close()
+
+    for window in WINDOWS:
+        assert statistics(path, **window) \
+            == pytest.approx(statistics(rows_db, **window))
+
+
+def test_last_entries_read_intervals(tmp_path, monkeypatch, rows_db):
+    monkeypatch.setattr(app_utilities, "DB_PATH", rows_db)
+    _, rows = app_utilities.fetch_last_entries(limit=10_000)
+    latest = rows[0]["query_date"]
+    last_run = [row for row in rows if row["query_date"] == latest]
+
+    monkeypatch.setattr(db, "PRICE_STORAGE", db.PRICE_STORAGE_INTERVALS)
+    path = str(tmp_path / "intervals.db")
+    conn = db.connect_db(path)
+    synthetic.populate(conn, 3000, interval=timedelta(days=1),
+                       horizon_days=40, flights_per_day=2)
+    conn.close()
+    monkeypatch.setattr(app_utilities, "DB_PATH", path)
+    _, intervals = app_utilities.fetch_last_entries(limit=15)
+
+    # the latest observation of an interval is the one of the last run
+    assert len(intervals) == 15
+    assert all(entry in last_run for entry in intervals)
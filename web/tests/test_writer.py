@@ -0,0 +1,91 @@
+from datetime import datetime
+
+import pytest
+
+import db
+import synthetic
+from tracker_utilitis import parse_response
+
+
+QUERY_TIME = datetime(2026, 2, 20, 7, 30)
+
+
+@pytest.fixture
+def writer(tmp_path):
+    done = []
+    writer = db.BufferedWriter(db.connect_db(str(tmp_path / "flights.db")),
+                               db.connect_db_raw(str(tmp_path / "raw.db")),
+                               max_rows=10_000, max_seconds=3600,
+                               on_flush=done.extend)
+    writer.done = done
+    return writer
+
+
+def buffer_responses(writer, n):
+    for number, (origin, destination, day, data) in enumerate(
+            synthetic.payloads(n, query_time=QUERY_TIME)):
+        writer.add_raw(data, origin, destination, day, QUERY_TIME)
+        writer.add_rows(*db.flight_rows(
+            parse_response(data, QUERY_TIME.date()), QUERY_TIME))
+        writer.add_done(number)
+
+
+def count(conn, table):
+    return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_failed_flights_insert_keeps_raw_rows_written_once(writer,
+                                                           monkeypatch):
+    buffer_responses(writer, 5)
+    prices = len(writer._prices)
+    insert = db.insert_flight_rows
+
+    def fail(cursor, flights, prices):
+        insert(cursor, flights, prices)
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(db, "insert_flight_rows", fail)
+    with pytest.raises(RuntimeError):
+        writer.flush()
+
+    # the raw rows are committed, the prices rolled back and still
+    # buffered, no job is marked done
+    assert count(writer.conn_raw, "raw_observations") == 5
+    assert count(writer.conn, "prices_compact") == 0
+    assert len(writer._prices) == prices and not writer._raw
+    assert writer.done == []
+
+    monkeypatch.setattr(db, "insert_flight_rows", insert)
+    writer.flush()
+
+    assert count(writer.conn_raw, "raw_observations") == 5
+    assert count(writer.conn, "prices_compact") == prices
+    assert writer.done == list(range(5))
+    assert writer.stats["raw_rows"] == 5
+    assert writer.stats["price_rows"] == prices
+
+
+def test_commits_follow_the_batches_not_the_rows(writer):
+    writer.max_rows = 25
+    statements = []
+    for conn in [writer.conn, writer.conn_raw]:
+        conn.set_trace_callback(statements.append)
+
+    buffer_responses(writer, 40)
+    writer.flush()
+
+    rows = writer.stats["raw_rows"] + writer.stats["price_rows"]
+    assert writer.stats["raw_rows"] == 40 and rows > 100
+    # one commit per database and flush, a flush per max_rows rows
+    assert 1 < writer.stats["flushes"] <= rows // 25 + 1
+    assert statements.count("COMMIT") == 2 * writer.stats["flushes"]
+    assert count(writer.conn, "prices_compact") \
+        == writer.stats["price_rows"]
+    assert writer.done == list(range(40))
+
+
+def test_connections_are_tuned_for_writes(writer):
+    for conn in [writer.conn, writer.conn_raw]:
+        assert conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+        # NORMAL, fsync at checkpoints only
+        assert conn.execute("PRAGMA synchronous").fetchone() == (1,)
@@ -1,37 +1,136 @@
 import time
-import requests
-from datetime import datetime, timedelta
-
-from db import connect_db, connect_db_raw, save_flights, save_raw_data
-from tracker_utilitis import get_flight, parse_response, check_flight_exists
-
-
-# --- Flight info ---
-origin = "VLC"
-destination = "BER"
-dict = {}
-days_to_track = 250
-
-try:
-    for n in range(days_to_track):
-        # print(F"{n}/{days_to_track}")
-        departure_date = datetime.today() + timedelta(days=n)
-        departure_date_str = departure_date.strftime("%Y-%m-%d")
-
-        data = get_flight(origin, destination, departure_date_str)
-        conn = connect_db_raw()
-        if check_flight_exists(data):
-            save_raw_data(conn, data, origin, destination, departure_date_str)
-            dict.update(parse_response(data))
-        time.sleep(2)
-
-    conn = connect_db()
-    save_flights(conn, dict)
-
-    requests.post("https://ntfy.sh/Krzysztof_is_doing_1234",
-                  data="Tracker susccesful".encode(encoding='utf-8'))
-
-except Exception as e:
-    requests.post("https://ntfy.sh/Krzysztof_is_doing_1234",
-                  data="Tracker unsusccesful".encode(encoding='utf-8'))
-    raise
+import asyncio
+from datetime import datetime
+
+from db import connect_db, connect_db_raw, BufferedWriter
+from tracker_utilitis import check_flight_exists, parse_rows
+from crawler import DEFAULT_WINDOW_DAYS, Crawler, CrawlError
+from scheduler import Scheduler, connect_scheduler_db, load_routes
+from refresh_planner import RefreshPlanner
+from fare_index import FareIndex
+from run_metrics import Notifier, RunMetrics, report_run
+
+
+# --- Crawler settings ---
+concurrency = 8
+requests_per_second = 2
+# consecutive departure days asked for in one request, one date per
+# request by default; larger windows need fewer requests per route
+window_days = DEFAULT_WINDOW_DAYS
+# most api requests a run plans, a request covers up to window_days
+# consecutive dates; dates past their staleness limit count against it
+# and are planned even beyond it
+request_budget = 100
+# responses parsed together, at least every BufferedWriter.max_seconds
+parse_batch = 64
+
+
+async def run(metrics):
+    with metrics.stage("plan"):
+        planner = RefreshPlanner(connect_db(), budget=request_budget,
+                                 window_days=window_days)
+        scheduler = Scheduler(connect_scheduler_db(), planner)
+        run_id, jobs = scheduler.start_run(load_routes())
+    metrics.scheduler_run_id = run_id
+    metrics.count("jobs", len(jobs))
+    if scheduler.given_up:
+        metrics.count("jobs_given_up", len(scheduler.given_up))
+
+    # the cheapest fares follow every commit, the run reports how many
+    # flights got a new latest price
+    writer = BufferedWriter(
+        connect_db(),
+        connect_db_raw(),
+        on_flush=lambda done: scheduler.mark_done(run_id, done),
+        fare_index=FareIndex()
+    )
+    crawler = Crawler(concurrency=concurrency, rate=requests_per_second,
+                      window_days=window_days, metrics=metrics)
+    # (job, data, query time) of the responses not parsed yet, data is
+    # None without flights
+    batch = []
+    batch_start = time.monotonic()
+
+    def write_batch():
+        found = [item for item in batch if item[1] is not None]
+        if found:
+            # plain python, about 1 ms per batch, short enough to stay
+            # on the event loop
+            with metrics.stage("parse"):
+                flights, prices = parse_rows(
+                    [data for _, data, _ in found],
+                    [query_time for _, _, query_time in found])
+            for job, data, query_time in found:
+                writer.add_raw(data, job.origin, job.destination,
+                               job.departure_date, query_time)
+            writer.add_rows(flights, prices)
+        for job, _, _ in batch:
+            writer.add_done(job)
+        batch.clear()
+
+    # an item is marked done once its batch is committed, failed and
+    # uncommitted items stay open and the next run tries them first
+    try:
+        with metrics.stage("crawl"):
+            async for job, data in crawler.stream(jobs):
+                if not batch:
+                    batch_start = time.monotonic()
+                batch.append((job, data if check_flight_exists(data)
+                              else None, datetime.now()))
+                if len(batch) >= parse_batch or \
+                        time.monotonic() - batch_start >= writer.max_seconds:
+                    write_batch()
+            write_batch()
+    except CrawlError as e:
+        metrics.count("jobs_failed", len(e.errors))
+        write_batch()
+        raise
+    finally:
+        # keep what was fetched before a failure
+        writer.flush()
+        metrics.add_writer_stats(writer.stats)
+
+    scheduler.finish_run(run_id)
+
+    # render the dashboard charts for the new data version once,
+    # a failure here only costs the first page view a render; charts
+    # and columnar pull in pandas and pyarrow, so they load on use
+    try:
+        with metrics.stage("prewarm"):
+            from charts import prewarm
+            prewarm()
+    except Exception as e:
+        print(f"Pre-warming the chart cache failed: {e}")
+
+    # append the new prices to the columnar export for analyses,
+    # the next run picks up where a failed export stopped
+    try:
+        with metrics.stage("export"):
+            from columnar import export_prices
+            export_prices(connect_db())
+    except Exception as e:
+        print(f"Columnar export failed: {e}")
+
+
+def main():
+    metrics = RunMetrics()
+    notifier = Notifier()
+    try:
+        asyncio.run(run(metrics))
+        metrics.finish()
+
+    except BaseException as e:
+        metrics.finish(e)
+        raise
+
+    finally:
+        # the metrics row and the notification never fail the run itself
+        try:
+            report_run(connect_scheduler_db(), metrics, notifier)
+        except Exception as e:
+            print(f"Reporting the run failed: {e}")
+        notifier.close()
+
+
+if __name__ == "__main__":
+    main()
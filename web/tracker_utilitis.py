@@ -1,6 +1,15 @@
-import requests
-import holidays
-from datetime import datetime, date
+import os
+from functools import lru_cache
+from datetime import date, datetime, timedelta
+
+from retry_policy import (CONNECT_TIMEOUT, READ_TIMEOUT, breaker_for,
+                          check_response, retrying)
+
+
+# scheme and host of the fares api, point it at mock_api.py for load tests
+API_BASE_URL = os.environ.get("FLIGHTTRACKER_API_URL",
+                              "https://services-api.ryanair.com").rstrip("/")
+PAGE_LIMIT = 16  # fares per oneWayFares response
 
 
 def check_flight_exists(data):
@@ -11,20 +20,60 @@ def check_flight_exists(data):
     return data.get('total', 0) > 0
 
 
-def parse_response(data):
-    """
-    Extracts all needed flight and price information and returns a dict
-    with a human-readable unique flight_id as key.
+@lru_cache(maxsize=None)
+def holiday_dates(year):
+    '''
+    German public holidays of a year, the calendar is built once per year
+    '''
+    import holidays
 
-    Example flight_id:
-    FR642_20260325T0600_VLC_STN
-    """
+    return frozenset(holidays.DE(years=year).keys())
 
-    # Handle case where no fares are returned
-    if "fares" not in data or not data["fares"]:
-        return None
 
-    fare = data["fares"][0]  # assuming one flight
+def make_flight_id(flight_number, departure, origin_iata, arrival_iata):
+    # create a human-readable unique ID
+    departure_safe = departure.replace(":", "").replace("-", "") \
+        if departure else "unknown"
+    return f"{flight_number}_{departure_safe}_{origin_iata}_{arrival_iata}"
+
+
+# fields of a fare in the order _flatten_fare returns them
+FARE_COLUMNS = [
+    "flight_number",
+
+    "departureAirport_countryName",
+    "departureAirport_cityName",
+    "departureAirport_iataCode",
+    "departureAirport_macCode",
+    "departureAirport_seoName",
+
+    "arrivalAirport_countryName",
+    "arrivalAirport_cityName",
+    "arrivalAirport_iataCode",
+    "arrivalAirport_macCode",
+    "arrivalAirport_seoName",
+
+    "departureDate",
+    "arrivalDate",
+
+    "price",
+    "currencyCode",
+    "currencySymbol",
+]
+
+# calendar columns of a departure, see departure_features
+DEPARTURE_COLUMNS = [
+    "departure_time_slot",
+    "departure_dow",
+    "is_weekend",
+    "week_of_year",
+    "month",
+    "year",
+    "is_holiday",
+]
+
+
+def _flatten_fare(fare):
     outbound = fare.get("outbound", {})
 
     departure_airport = outbound.get("departureAirport", {})
@@ -33,95 +82,204 @@ def parse_response(data):
     departure_city = departure_airport.get("city", {})
     arrival_city = arrival_airport.get("city", {})
 
-    flight_number = outbound.get("flightNumber")
-    departure = outbound.get("departureDate")
-    arrival = outbound.get("arrivalDate")
+    return (
+        outbound.get("flightNumber"),
 
-    origin_iata = departure_airport.get("iataCode")
-    arrival_iata = arrival_airport.get("iataCode")
+        departure_airport.get("countryName"),
+        departure_city.get("name"),
+        departure_airport.get("iataCode"),
+        departure_city.get("macCode"),
+        departure_airport.get("seoName"),
 
-    price_value = price_info.get("value")
-    currency_code = price_info.get("currencyCode")
-    currency_symbol = price_info.get("currencySymbol")
+        arrival_airport.get("countryName"),
+        arrival_city.get("name"),
+        arrival_airport.get("iataCode"),
+        arrival_city.get("macCode"),
+        arrival_airport.get("seoName"),
 
-    # create a human-readable unique ID
-    departure_safe = departure.replace(":", "").replace("-", "") \
-        if departure else "unknown"
-    flight_id = f"{flight_number}_{departure_safe} \
-    _{origin_iata}_{arrival_iata}"
+        outbound.get("departureDate"),
+        outbound.get("arrivalDate"),
 
-    departure_dt_obj = datetime.fromisoformat(departure)
-    departure_hour = departure_dt_obj.hour
-    departure_time_slot = (departure_hour - 23) % 24 // 4
+        price_info.get("value"),
+        price_info.get("currencyCode"),
+        price_info.get("currencySymbol"),
+    )
 
-    departure_date = datetime.fromisoformat(departure.replace("Z", "")).date()
-    today = date.today()
-    days_before_departure = (departure_date - today).days
 
+@lru_cache(maxsize=65536)
+def departure_features(departure):
+    '''
+    (departure date, DEPARTURE_COLUMNS values) of a departureDate, the
+    fares of a run share few departure times
+    '''
+    departure_time = datetime.fromisoformat(departure.replace("Z", ""))
+    departure_date = departure_time.date()
     departure_dow = departure_date.weekday()
-    is_weekend = 1 if departure_dow >= 5 else 0
-    week_of_year = departure_date.isocalendar()[1]
-    month = departure_date.month
-    year = departure_date.year
+    return departure_date, (
+        (departure_time.hour - 23) % 24 // 4,
+        departure_dow,
+        1 if departure_dow >= 5 else 0,
+        departure_date.isocalendar()[1],
+        departure_date.month,
+        departure_date.year,
+        1 if departure_date in holiday_dates(departure_date.year) else 0,
+    )
 
-    de_holidays = holidays.DE(years=year)
-    is_holiday = 1 if departure_date in de_holidays else 0
 
-    return {
-        flight_id: {
-            # ---- flights table ----
-            "flight_number": flight_number,
-
-            "departureAirport_countryName": departure_airport.get("countryName"),
-            "departureAirport_cityName": departure_city.get("name"),
-            "departureAirport_iataCode": departure_airport.get("iataCode"),
-            "departureAirport_macCode": departure_city.get("macCode"),
-            "departureAirport_seoName": departure_airport.get("seoName"),
-
-            "arrivalAirport_countryName": arrival_airport.get("countryName"),
-            "arrivalAirport_cityName": arrival_city.get("name"),
-            "arrivalAirport_iataCode": arrival_airport.get("iataCode"),
-            "arrivalAirport_macCode": arrival_city.get("macCode"),
-            "arrivalAirport_seoName": arrival_airport.get("seoName"),
-
-            "departureDate": departure,
-            "departure_time_slot": departure_time_slot,
-            "arrivalDate": arrival,
-
-            "departure_dow": departure_dow,
-            "is_weekend": is_weekend,
-            "week_of_year": week_of_year,
-            "month": month,
-            "year": year,
-            "is_holiday": is_holiday,
-
-            # ---- prices table ----
-            "price": price_value,
-            "currency": currency_code,
-            "currencyCode": currency_code,
-            "currencySymbol": currency_symbol,
-            "days_before_departure": days_before_departure
-        }
-    }
+def parse_rows(responses, query_times):
+    '''
+    Parses every fare of many API responses straight into (flights rows,
+    prices rows) for db.insert_flight_rows, `query_times` holds the
+    datetime each response was received at. A flight in several
+    responses keeps the row of the last one.
+    '''
+    flights = {}
+    prices = []
+    for data, query_time in zip(responses, query_times):
+        fares = data.get("fares") if data else None
+        if not fares:
+            continue
+        query_date = query_time.isoformat()
+        query_day = query_time.date()
+        query_dow = query_day.weekday()
+        query_time_slot = (query_time.hour - 23) % 24 // 4
+        for fare in fares:
+            fare = _flatten_fare(fare)
+            departure = fare[11]
+            if departure is None:
+                continue
+            departure_date, features = departure_features(departure)
+            flight_id = make_flight_id(fare[0], departure, fare[3], fare[8])
+            flights[flight_id] = (flight_id, *fare[:12], features[0],
+                                  fare[12], *features[1:])
+            prices.append((flight_id, query_date, *fare[13:],
+                           (departure_date - query_day).days,
+                           query_dow, query_time_slot))
+    return list(flights.values()), prices
+
 
+def parse_response(data, today=None):
+    """
+    Extracts all needed flight and price information of every fare and
+    returns a dict with a human-readable unique flight_id as key.
+    parse_rows is the faster way for many responses.
+
+    Example flight_id:
+    FR642_20260325T0600_VLC_STN
+    """
+
+    # Handle case where no fares are returned
+    if "fares" not in data or not data["fares"]:
+        return None
 
-def get_flight(origin, destination, departure_date):
+    today = today or date.today()
+    flights = {}
+    for fare in data["fares"]:
+        info = dict(zip(FARE_COLUMNS, _flatten_fare(fare)))
+        departure = info["departureDate"]
+        if departure is None:
+            continue
+        departure_date, features = departure_features(departure)
+        info.update(zip(DEPARTURE_COLUMNS, features))
+        info["days_before_departure"] = (departure_date - today).days
+        info["currency"] = info["currencyCode"]
+        flight_id = make_flight_id(info["flight_number"], departure,
+                                   info["departureAirport_iataCode"],
+                                   info["arrivalAirport_iataCode"])
+        flights[flight_id] = info
+    return flights
+
+
+def build_flight_url(origin, destination, departure_date, base_url=None,
+                     date_to=None, offset=0, limit=PAGE_LIMIT):
     '''
-    calls api gets date, origin, destination
+    builds the oneWayFares url for the departure dates from departure_date
+    to date_to, a single day by default
     '''
 
-    url = (
-        f"https://services-api.ryanair.com/farfnd/3/oneWayFares?"
+    return (
+        f"{base_url or API_BASE_URL}/farfnd/3/oneWayFares?"
         f"&departureAirportIataCode={origin}"
         f"&arrivalAirportIataCode={destination}"
         f"&language=en"
-        f"&limit=16"
+        f"&limit={limit}"
         f"&market=en-gb"
-        f"&offset=0"
+        f"&offset={offset}"
         f"&outboundDepartureDateFrom={departure_date}"
-        f"&outboundDepartureDateTo={departure_date}"
+        f"&outboundDepartureDateTo={date_to or departure_date}"
     )
 
-    response = requests.get(url)
-    data = response.json()
-    return data
+
+def next_offset(data, offset):
+    '''
+    offset of the next page of a oneWayFares response, None after the last
+    '''
+    size = len(data.get("fares") or [])
+    if size and offset + size < (data.get("total") or 0):
+        return offset + size
+    return None
+
+
+def split_by_departure_date(pages, dates):
+    '''
+    Splits the pages of a multi-day oneWayFares response into one response
+    per departure date, shaped like the response for that single day.
+    Returns {date: data} with an entry for every date in `dates`.
+    '''
+    fares = {day: [] for day in dates}
+    for page in pages:
+        for fare in page.get("fares") or []:
+            day = fare["outbound"]["departureDate"][:10]
+            if day in fares:
+                fares[day].append(fare)
+
+    return {
+        day: {**pages[0], "fares": day_fares, "nextPage": None,
+              "size": len(day_fares), "total": len(day_fares)}
+        for day, day_fares in fares.items()
+    }
+
+
+def _get_json(url):
+    import requests
+
+    breaker = breaker_for(url)
+
+    for attempt in retrying():
+        with attempt, breaker.guard():
+            response = requests.get(url, timeout=(CONNECT_TIMEOUT,
+                                                  READ_TIMEOUT))
+            check_response(response)
+    return response.json()
+
+
+def get_flight(origin, destination, departure_date, base_url=None):
+    '''
+    calls api gets date, origin, destination. Timeouts, 429s and 5xx
+    are retried with backoff, see retry_policy
+    '''
+
+    return _get_json(build_flight_url(origin, destination, departure_date,
+                                      base_url))
+
+
+def get_flight_range(origin, destination, date_from, date_to,
+                     base_url=None, limit=PAGE_LIMIT):
+    '''
+    calls api for all departure dates from date_from to date_to, one call
+    per page of `limit` fares. Returns {date: data} for every date, as
+    get_flight would have returned it
+    '''
+
+    pages = []
+    offset = 0
+    while offset is not None:
+        data = _get_json(build_flight_url(origin, destination, date_from,
+                                          base_url, date_to, offset, limit))
+        pages.append(data)
+        offset = next_offset(data, offset)
+
+    first = date.fromisoformat(date_from)
+    days = (date.fromisoformat(date_to) - first).days + 1
+    return split_by_departure_date(
+        pages, [(first + timedelta(n)).isoformat() for n in range(days)])